@@ -1,27 +1,74 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
 from typing import NamedTuple
-import random
 
+import numpy as np
+
+from AgentPopulation import AgentPopulation, Column, ModulationColumn, StateColumn
 from Battery import Battery
-from State import Normal, get_state_randomly
+from RandomStreams import RandomStreams
+from Simulation import Registry
+import CONSTANTS
+from State import Normal, STATE_NAMES, cumulative_transitions, next_state_code
+
+
+class LinkDetails(NamedTuple):
+    energy: int
+    price: int
 
 
 class Agent(ABC):
     
     BATTERY_LIMIT = 0
-    _all_agents:Agent = []
-
-    def __init__(self, _id:int, init_money:int, load:int, current_energy:int, max_capacity:int):
+    KIND = None
+    MODE = AgentPopulation.BUYING
+    _all_agents: list[Agent] = Registry("agents")
+
+    _id = Column("id")
+    _INIT_MONEY = Column("init_money")
+    _current_money = Column("money", tracked=True)
+    _load = Column("load", tracked=True)
+    tolerance = Column("tolerance")
+    _state = StateColumn("state")
+    _state_code = Column("state")
+    _modulation_factor = ModulationColumn("state")
+
+    def __init__(self, _id:int, init_money:int, load:int, current_energy:int, max_capacity:int, population:AgentPopulation=None):
+        self._pool = AgentPopulation.default() if population is None else population
+        self._index = self._pool.allocate()
+        self._pool.kind[self._index] = self.KIND
+        self._pool.mode[self._index] = self.MODE
         self._id = _id
         self._INIT_MONEY = init_money
         self._current_money = init_money
         self._load = load
-        self._battery = Battery(current_energy, max_capacity)
+        self._battery = Battery(current_energy, max_capacity, self._pool, self._index)
         self.tolerance = 0.1
         self._state = Normal()
         self._all_agents.append(self)
 
+    @classmethod
+    def from_rows(cls, population: AgentPopulation, rows) -> list[Agent]:
+        """
+        Creates agents viewing rows of a population whose attributes are already filled in, e.g. by a
+        PopulationGenerator, and registers them like the constructor does
+
+        Returns: The new agents
+        """
+        agents = []
+        for index in np.asarray(rows).tolist():
+            agent = cls.__new__(cls)
+            agent._pool = population
+            agent._index = index
+            agent._battery = Battery.from_row(population, index)
+            agents.append(agent)
+        cls._register(agents)
+        return agents
+
+    @classmethod
+    def _register(cls, agents: list[Agent]) -> None:
+        Agent._all_agents.extend(agents)
+
     @property
     def monery_earned(self) -> int:
         """Returns: The amount of money earned by the agent"""
@@ -44,12 +91,16 @@ class Agent(ABC):
 
     @property
     def demand(self) -> float:
-        """Returns: The demand of the agent"""
-        return self._load - self._battery.current_capacity
+        """Returns: The demand of the agent, see Battery.demand"""
+        return self._battery.demand(self._load)
     
     def consume_energy(self) -> None:
         """Consumes energy from the battery"""
-        self._battery.current_capacity -= self._load
+        self._battery.remove_charge(self._load)
+        self._energy_changed()
+
+    def _energy_changed(self) -> None:
+        """Called whenever the energy stored by the agent changes"""
 
     @classmethod
     def set_battery_limit(cls,limit:int) -> None:
@@ -68,9 +119,16 @@ class Agent(ABC):
     def in_price_range(self, price: float) -> bool:
         """Just a placeholder"""
 
+    def _uniform(self, stream: str, low: float, high: float) -> float:
+        """Returns: The next number of the given random stream of the agent, uniform between low and high"""
+        counters = self._pool.draw_counters(stream)
+        counter = counters.item(self._index)
+        counters[self._index] = counter + 1
+        return RandomStreams.default().uniform_one(stream, self._id, counter, low, high)
+
     def modulate_tolerance(self) -> None:
         """Modulates the tolerance of the agent"""
-        self.tolerance *= random.uniform(0.9, 1.1)
+        self.tolerance *= self._uniform("tolerance", 0.9, 1.1)
 
     @property
     def id(self) -> int:
@@ -85,7 +143,7 @@ class Agent(ABC):
     @property
     def state(self) -> str:
         """Returns: The state of the agent"""
-        return self._state.name
+        return STATE_NAMES[self._state_code]
 
     @property
     @abstractmethod
@@ -96,19 +154,25 @@ class Agent(ABC):
     def approve_for_business(self, agent:Agent) -> bool:
         """Returns: True if the agent is approved for business, False otherwise"""
 
-    def reset_state(self) -> None:
-        """Resets the state of the agent"""
-        self._state = get_state_randomly()
+    def reset_state(self, transitions:tuple[tuple[float, ...], ...]=None) -> None:
+        """Moves the agent to a new state drawn from the Markov chain of the transitions, see reset_states"""
+        transitions = CONSTANTS.STATE_TRANSITIONS if transitions is None else transitions
+        draw = self._uniform("state", 0.0, 1.0)
+        self._state_code = next_state_code(self._state_code, draw, cumulative_transitions(transitions))
 
     @staticmethod
-    def reset_states(agents:list[Agent]=None) -> None:
-        """Resets the states of the given agents"""
-        if agents is not None:
-            for agent in agents:
-                agent.reset_state()
-        else:
-            for agent in Agent._all_agents:
-                agent.reset_state()
+    def reset_states(agents:list[Agent]=None, transitions:tuple[tuple[float, ...], ...]=None) -> None:
+        """
+        Moves the given agents to new states, with one draw per population
+
+        Parameters:
+        agents: the agents to move, defaults to all agents
+        transitions: row i holds the probabilities of moving from STATES[i] to every state, defaults to
+        CONSTANTS.STATE_TRANSITIONS
+        """
+        agents = Agent._all_agents if agents is None else agents
+        for population, rows in AgentPopulation.group(agents).items():
+            population.reset_states(rows, transitions)
 
     @staticmethod
     def check_match_for_business(agent1:Agent, agent2:Agent) -> bool:
@@ -130,9 +194,8 @@ class Agent(ABC):
             else:
                 transaction_energy = min(agent2.demand, agent1.energy_to_sell, agent2.money // agent1.selling_price)
                 selling_price = agent1.selling_price
-            
-            Link_details = NamedTuple('link_details', [('energy', int), ('price', int)])
-            return Link_details(energy=transaction_energy, price=selling_price)
+
+            return LinkDetails(energy=transaction_energy, price=selling_price)
 
     def do_business_with_details(self, price:float, energy:float) -> None:
         """
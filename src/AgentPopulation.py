@@ -0,0 +1,445 @@
+"""
+This file contains a struct-of-arrays store for the attributes of a population of agents.
+
+Classes:
+    AgentPopulation: Holds money, load, battery, prices, tolerance, mode and state of many agents in NumPy arrays.
+    Column: Descriptor that lets an agent object read and write its own row of a population.
+"""
+
+from __future__ import annotations
+from typing import Union, Iterable
+import numpy as np
+
+import CONSTANTS
+from BatteryFleet import BatteryFleet
+from RandomStreams import STREAMS, RandomStreams
+from Simulation import Simulation
+from State import State, Normal, STATES, MODULATION_FACTORS, cumulative_transitions, state_code
+
+Rows = Union[slice, np.ndarray, None]
+
+_MODULATION_FACTORS = np.array(MODULATION_FACTORS, dtype=np.float64)
+
+
+class Column:
+    """
+    Descriptor exposing one column of an AgentPopulation as an attribute of the object viewing one of its rows.
+    The owning object needs a `_pool` and an `_index` attribute.
+
+    Parameters:
+    name: name of the column
+    tracked: when True writes are reported to the watchers of the population
+    """
+
+    def __init__(self, name: str, tracked: bool = False) -> None:
+        self._name = name
+        self._tracked = tracked
+
+    def __get__(self, view, owner=None):
+        if view is None:
+            return self
+        return view._pool._data[self._name].item(view._index)
+
+    def __set__(self, view, value) -> None:
+        self._store(view, value)
+
+    def _store(self, view, value) -> None:
+        pool = view._pool
+        pool._data[self._name][view._index] = value
+        if self._tracked and pool._watchers:
+            for changed in pool._watchers:
+                changed.add(view._index)
+
+
+class ModeColumn(Column):
+    """
+    Column holding the trading mode of a prosumer. Exposed as True for selling, False for buying and None for neither.
+    """
+
+    _TO_MODE = {0: False, 1: True, -1: None}
+    _FROM_MODE = {False: 0, True: 1, None: -1}
+
+    def __get__(self, view, owner=None):
+        if view is None:
+            return self
+        return ModeColumn._TO_MODE[view._pool._data[self._name].item(view._index)]
+
+    def __set__(self, view, value) -> None:
+        self._store(view, ModeColumn._FROM_MODE[value])
+
+
+class StateColumn(Column):
+    """
+    Column holding the state code of an agent. Exposed as the matching State singleton.
+    """
+
+    _INSTANCES = tuple(state() for state in STATES)
+
+    def __get__(self, view, owner=None):
+        if view is None:
+            return self
+        return StateColumn._INSTANCES[view._pool._data[self._name].item(view._index)]
+
+    def __set__(self, view, value: State) -> None:
+        view._pool._data[self._name][view._index] = state_code(value)
+
+
+class ModulationColumn(Column):
+    """
+    Read-only column exposing the modulation factor of the state of an agent, looked up in a table by state code.
+    """
+
+    def __get__(self, view, owner=None):
+        if view is None:
+            return self
+        return MODULATION_FACTORS[view._pool._data[self._name].item(view._index)]
+
+    def __set__(self, view, value) -> None:
+        raise AttributeError("The modulation factor follows the state of the agent")
+
+
+class AgentPopulation:
+    """
+    Struct-of-arrays store holding the attributes of a population of agents in contiguous NumPy arrays.
+
+    Agent objects are thin views over one row of a population. The bulk operations below act on many rows at once,
+    either all of them or the rows selected by an index array, a boolean mask or a slice.
+    """
+
+    BUYER, SELLER, PROSUMER = 0, 1, 2
+    BUYING, SELLING, IDLE = 0, 1, -1
+
+    _COLUMNS = {
+        "id": np.int64,
+        "kind": np.int8,
+        "mode": np.int8,
+        "state": np.int8,
+        "money": np.float64,
+        "init_money": np.float64,
+        "load": np.float64,
+        "energy_generation": np.float64,
+        "charge": np.float64,
+        "capacity": np.float64,
+        "buying_price": np.float64,
+        "selling_price": np.float64,
+        "tolerance": np.float64,
+        "energy_bought": np.float64,
+        "energy_sold": np.float64,
+        "feeder": np.int32,
+        "charge_efficiency": np.float64,
+        "discharge_efficiency": np.float64,
+        "charge_rate": np.float64,          # most energy a battery takes in per round
+        "discharge_rate": np.float64,       # most energy a battery gives out per round
+        "charged": np.float64,              # energy taken in, given out, spilled and short since the round started
+        "discharged": np.float64,
+        "spill": np.float64,
+        "shortfall": np.float64,
+        "grid_imported": np.float64,        # energy bought from and sold to the grid, and what it cost, over the run
+        "grid_exported": np.float64,
+        "grid_cost": np.float64,
+        # draws made from every random stream, counted separately so that every stream of an agent is independent
+        **{f"{stream}_draws": np.int64 for stream in STREAMS},
+    }
+
+    def __init__(self, allocated: int = 1024, rng: np.random.Generator = None) -> None:
+        self._size = 0
+        self._data = {name: np.zeros(max(allocated, 1), dtype) for name, dtype in AgentPopulation._COLUMNS.items()}
+        self.rng = np.random.default_rng() if rng is None else rng
+        self._watchers: list[set[int]] = []
+
+    @classmethod
+    def default(cls) -> AgentPopulation:
+        """Returns: The population agents of the current simulation are stored in when none is given to them"""
+        simulation = Simulation.current()
+        if simulation.population is None:
+            simulation.population = cls()
+        return simulation.population
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        data = self.__dict__.get("_data")
+        if data is None or name not in data:
+            raise AttributeError(f"{type(self).__name__} has no attribute {name}")
+        return data[name][:self._size]
+
+    @property
+    def allocated(self) -> int:
+        """Returns: The number of rows that fit in the arrays before they have to grow"""
+        return len(self._data["id"])
+
+    def allocate(self, count: int = 1) -> int:
+        """
+        Adds zeroed rows to the population, growing the arrays geometrically when they are full
+
+        Parameters:
+        count: the number of rows to add
+
+        Returns: The index of the first new row
+        """
+        start = self._size
+        if start + count > self.allocated:
+            new_capacity = max(2 * self.allocated, start + count)
+            for name, column in self._data.items():
+                grown = np.zeros(new_capacity, column.dtype)
+                grown[:start] = column[:start]
+                self._data[name] = grown
+
+        self._size += count
+        self._data["tolerance"][start:self._size] = 0.1
+        for name in ("charge_efficiency", "discharge_efficiency"):
+            self._data[name][start:self._size] = 1.0
+        for name in ("charge_rate", "discharge_rate"):
+            self._data[name][start:self._size] = np.inf
+        self._data["state"][start:self._size] = state_code(Normal())
+        return start
+
+    @classmethod
+    def row_bytes(cls) -> int:
+        """Returns: The number of bytes one row takes in the arrays"""
+        return sum(np.dtype(dtype).itemsize for dtype in cls._COLUMNS.values())
+
+    def add_rows(self, count: int, kind: int, **columns: Union[np.ndarray, float]) -> np.ndarray:
+        """
+        Adds rows for several agents of one kind at once, without creating agent objects for them
+
+        Parameters:
+        count: the number of rows to add
+        kind: BUYER, SELLER or PROSUMER
+        columns: values of the columns of the new rows, by column name. money also sets init_money.
+
+        Returns: The indices of the new rows
+        """
+        start = self.allocate(count)
+        rows = np.arange(start, start + count)
+        self._data["kind"][rows] = kind
+        self._data["mode"][rows] = AgentPopulation.SELLING if kind == AgentPopulation.SELLER else AgentPopulation.BUYING
+        if "money" in columns:
+            self._data["init_money"][rows] = columns["money"]
+        for name, values in columns.items():
+            self._data[name][rows] = values
+        self.update_modes(rows)
+        return rows
+
+    def watch(self) -> set[int]:
+        """
+        Returns: A set that from now on collects the rows whose money, load, battery charge or mode changes.
+        The watcher is expected to empty it whenever it has dealt with the changes.
+        """
+        changed: set[int] = set()
+        self._watchers.append(changed)
+        return changed
+
+    def unwatch(self, changed: set[int]) -> None:
+        """Stops reporting changes to a set returned by watch"""
+        self._watchers = [watcher for watcher in self._watchers if watcher is not changed]
+
+    def _touch(self, rows: Union[slice, np.ndarray]) -> None:
+        if not self._watchers:
+            return
+        if isinstance(rows, slice):
+            rows = np.arange(self._size)[rows]
+        elif rows.dtype == np.bool_:
+            rows = np.flatnonzero(rows)
+        rows = rows.tolist()
+        for changed in self._watchers:
+            changed.update(rows)
+
+    def row(self, index: int) -> dict:
+        """Returns: The values stored in the given row"""
+        return {name: column[index].item() for name, column in self._data.items()}
+
+    def _rows(self, rows: Rows) -> Union[slice, np.ndarray]:
+        return slice(0, self._size) if rows is None else rows
+
+    @property
+    def batteries(self) -> BatteryFleet:
+        """Returns: The batteries of the population, for bulk charging and discharging"""
+        return BatteryFleet(self)
+
+    def demand(self, rows: Rows = None) -> np.ndarray:
+        """
+        Returns: The energy the given rows have to buy to cover their load, see BatteryFleet.demand, negative where the
+        deliverable battery charge exceeds the load
+        """
+        rows = self._rows(rows)
+        return self.batteries.demand(rows, self.load[rows])
+
+    def energy_to_sell(self, rows: Rows = None) -> np.ndarray:
+        """Returns: Deliverable battery charge left over after the load of the given rows, never negative"""
+        rows = self._rows(rows)
+        return np.maximum(self.batteries.deliverable(rows) - self.load[rows], 0)
+
+    def unmet_load(self, rows: Rows = None) -> np.ndarray:
+        """Returns: The load the batteries of the given rows in buying mode can't deliver, 0 for the other rows"""
+        rows = self._rows(rows)
+        short = np.maximum(self.load[rows] - self.batteries.deliverable(rows), 0)
+        return np.where(self.mode[rows] == AgentPopulation.BUYING, short, 0.0)
+
+    def update_modes(self, rows: Rows = None) -> None:
+        """Puts prosumers with more charge than load in selling mode and all others in buying mode"""
+        rows = self._rows(rows)
+        prosumers = self.kind[rows] == AgentPopulation.PROSUMER
+        modes = np.where(self.demand(rows) < 0, AgentPopulation.SELLING, AgentPopulation.BUYING)
+        self.mode[rows] = np.where(prosumers, modes, self.mode[rows])
+        self._touch(rows)
+
+    def eligible_buyers(self, rows: Rows = None) -> np.ndarray:
+        """Returns: Mask of the given rows that have money and need energy while in buying mode"""
+        rows = self._rows(rows)
+        return (self.mode[rows] == AgentPopulation.BUYING) & (self.money[rows] > 0) & (self.demand(rows) > 0)
+
+    def eligible_sellers(self, rows: Rows = None) -> np.ndarray:
+        """Returns: Mask of the given rows that have energy to spare while in selling mode"""
+        rows = self._rows(rows)
+        return (self.mode[rows] == AgentPopulation.SELLING) & (self.demand(rows) < 0)
+
+    def eligible(self, rows: Rows = None) -> np.ndarray:
+        """Returns: Mask of the given rows that can take part in the market"""
+        return self.eligible_buyers(rows) | self.eligible_sellers(rows)
+
+    def modulation_factors(self, rows: Rows = None) -> np.ndarray:
+        """Returns: The modulation factor of the state of the given rows"""
+        return _MODULATION_FACTORS[self.state[self._rows(rows)]]
+
+    def bid_limits(self, rows: Rows = None) -> np.ndarray:
+        """Returns: The highest price per unit the given rows accept to buy at, following Buyer.in_price_range"""
+        rows = self._rows(rows)
+        return (1 + self.tolerance[rows]) * self.buying_price[rows] / self.modulation_factors(rows)
+
+    def ask_limits(self, rows: Rows = None) -> np.ndarray:
+        """Returns: The lowest price per unit the given rows accept to sell at, following Seller.in_price_range"""
+        rows = self._rows(rows)
+        return (self.modulation_factors(rows) - self.tolerance[rows]) * self.selling_price[rows]
+
+    def settle_purchases(self, rows: np.ndarray, energy: np.ndarray, payments: np.ndarray) -> np.ndarray:
+        """
+        Settles the energy bought by the given rows the way Buyer and Prosumer.do_business_with_details do
+
+        Parameters:
+        rows: rows that bought energy, each row at most once
+        energy: energy bought by every row
+        payments: money paid by every row
+
+        Returns: The energy every row spilled, none when no row bought more than its demand
+        """
+        self.energy_bought[rows] += energy
+        spilled = self.batteries.charge(rows, energy)
+        self.money[rows] -= payments
+        self.modulate_buying_price(rows)
+        self.modulate_tolerance(rows)
+        self.update_modes(rows)
+        return spilled
+
+    def settle_sales(self, rows: np.ndarray, energy: np.ndarray, payments: np.ndarray) -> np.ndarray:
+        """
+        Settles the energy sold by the given rows the way Prosumer.do_business_with_details does. Sellers don't
+        settle anything themselves, so like in the other market modes their rows are left as they are.
+
+        Parameters:
+        rows: rows that sold energy, each row at most once
+        energy: energy sold by every row
+        payments: money received by every row
+
+        Returns: The energy every row fell short of, none when no row sold more than its energy_to_sell
+        """
+        prosumers = self.kind[rows] == AgentPopulation.PROSUMER
+        short = np.zeros(len(rows))
+        rows, energy, payments = rows[prosumers], energy[prosumers], payments[prosumers]
+        self.energy_sold[rows] += energy
+        short[prosumers] = self.batteries.discharge(rows, energy)
+        self.money[rows] += payments
+        self.modulate_selling_price(rows)
+        self.modulate_tolerance(rows)
+        self.update_modes(rows)
+        return short
+
+    def generate_energy(self, rows: Rows = None) -> np.ndarray:
+        """
+        Charges the batteries of the given rows with what they generate. Charge that doesn't fit is spilled, and
+        drained to the grid when the round of the batteries ends. The mode of prosumers is updated to match their new
+        charge.
+
+        Returns: The energy each row spilled
+        """
+        rows = self._rows(rows)
+        spill = self.batteries.charge(rows, self.energy_generation[rows])
+        self.update_modes(rows)
+        return spill
+
+    def consume_energy(self, rows: Rows = None) -> np.ndarray:
+        """
+        Consumes the load of the given rows from their batteries and updates the mode of prosumers
+
+        Returns: The load each row's battery couldn't cover
+        """
+        rows = self._rows(rows)
+        short = self.batteries.discharge(rows, self.load[rows])
+        self.update_modes(rows)
+        return short
+
+    def draw_counters(self, stream: str) -> np.ndarray:
+        """Returns: The column counting the draws every row made from the given random stream"""
+        return getattr(self, f"{stream}_draws")
+
+    def draw(self, stream: str, rows: Rows, low: float, high: float) -> np.ndarray:
+        """
+        Draws the next number of the given random stream for every given row, each row at most once
+
+        Returns: The draws, uniform between low and high, the same the agents viewing the rows would draw one by one
+        """
+        rows = self._rows(rows)
+        column = self.draw_counters(stream)
+        counters = column[rows].copy()
+        column[rows] = counters + 1
+        return RandomStreams.default().uniform(stream, self.id[rows], counters, low, high)
+
+    def _modulate(self, column: np.ndarray, rows: Union[slice, np.ndarray], stream: str, low: float,
+                  high: float) -> None:
+        column[rows] *= self.draw(stream, rows, 0.9, 1.1)
+        if low is not None:
+            column[rows] = np.clip(column[rows], low, high)
+
+    def modulate_buying_price(self, rows: Rows = None) -> None:
+        """Modulates the buying price of the given rows by a random amount within the market price limits"""
+        simulation = Simulation.current()
+        self._modulate(self.buying_price, self._rows(rows), "buying_price", simulation.min_price, simulation.max_price)
+
+    def modulate_selling_price(self, rows: Rows = None) -> None:
+        """Modulates the selling price of the given rows by a random amount within the market price limits"""
+        simulation = Simulation.current()
+        self._modulate(self.selling_price, self._rows(rows), "selling_price", simulation.min_price,
+                       simulation.max_price)
+
+    def modulate_tolerance(self, rows: Rows = None) -> None:
+        """Modulates the tolerance of the given rows by a random amount"""
+        self._modulate(self.tolerance, self._rows(rows), "tolerance", None, None)
+
+    def reset_states(self, rows: Rows = None, transitions: tuple[tuple[float, ...], ...] = None) -> None:
+        """
+        Moves the given rows to a new state drawn from the Markov chain of the transitions, like Agent.reset_state
+
+        Parameters:
+        rows: the rows to move, each row at most once
+        transitions: row i holds the probabilities of moving from STATES[i] to every state, defaults to
+        CONSTANTS.STATE_TRANSITIONS
+        """
+        rows = self._rows(rows)
+        transitions = CONSTANTS.STATE_TRANSITIONS if transitions is None else transitions
+        cumulative = np.array(cumulative_transitions(transitions))
+        draws = self.draw("state", rows, 0.0, 1.0)
+        codes = (draws[:, None] >= cumulative[self.state[rows]]).sum(axis=1)
+        self.state[rows] = np.minimum(codes, len(STATES) - 1)
+
+    @staticmethod
+    def group(agents: Iterable) -> dict[AgentPopulation, np.ndarray]:
+        """
+        Groups agent views by the population they live in
+
+        Returns: A dict mapping every population to the row indices of the given agents stored in it
+        """
+        groups: dict[AgentPopulation, list[int]] = {}
+        for agent in agents:
+            groups.setdefault(agent._pool, []).append(agent._index)
+        return {pool: np.asarray(rows, dtype=np.int64) for pool, rows in groups.items()}
@@ -0,0 +1,112 @@
+"""
+This file contains the event-driven bidding of the async market mode.
+
+Every eligible agent of a round is driven by a strategy, a coroutine that decides when to place or cancel the agent's
+order. Strategies run concurrently, at most max_concurrency at a time, until the round deadline, after which the ones
+still running are cancelled. Orders are matched against the book as soon as they arrive, so a slow strategy only delays
+its own agent and never the rest of the round.
+"""
+
+from __future__ import annotations
+from typing import Awaitable, Callable, Union
+import asyncio
+import time
+
+from Agent import Agent
+from OrderBook import OrderBook
+
+
+class RoundContext:
+    """
+    What a strategy sees of the round its agent takes part in.
+
+    Parameters:
+    book: the order book of the round
+    market_round: the current round
+    deadline: time.monotonic() value after which the round stops taking orders
+    on_match: called with (buyer, seller, link details) for every match the book makes
+    """
+
+    def __init__(self, book: OrderBook, market_round: int, deadline: float,
+                 on_match: Callable[[Agent, Agent, tuple], None]) -> None:
+        self.book = book
+        self.market_round = market_round
+        self.deadline = deadline
+        self._on_match = on_match
+
+    @property
+    def time_left(self) -> float:
+        """Returns: The seconds left before the round deadline"""
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def submit(self, agent: Agent) -> bool:
+        """
+        Places or replaces the order of the agent and matches the book right away. Agents still eligible after a
+        match go back into the book.
+
+        Returns: True if an order was placed
+        """
+        if time.monotonic() > self.deadline or not self.book.submit(agent):
+            return False
+        while (match := self.book.best_match()) is not None:
+            buyer, seller, link_details = match
+            self._on_match(buyer, seller, link_details)
+            self.book.submit(buyer)
+            self.book.submit(seller)
+        return True
+
+    def cancel(self, agent: Agent) -> bool:
+        """Returns: True if the agent had an order in the book, which is now taken out"""
+        return self.book.cancel(agent)
+
+
+Strategy = Callable[[Agent, RoundContext], Awaitable[None]]
+
+
+async def passive_strategy(agent: Agent, context: RoundContext) -> None:
+    """Places the agent's order at its current prices as soon as the round starts"""
+    context.submit(agent)
+
+
+def delayed(strategy: Strategy, seconds: Union[float, Callable[[Agent], float]]) -> Strategy:
+    """
+    Returns: A strategy waiting before running the given one, standing for a strategy that takes time to decide,
+    e.g. looking up a forecast or querying a pricing model
+    """
+    async def delayed_strategy(agent: Agent, context: RoundContext) -> None:
+        await asyncio.sleep(seconds(agent) if callable(seconds) else seconds)
+        await strategy(agent, context)
+
+    return delayed_strategy
+
+
+async def run_round(agents: list[Agent], strategy_for: Callable[[Agent], Strategy], context: RoundContext,
+                    max_concurrency: int) -> tuple[int, int]:
+    """
+    Runs the strategies of the given agents until they are all done or the round deadline is reached
+
+    Parameters:
+    agents: the agents taking part in the round
+    strategy_for: gives the strategy of every agent
+    context: the round the strategies act on
+    max_concurrency: the most strategies running at the same time
+
+    Returns: The number of strategies that finished and the number that were cancelled at the deadline
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(agent: Agent) -> None:
+        async with semaphore:
+            await strategy_for(agent)(agent, context)
+
+    tasks = [asyncio.create_task(run(agent)) for agent in agents]
+    if not tasks:
+        return 0, 0
+    done, pending = await asyncio.wait(tasks, timeout=context.time_left)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        if (error := task.exception()) is not None:
+            raise error
+    return len(done), len(pending)
@@ -1,24 +1,92 @@
-from Grid import Grid
+from __future__ import annotations
+from AgentPopulation import AgentPopulation, Column
 
 class Battery:
+    """
+    View over the battery of one agent, stored in a row of an AgentPopulation. Charging and discharging follow
+    BatteryFleet, which does the same for many batteries at once: the charge stays within [0, capacity], what doesn't
+    fit is spilled and drained to the grid when the round of the batteries ends.
+    """
 
-    def __init__(self, current_capacity: int, max_capacity: int):
+    _current_capacity = Column("charge", tracked=True)
+    _max_capacity = Column("capacity")
+    _charge_efficiency = Column("charge_efficiency")
+    _discharge_efficiency = Column("discharge_efficiency")
+    _charge_rate = Column("charge_rate")
+    _discharge_rate = Column("discharge_rate")
+    _charged = Column("charged")
+    _discharged = Column("discharged")
+    _spill = Column("spill")
+    _shortfall = Column("shortfall")
+
+    def __init__(self, current_capacity: int, max_capacity: int, pool: AgentPopulation = None, index: int = None):
+        if pool is None:
+            pool = AgentPopulation(1)
+        self._pool = pool
+        self._index = pool.allocate() if index is None else index
         self._max_capacity = max_capacity
         self._current_capacity = current_capacity
 
-    def add_charge(self, charge_to_add: int) -> None:
-        if self._current_capacity + charge_to_add > self._max_capacity:
-            Grid()(self._current_capacity + charge_to_add - self._max_capacity)
-            self._current_capacity = self._max_capacity
-        else:
-            self._current_capacity += charge_to_add
-    
-    def remove_charge(self, charge_to_remove: int) -> None:
-        if self._current_capacity - charge_to_remove < 0:
-            self._current_capacity = 0
-        else:
-            self._current_capacity -= charge_to_remove
-    
+    @classmethod
+    def from_row(cls, pool: AgentPopulation, index: int) -> Battery:
+        """Returns: A battery viewing a row of a population whose charge and capacity are already filled in"""
+        battery = cls.__new__(cls)
+        battery._pool = pool
+        battery._index = index
+        return battery
+
+    def add_charge(self, charge_to_add: float) -> float:
+        """
+        Charges the battery, spilling what it can't take in
+
+        Returns: The energy spilled
+        """
+        efficiency = self._charge_efficiency
+        room = min(self._max_capacity - self._current_capacity, self._charge_rate - self._charged)
+        stored = min(max(charge_to_add * efficiency, 0), max(room, 0))
+        spilled = charge_to_add - stored / efficiency
+
+        self._current_capacity += stored
+        self._charged += stored
+        self._spill += spilled
+        return spilled
+
+    def remove_charge(self, charge_to_remove: float) -> float:
+        """
+        Discharges the battery as far as it can
+
+        Returns: The energy it fell short of
+        """
+        efficiency = self._discharge_efficiency
+        available = min(self._current_capacity, max(self._discharge_rate - self._discharged, 0))
+        drawn = min(charge_to_remove / efficiency, available)
+        short = max(charge_to_remove - drawn * efficiency, 0)
+
+        self._current_capacity -= drawn
+        self._discharged += drawn
+        self._shortfall += short
+        return short
+
+    @property
+    def deliverable(self) -> float:
+        """
+        Returns: The energy the battery can still deliver in the round, its charge up to what its discharge rate
+        leaves less the discharge losses
+        """
+        return min(self._current_capacity, max(self._discharge_rate - self._discharged, 0)) * self._discharge_efficiency
+
+    def demand(self, load: float) -> float:
+        """
+        Returns: The energy to buy so that what the battery delivers covers the load, counting the charge and discharge
+        losses and limited to what its charge rate still lets it take in during the round. Negative when the battery
+        can deliver more than the load.
+        """
+        short = load - self.deliverable
+        if short <= 0:
+            return short
+        return min(short / (self._charge_efficiency * self._discharge_efficiency),
+                   max(self._charge_rate - self._charged, 0) / self._charge_efficiency)
+
     @property
     def current_capacity(self) -> int:
         return self._current_capacity
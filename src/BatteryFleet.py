@@ -0,0 +1,121 @@
+"""
+This file contains the batteries of a population of agents, charged and discharged in bulk.
+
+The batteries live in the arrays of the AgentPopulation of their agents: the charge and the capacity, the efficiency
+of charging and of discharging, the most energy a battery can take in and give out in a round, and what it took in,
+gave out, spilled and failed to deliver since the round started. Energy that doesn't fit in a battery is spilled and
+energy a battery can't deliver is short, neither ever takes the charge outside of [0, capacity]. The spills of a round
+are handed to the Grid in one sum when the round ends.
+"""
+
+from __future__ import annotations
+from typing import Union
+
+import numpy as np
+
+from Grid import Grid
+
+Energy = Union[np.ndarray, float]
+
+
+class BatteryFleet:
+    """
+    Bulk view over the batteries of a population.
+
+    Parameters:
+    population: the AgentPopulation holding the batteries
+    """
+
+    def __init__(self, population) -> None:
+        self.population = population
+
+    def deliverable(self, rows=None) -> np.ndarray:
+        """
+        Returns: The energy the batteries of the given rows can still deliver in the round, their charge up to what
+        their discharge rate leaves less the discharge losses
+        """
+        population = self.population
+        rows = population._rows(rows)
+        available = np.minimum(population.charge[rows],
+                               np.maximum(population.discharge_rate[rows] - population.discharged[rows], 0))
+        return available * population.discharge_efficiency[rows]
+
+    def demand(self, rows, load: Energy) -> np.ndarray:
+        """
+        Returns: The energy every given row has to buy so that what its battery delivers covers its load, like
+        Battery.demand. Negative where the battery can deliver more than the load.
+        """
+        population = self.population
+        rows = population._rows(rows)
+        short = load - self.deliverable(rows)
+        charge_efficiency = population.charge_efficiency[rows]
+        intake = np.maximum(population.charge_rate[rows] - population.charged[rows], 0) / charge_efficiency
+        needed = short / (charge_efficiency * population.discharge_efficiency[rows])
+        return np.where(short > 0, np.minimum(needed, intake), short)
+
+    def charge(self, rows, energy: Energy) -> np.ndarray:
+        """
+        Puts energy in the batteries of the given rows, each row at most once. What a battery can't take in, because
+        it is full or has reached its charge rate for the round, is spilled.
+
+        Returns: The energy spilled by every row
+        """
+        population = self.population
+        rows = population._rows(rows)
+        efficiency = population.charge_efficiency[rows]
+        room = np.minimum(population.capacity[rows] - population.charge[rows],
+                          population.charge_rate[rows] - population.charged[rows])
+        stored = np.clip(energy * efficiency, 0, np.maximum(room, 0))
+        spilled = energy - stored / efficiency
+
+        population.charge[rows] += stored
+        population.charged[rows] += stored
+        population.spill[rows] += spilled
+        return spilled
+
+    def discharge(self, rows, energy: Energy) -> np.ndarray:
+        """
+        Takes energy out of the batteries of the given rows, each row at most once. What a battery can't deliver,
+        because it is empty or has reached its discharge rate for the round, is short.
+
+        Returns: The energy every row fell short of
+        """
+        population = self.population
+        rows = population._rows(rows)
+        efficiency = population.discharge_efficiency[rows]
+        available = np.minimum(population.charge[rows],
+                               np.maximum(population.discharge_rate[rows] - population.discharged[rows], 0))
+        drawn = np.minimum(energy / efficiency, available)
+        short = np.maximum(energy - drawn * efficiency, 0)
+
+        population.charge[rows] -= drawn
+        population.discharged[rows] += drawn
+        population.shortfall[rows] += short
+        return short
+
+    def apply(self, rows=None, generation: Energy = 0.0, consumption: Energy = 0.0, bought: Energy = 0.0,
+              sold: Energy = 0.0) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Applies energy flows to the batteries of the given rows, what comes in being charged before what goes out is
+        discharged
+
+        Returns: The energy spilled and the energy fallen short of by every row
+        """
+        rows = self.population._rows(rows)
+        return self.charge(rows, generation + bought), self.discharge(rows, consumption + sold)
+
+    def end_round(self, rows=None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Hands what the given rows spilled during the round to the grid in one sum and starts a new round for their
+        charge and discharge rates
+
+        Returns: The energy spilled and the energy fallen short of by every row during the round
+        """
+        population = self.population
+        rows = population._rows(rows)
+        spill, short = population.spill[rows].copy(), population.shortfall[rows].copy()
+        if (total_spill := spill.sum()) > 0:
+            Grid()(total_spill.item())
+        for name in ("spill", "shortfall", "charged", "discharged"):
+            getattr(population, name)[rows] = 0
+        return spill, short
@@ -3,17 +3,23 @@ This python file has an example python class for the functionality of buying
 """
 
 from __future__ import annotations
-import random
+import numpy as np
 from Agent import Agent
-import CONSTANTS
+from AgentPopulation import AgentPopulation, Column
+from Simulation import Registry, Simulation
 
 
 class Buyer(Agent):
 
-    _all_buyers:Buyer = []
+    KIND = AgentPopulation.BUYER
+    MODE = AgentPopulation.BUYING
+    _all_buyers: list[Buyer] = Registry("buyers")
 
-    def __init__(self, _id:int, init_money:int, buying_price:int, load:int, initial_energy:int, max_capacity:int) -> None:
-        super().__init__(_id, init_money, load, initial_energy, max_capacity)
+    _buying_price = Column("buying_price")
+    _energy_bought = Column("energy_bought")
+
+    def __init__(self, _id:int, init_money:int, buying_price:int, load:int, initial_energy:int, max_capacity:int, population:AgentPopulation=None) -> None:
+        super().__init__(_id, init_money, load, initial_energy, max_capacity, population)
         Buyer._all_buyers.append(self)
         self._setup(buying_price)
 
@@ -29,28 +35,32 @@ class Buyer(Agent):
     @property
     def energy_to_buy(self) -> int:
         """Returns: the amount of energy the buyer needs to buy"""
-        return self._load - self._battery.current_capacity
+        return self._battery.demand(self._load)
 
-    def buy_energy(self, bought_energy:int, price:int) -> None:
+    def buy_energy(self, bought_energy:int, price:int) -> float:
         """
         buys the given amount of energy for the specified price
 
         Parameters:
             bought_energy: the amount of energy to be bought
             price: price of the energy
+
+        Returns: The energy the battery couldn't take in and spilled
         """
         self._energy_bought += bought_energy 
-        self._battery.add_charge(bought_energy)
+        spilled = self._battery.add_charge(bought_energy)
         self.spend(price)
+        return spilled
 
     def in_price_range(self, price: float) -> bool:
-        return price*self._state.modulation_factor <= ((1+self.tolerance) * self._buying_price)
+        return price*self._modulation_factor <= ((1+self.tolerance) * self._buying_price)
 
     def modulate_buying_price(self) -> None:
         """Modulates the buying price of the buyer"""
-        self._buying_price *= random.uniform(0.9, 1.1)
-        self._buying_price = max(self._buying_price, CONSTANTS.MIN_ENERGY_PRICE)
-        self._buying_price = min(self._buying_price, CONSTANTS.MAX_ENERGY_PRICE)
+        self._buying_price *= self._uniform("buying_price", 0.9, 1.1)
+        simulation = Simulation.current()
+        self._buying_price = max(self._buying_price, simulation.min_price)
+        self._buying_price = min(self._buying_price, simulation.max_price)
 
     @property
     def buying_price(self):
@@ -63,9 +73,18 @@ class Buyer(Agent):
         return any(buyer.eligible for buyer in cls._all_buyers)
 
     @classmethod
-    def create_buyers(cls, init_money:int,num_buyers:int, buying_price:int, load:int, initial_energy:int) -> list:
-        for x in range(num_buyers):
-            Buyer(_id=x, buying_price=buying_price, load=load, initial_energy=initial_energy, init_money=init_money, max_capacity=5)
+    def _register(cls, agents:list) -> None:
+        super()._register(agents)
+        Buyer._all_buyers.extend(agents)
+
+    @classmethod
+    def create_buyers(cls, init_money:int,num_buyers:int, buying_price:int, load:int, initial_energy:int, max_capacity:int=5, population:AgentPopulation=None) -> list:
+        """Creates the given number of identical buyers in one batch"""
+        population = AgentPopulation.default() if population is None else population
+        rows = population.add_rows(
+            num_buyers, AgentPopulation.BUYER, id=np.arange(num_buyers), money=init_money, buying_price=buying_price,
+            load=load, charge=initial_energy, capacity=max_capacity)
+        cls.from_rows(population, rows)
         return cls._all_buyers
 
     @property
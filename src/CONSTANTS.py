@@ -2,8 +2,38 @@
 This file contains all the constants required in the project.
 """
 
+import os
+
+# Price limits per unit of energy of the market main runs, shared by every runner that samples that market
 MAX_ENERGY_PRICE = 10
-MIN_ENERGY_PRICE = 1
+MIN_ENERGY_PRICE = 2
 LEDGER_FILE_PATH = "ledger.xlsx"
+LEDGER_HEADERS = ("Round", "Buyer ID", "Seller ID", "Energy", "Price", "Money/Energy", "agent1 reserve", "agent2 reserve")
+LEDGER_SINK = "csv"
+LEDGER_FLUSH_ROWS = 10_000
+LEDGER_FLUSH_SECONDS = 5.0
+LEDGER_BACKGROUND_FLUSH = False
+LEDGER_EXPORT_EXCEL = True
 DATA_FILE_PATH = "consumer_list.xlsx"
+DATA_SHEET = "Sheet3"
+DATA_CACHE_DIR = ".data_cache"
+SWEEP_CACHE_DIR = ".sweep_cache"
+SWEEP_CACHE_BYTES = 1 << 30
+# Directory ExcelFileReader is imported from when it isn't installed, only used when the variable is set
+EXCEL_READER_PATH = os.environ.get("EXCEL_READER_PATH")
 MAX_MARKET_ROUNDS = 10
+MARKET_MODE = "real_world"
+ROUND_DEADLINE_SECONDS = 1.0
+MAX_CONCURRENT_STRATEGIES = 1_000
+# Largest number of pairs of agents screened for business at once by the ideal fair and real world markets
+SCREENING_TILE_SIZE = 1 << 16
+# Width of the bands of prices agents are grouped by in the welfare mode, pairs of agents less than a band away from
+# being unable to trade may be left out
+WELFARE_PRICE_BAND = 0.05
+# Row i holds the probabilities of an agent in state i moving to every state between rounds, states being ordered as
+# in State.STATES (Normal, Desperate, Conservative)
+STATE_TRANSITIONS = ((1/3, 1/3, 1/3), (1/3, 1/3, 1/3), (1/3, 1/3, 1/3))
+# Prices of the utility grid per unit of energy, keyed by the hour of the day a period starts at, every market round
+# being one hour
+RETAIL_TARIFF = {0: 8.0, 7: 12.0, 11: 10.0, 17: 14.0, 21: 8.0}
+FEED_IN_TARIFF = {0: 0.5, 9: 1.0, 16: 0.5}
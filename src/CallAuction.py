@@ -0,0 +1,318 @@
+"""
+This file contains a uniform price call auction that clears a whole market round at once.
+
+Every eligible buyer places a bid for its demand at the highest price it accepts and every eligible seller an ask for
+the energy it can spare at the lowest price it accepts. The cumulative demand and supply curves are built with a sort
+and a cumulative sum, the clearing price is the one that trades the most energy, and everyone trades at that price.
+When one side offers more than can be traded, the orders at the marginal price share what is left pro-rata.
+
+Prices are per unit of energy: a trade costs energy * price, like in the time_series, welfare and feeder modes that
+settle through the auction. The bilateral modes (ideal_fair, real_world, order_book, async) keep the rule of
+Agent.do_business, where a trade costs the selling price once whatever the energy. The ledger's Price column is the
+money paid and its Money/Energy column that money per unit in every mode, but money totals of auction and bilateral
+runs aren't comparable.
+"""
+
+from __future__ import annotations
+from typing import NamedTuple, Union
+
+import numpy as np
+
+from AgentPopulation import AgentPopulation
+
+
+class Clearing(NamedTuple):
+    price: float
+    volume: float
+    bid_fills: np.ndarray       # energy bought by every bid, in the order the bids were submitted
+    ask_fills: np.ndarray       # energy sold by every ask, in the order the asks were submitted
+
+
+class Trade(NamedTuple):
+    buyer_pool: AgentPopulation
+    buyer_row: int
+    seller_pool: AgentPopulation
+    seller_row: int
+    energy: float
+
+
+def _ration(limits: np.ndarray, quantities: np.ndarray, volume: float) -> np.ndarray:
+    """
+    Fills the orders of one side of the book best limit first, the orders at the marginal limit sharing pro-rata
+
+    Parameters:
+    limits: limits of the orders, sorted best first
+    quantities: quantities of the orders in the same order
+    volume: energy to hand out, at most the sum of quantities
+
+    Returns: The fill of every order
+    """
+    cumulative = np.cumsum(quantities)
+    if volume >= cumulative[-1]:
+        return quantities.copy()
+
+    margin = limits[np.searchsorted(cumulative, volume, side="left")]
+    at_margin = limits == margin
+    first = np.argmax(at_margin)
+    fills = np.where(np.arange(len(limits)) < first, quantities, 0.0)
+    left = volume - fills.sum()
+    fills[at_margin] = quantities[at_margin] * (left / quantities[at_margin].sum())
+    return fills
+
+
+def clear(bid_limits: np.ndarray, bid_quantities: np.ndarray, ask_limits: np.ndarray,
+          ask_quantities: np.ndarray) -> Union[Clearing, None]:
+    """
+    Finds the uniform price that trades the most energy and what every order trades at it
+
+    The candidate prices are the limits of the orders. Among the candidates trading the most energy the ones leaving
+    the smallest imbalance between demand and supply are kept, and the middle one is the clearing price.
+
+    Parameters:
+    bid_limits: highest price per unit of every bid
+    bid_quantities: energy wanted by every bid
+    ask_limits: lowest price per unit of every ask
+    ask_quantities: energy offered by every ask
+
+    Returns: None if the books don't cross, the Clearing otherwise
+    """
+    if len(bid_limits) == 0 or len(ask_limits) == 0:
+        return None
+
+    bid_order = np.argsort(-bid_limits, kind="stable")
+    ask_order = np.argsort(ask_limits, kind="stable")
+    sorted_bids, sorted_asks = bid_limits[bid_order], ask_limits[ask_order]
+    demand = np.concatenate(([0.0], np.cumsum(bid_quantities[bid_order])))
+    supply = np.concatenate(([0.0], np.cumsum(ask_quantities[ask_order])))
+
+    # Demand at a price counts the bids with a limit at or above it, supply the asks with a limit at or below it
+    prices = np.unique(np.concatenate((bid_limits, ask_limits)))
+    demand_at = demand[len(sorted_bids) - np.searchsorted(sorted_bids[::-1], prices, side="left")]
+    supply_at = supply[np.searchsorted(sorted_asks, prices, side="right")]
+    volumes = np.minimum(demand_at, supply_at)
+
+    volume = volumes.max()
+    if volume <= 0:
+        return None
+
+    candidates = np.flatnonzero(volumes == volume)
+    imbalance = np.abs(demand_at[candidates] - supply_at[candidates])
+    candidates = candidates[imbalance == imbalance.min()]
+    price = prices[candidates[len(candidates) // 2]]
+
+    bid_fills = np.zeros(len(bid_limits))
+    ask_fills = np.zeros(len(ask_limits))
+    bidding = bid_order[sorted_bids >= price]
+    asking = ask_order[sorted_asks <= price]
+    bid_fills[bidding] = _ration(bid_limits[bidding], bid_quantities[bidding], volume)
+    ask_fills[asking] = _ration(-ask_limits[asking], ask_quantities[asking], volume)
+    return Clearing(price.item(), volume.item(), bid_fills, ask_fills)
+
+
+def pair_fills(bid_fills: np.ndarray, ask_fills: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Splits the fills of a clearing into bilateral trades by laying both sides end to end
+
+    Returns: The bid index, the ask index and the energy of every trade, at most one trade per bid and ask boundary
+    """
+    bid_cumulative = np.cumsum(bid_fills)
+    ask_cumulative = np.cumsum(ask_fills)
+    volume = min(bid_cumulative[-1], ask_cumulative[-1]) if len(bid_fills) and len(ask_fills) else 0.0
+    bounds = np.union1d(bid_cumulative, ask_cumulative)
+    bounds = np.concatenate(([0.0], bounds[(bounds > 0) & (bounds < volume)], [volume]))
+
+    energy = np.diff(bounds)
+    middles = bounds[:-1] + energy / 2
+    keep = energy > 1e-9
+    bids = np.minimum(np.searchsorted(bid_cumulative, middles[keep]), len(bid_fills) - 1)
+    asks = np.minimum(np.searchsorted(ask_cumulative, middles[keep]), len(ask_fills) - 1)
+    return bids, asks, energy[keep]
+
+
+class RoundOrders:
+    """
+    Class collecting the bids and asks of one market round, the base of the mechanisms clearing a whole round at once.
+
+    Orders are gathered with the bulk queries of AgentPopulation, so placing the orders of a round costs a handful of
+    NumPy operations whatever the number of agents.
+    """
+
+    def __init__(self) -> None:
+        self._bids: list[tuple[AgentPopulation, np.ndarray, np.ndarray, np.ndarray]] = []
+        self._asks: list[tuple[AgentPopulation, np.ndarray, np.ndarray, np.ndarray]] = []
+        self._prices = np.zeros(0)
+
+    @property
+    def bids(self) -> int:
+        """Returns: The number of bids placed"""
+        return sum(len(rows) for _, rows, _, _ in self._bids)
+
+    @property
+    def asks(self) -> int:
+        """Returns: The number of asks placed"""
+        return sum(len(rows) for _, rows, _, _ in self._asks)
+
+    @property
+    def prices(self) -> np.ndarray:
+        """Returns: The price per unit of every trade of the last clearing"""
+        return self._prices
+
+    @property
+    def traded(self) -> int:
+        """Returns: The number of bids and asks the last clearing filled at least in part"""
+        return int(np.count_nonzero(self._fills(0)) + np.count_nonzero(self._fills(1)))
+
+    def submit(self, population: AgentPopulation, rows: np.ndarray) -> None:
+        """
+        Places an order for every eligible row among the given rows of a population
+
+        Bids are for the demand of the row, capped to what the row can afford at its own limit, and asks for the
+        energy the row can spare.
+        """
+        buyers = rows[population.eligible_buyers(rows)]
+        limits = population.bid_limits(buyers)
+        quantities = np.minimum(population.demand(buyers), population.money[buyers] / limits)
+        self._bids.append((population, buyers, limits, quantities))
+
+        sellers = rows[population.eligible_sellers(rows)]
+        self._asks.append((population, sellers, population.ask_limits(sellers), population.energy_to_sell(sellers)))
+
+    def submit_all(self, agents: list) -> None:
+        """Places an order for every eligible agent in the given list"""
+        for population, rows in AgentPopulation.group(agents).items():
+            self.submit(population, rows)
+
+    @staticmethod
+    def _side(orders: list) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if not orders:
+            empty = np.zeros(0)
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), empty, empty
+        pools = np.concatenate([np.full(len(rows), i, dtype=np.int64) for i, (_, rows, _, _) in enumerate(orders)])
+        rows = np.concatenate([rows for _, rows, _, _ in orders])
+        limits = np.concatenate([limits for _, _, limits, _ in orders])
+        quantities = np.concatenate([quantities for _, _, _, quantities in orders])
+        return pools, rows, limits, quantities
+
+    def _fills(self, side: int) -> np.ndarray:
+        """Returns: The energy the last clearing gave every bid (side 0) or every ask (side 1)"""
+        raise NotImplementedError
+
+    def _trades(self, bids: np.ndarray, asks: np.ndarray, energy: np.ndarray) -> list[Trade]:
+        """
+        Parameters:
+        bids: bid index of every trade
+        asks: ask index of every trade
+        energy: energy of every trade
+
+        Returns: The bilateral trades between the agents that placed the given orders
+        """
+        bid_pools, bid_rows, _, _ = self._side(self._bids)
+        ask_pools, ask_rows, _, _ = self._side(self._asks)
+        return [
+            Trade(self._bids[buyer_pool][0], buyer_row, self._asks[seller_pool][0], seller_row, amount)
+            for buyer_pool, buyer_row, seller_pool, seller_row, amount in zip(
+                bid_pools[bids].tolist(), bid_rows[bids].tolist(), ask_pools[asks].tolist(), ask_rows[asks].tolist(),
+                energy.tolist())]
+
+
+class CallAuction(RoundOrders):
+    """
+    Class collecting the bids and asks of one market round and clearing them all at one price.
+
+    Placing and clearing the orders of a round costs a handful of NumPy operations and a sort whatever the number of
+    agents.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.clearing: Union[Clearing, None] = None
+
+    def orders(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns: The limits and quantities of the bids and of the asks, the arguments of clear"""
+        _, _, bid_limits, bid_quantities = self._side(self._bids)
+        _, _, ask_limits, ask_quantities = self._side(self._asks)
+        return bid_limits, bid_quantities, ask_limits, ask_quantities
+
+    def feeders(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns: The feeder of every bid and of every ask"""
+        return tuple(
+            np.concatenate([population.feeder[rows] for population, rows, _, _ in orders]) if orders
+            else np.zeros(0, dtype=np.int64)
+            for orders in (self._bids, self._asks))
+
+    def residual(self) -> CallAuction:
+        """Returns: An auction of what is left of every order after the last clearing, at the same limits"""
+        residual = CallAuction()
+        for orders, residual_orders, fills in ((self._bids, residual._bids, self._fills(0)),
+                                               (self._asks, residual._asks, self._fills(1))):
+            start = 0
+            for population, rows, limits, quantities in orders:
+                left = quantities - fills[start:start + len(rows)]
+                start += len(rows)
+                keep = left > 1e-9
+                residual_orders.append((population, rows[keep], limits[keep], left[keep]))
+        return residual
+
+    def _fills(self, side: int) -> np.ndarray:
+        if self.clearing is None:
+            return np.zeros(self.bids if side == 0 else self.asks)
+        return self.clearing.bid_fills if side == 0 else self.clearing.ask_fills
+
+    def by_feeder(self, feeders: int) -> list[CallAuction]:
+        """Returns: One auction per feeder holding the orders of this auction placed by agents on that feeder"""
+        auctions = [CallAuction() for _ in range(feeders)]
+        for orders, side in ((self._bids, "_bids"), (self._asks, "_asks")):
+            for population, rows, limits, quantities in orders:
+                order = np.argsort(population.feeder[rows], kind="stable")
+                bounds = np.searchsorted(population.feeder[rows][order], np.arange(feeders + 1))
+                for feeder, auction in enumerate(auctions):
+                    part = order[bounds[feeder]:bounds[feeder + 1]]
+                    getattr(auction, side).append((population, rows[part], limits[part], quantities[part]))
+        return auctions
+
+    @classmethod
+    def merge(cls, auctions: list[CallAuction]) -> CallAuction:
+        """Returns: One auction holding the orders of all the given auctions"""
+        merged = cls()
+        for auction in auctions:
+            merged._bids.extend(auction._bids)
+            merged._asks.extend(auction._asks)
+        return merged
+
+    def clear(self) -> list[Trade]:
+        """
+        Clears the book at a single price
+
+        Returns: The bilateral trades the clearing splits into, empty when the books don't cross
+        """
+        return self.apply(clear(*self.orders()))
+
+    def apply(self, clearing: Union[Clearing, None]) -> list[Trade]:
+        """
+        Takes a clearing of the orders of this auction, computed elsewhere or adjusted after the fact
+
+        Returns: The bilateral trades the clearing splits into
+        """
+        self.clearing = clearing
+        if self.clearing is None:
+            self._prices = np.zeros(0)
+            return []
+
+        bids, asks, energy = pair_fills(self.clearing.bid_fills, self.clearing.ask_fills)
+        self._prices = np.full(len(energy), self.clearing.price)
+        return self._trades(bids, asks, energy)
+
+    def settle(self) -> None:
+        """Moves the energy and the money of the last clearing between the rows that traded"""
+        if self.clearing is None:
+            return
+        price = self.clearing.price
+        for orders, fills, settle in ((self._bids, self.clearing.bid_fills, AgentPopulation.settle_purchases),
+                                      (self._asks, self.clearing.ask_fills, AgentPopulation.settle_sales)):
+            start = 0
+            for population, rows, _, _ in orders:
+                filled = fills[start:start + len(rows)]
+                start += len(rows)
+                traded = filled > 0
+                if traded.any():
+                    settle(population, rows[traded], filled[traded], filled[traded] * price)
@@ -0,0 +1,227 @@
+"""
+This file contains periodic checkpoints of a market simulation, so that a long run can be resumed after a crash.
+
+A checkpoint holds everything the next rounds depend on: the arrays of the agent populations (money, load, batteries,
+prices, tolerances, states and modes), the order of the buyers and sellers, the state of the random generator of the
+simulation, of the populations' generators and of the agents' random streams, the energy drained to the grid and the
+number of ledger entries written so far.
+
+Checkpoints are compressed .npz files. Every few checkpoints is a full one, the others only hold the rows of every
+column that changed since the previous checkpoint, so saving costs little more than the round's changes.
+"""
+
+from __future__ import annotations
+from typing import NamedTuple, Union
+import glob
+import json
+import os
+
+import numpy as np
+
+import CONSTANTS
+from Agent import Agent
+from AgentPopulation import AgentPopulation
+from Buyer import Buyer
+from Grid import Grid
+from LedgerSink import LedgerSink
+from Prosumer import Prosumer
+from RandomStreams import RandomStreams
+from Seller import Seller
+from Simulation import Simulation
+
+_CLASSES = {AgentPopulation.BUYER: Buyer, AgentPopulation.SELLER: Seller, AgentPopulation.PROSUMER: Prosumer}
+
+
+class Checkpoint(NamedTuple):
+    market_round: int       # the round the run resumes from
+    mode: Union[str, None]
+    ledger_rows: int
+    populations: list[AgentPopulation]
+    buyers: list[Agent]
+    sellers: list[Agent]
+
+    def ledger_sink(self, kind: str = None, path: str = None) -> LedgerSink:
+        """
+        Returns: A sink reopening the ledger of the checkpointed run, keeping the entries written up to the checkpoint.
+        It is meant to be given to the Market resuming the run.
+        """
+        kind = CONSTANTS.LEDGER_SINK if kind is None else kind
+        path = CONSTANTS.LEDGER_FILE_PATH if path is None else path
+        return LedgerSink.create(kind, path, CONSTANTS.LEDGER_HEADERS, resume_rows=self.ledger_rows)
+
+
+def _changed(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    changed = current != previous
+    if current.dtype.kind == "f":
+        changed &= ~(np.isnan(current) & np.isnan(previous))
+    return np.flatnonzero(changed)
+
+
+def _placement(agents: list[Agent], populations: list[AgentPopulation]) -> np.ndarray:
+    """Returns: The population and the row of every agent, as an array of shape (agents, 2)"""
+    numbers = {population: number for number, population in enumerate(populations)}
+    return np.array([(numbers[agent._pool], agent._index) for agent in agents], dtype=np.int64).reshape(-1, 2)
+
+
+class Checkpointer:
+    """
+    Writes and reads the checkpoints of one simulation in a directory.
+
+    Parameters:
+    path: directory the checkpoints are written to
+    every: number of rounds between checkpoints
+    full_every: number of checkpoints between full checkpoints, the ones in between being deltas
+    compress: when True checkpoints are zlib compressed
+    """
+
+    def __init__(self, path: str, every: int = 1, full_every: int = 10, compress: bool = True) -> None:
+        self.path = path
+        self.every = every
+        self.full_every = full_every
+        self._compress = compress
+        self._previous: Union[list[dict[str, np.ndarray]], None] = None
+        self._previous_round: Union[int, None] = None
+        self._deltas = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, market_round: int) -> str:
+        return os.path.join(self.path, f"round-{market_round:06d}.npz")
+
+    def due(self, market_round: int) -> bool:
+        """Returns: True if a checkpoint should be saved at the end of the given round"""
+        return market_round % self.every == 0
+
+    def rounds(self) -> list[int]:
+        """Returns: The rounds the run can be resumed from, in increasing order"""
+        files = glob.glob(os.path.join(self.path, "round-*.npz"))
+        return sorted(int(os.path.basename(file)[6:-4]) for file in files)
+
+    def save(self, market_round: int, buyers: list[Agent], sellers: list[Agent], ledger_rows: int,
+             mode: str = None) -> str:
+        """
+        Saves the state of the simulation
+
+        Parameters:
+        market_round: the round the run would resume from
+        buyers: the buyers given to the market, in order
+        sellers: the sellers given to the market, in order
+        ledger_rows: the number of ledger entries written so far
+        mode: the market mode being run
+
+        Returns: The checkpoint file
+        """
+        populations = list(AgentPopulation.group(buyers + sellers))
+        snapshot = [{name: getattr(population, name).copy() for name in AgentPopulation._COLUMNS}
+                    for population in populations]
+        full = (self._previous is None or self._deltas + 1 >= self.full_every
+                or [len(population) for population in populations] != [len(p["id"]) for p in self._previous])
+
+        version, internal_state, gauss_next = Simulation.current().random.getstate()
+        meta = {
+            "market_round": market_round,
+            "mode": mode,
+            "ledger_rows": ledger_rows,
+            "base": None if full else self._previous_round,
+            "grid": Grid().get_drained_energy(),
+            "random": [version, gauss_next],
+            "rngs": [population.rng.bit_generator.state for population in populations],
+            "streams": RandomStreams.default().state(),
+            "sizes": [len(population) for population in populations],
+        }
+        arrays = {"random_state": np.array(internal_state, dtype=np.uint64)}
+        if full:
+            arrays["buyers"] = _placement(buyers, populations)
+            arrays["sellers"] = _placement(sellers, populations)
+            for number, columns in enumerate(snapshot):
+                arrays.update({f"{number}.{name}": column for name, column in columns.items()})
+            self._deltas = 0
+        else:
+            for number, (columns, previous) in enumerate(zip(snapshot, self._previous)):
+                for name, column in columns.items():
+                    if len(rows := _changed(column, previous[name])):
+                        arrays[f"{number}.{name}.rows"] = rows
+                        arrays[f"{number}.{name}.values"] = column[rows]
+            self._deltas += 1
+
+        file = self._file(market_round)
+        save = np.savez_compressed if self._compress else np.savez
+        temporary = file + ".tmp.npz"
+        save(temporary, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(temporary, file)
+
+        self._previous, self._previous_round = snapshot, market_round
+        return file
+
+    def _read(self, market_round: int) -> tuple[dict, dict[str, np.ndarray]]:
+        with np.load(self._file(market_round)) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+        return json.loads(arrays.pop("meta").item()), arrays
+
+    def load(self, market_round: int = None) -> Checkpoint:
+        """
+        Restores the state of the simulation saved by a checkpoint into the current simulation. The agent registries
+        are emptied and filled with new agents viewing the restored populations, the random generator of the
+        simulation and the grid are set back to the checkpoint.
+
+        Parameters:
+        market_round: the round to resume from, defaults to the latest checkpoint
+
+        Returns: The checkpoint, with the restored populations and agents
+        """
+        available = self.rounds()
+        if not available:
+            raise FileNotFoundError(f"No checkpoint in {self.path}")
+        market_round = available[-1] if market_round is None else market_round
+
+        chain = [self._read(market_round)]
+        while chain[-1][0]["base"] is not None:
+            chain.append(self._read(chain[-1][0]["base"]))
+        meta, arrays = chain[0]
+        full = chain[-1][1]
+
+        columns = [{name: full[f"{number}.{name}"].copy() for name in AgentPopulation._COLUMNS}
+                   for number in range(len(meta["sizes"]))]
+        for _, delta in reversed(chain[:-1]):
+            for number, population_columns in enumerate(columns):
+                for name, column in population_columns.items():
+                    if f"{number}.{name}.rows" in delta:
+                        column[delta[f"{number}.{name}.rows"]] = delta[f"{number}.{name}.values"]
+
+        populations = []
+        for state, size, population_columns in zip(meta["rngs"], meta["sizes"], columns):
+            bit_generator = getattr(np.random, state["bit_generator"])()
+            bit_generator.state = state
+            population = AgentPopulation(allocated=size, rng=np.random.Generator(bit_generator))
+            population.allocate(size)
+            for name, column in population_columns.items():
+                population._data[name][:size] = column
+            populations.append(population)
+
+        for registry in (Agent._all_agents, Buyer._all_buyers, Seller._all_sellers, Prosumer._all_prosumers):
+            registry.clear()
+        buyers, sellers = (self._agents(full[side], populations) for side in ("buyers", "sellers"))
+
+        version, gauss_next = meta["random"]
+        Simulation.current().random.setstate((version, tuple(arrays["random_state"].tolist()), gauss_next))
+        RandomStreams.restore(meta["streams"])
+        Grid().reset()
+        Grid()(meta["grid"])
+
+        self._previous = [{name: getattr(population, name).copy() for name in AgentPopulation._COLUMNS}
+                          for population in populations]
+        self._previous_round, self._deltas = market_round, 0
+        return Checkpoint(meta["market_round"], meta["mode"], meta["ledger_rows"], populations, buyers, sellers)
+
+    @staticmethod
+    def _agents(placement: np.ndarray, populations: list[AgentPopulation]) -> list[Agent]:
+        """Returns: Agents of the right class viewing the given rows, in order"""
+        agents: list[Agent] = [None] * len(placement)
+        for number, population in enumerate(populations):
+            positions = np.flatnonzero(placement[:, 0] == number)
+            rows = placement[positions, 1]
+            kinds = population.kind[rows]
+            for kind, agent_class in _CLASSES.items():
+                of_kind = kinds == kind
+                for position, agent in zip(positions[of_kind].tolist(), agent_class.from_rows(population, rows[of_kind])):
+                    agents[position] = agent
+        return agents
@@ -0,0 +1,243 @@
+"""
+This file contains a columnar on-disk format for the ledger, meant for post-run analytics.
+
+Every column of the ledger is stored in its own file of fixed-width values, appended to in chunks while the market
+runs and read back through numpy.memmap without copying. Once the run is over, secondary indexes are built by round
+and by buyer and seller ID, together with per-round aggregates, so that the usual questions about a run can be
+answered without scanning the whole ledger.
+
+Classes:
+    ColumnarLedgerSink: LedgerSink appending the entries to the column files.
+    ColumnarLedger: Read-only view of a columnar ledger with a small query API.
+"""
+
+from __future__ import annotations
+from typing import Iterator, NamedTuple, Union
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+
+from LedgerSink import LedgerSink, Row, SINKS
+
+COLUMN_TYPES = {
+    "Round": np.int32,
+    "Buyer ID": np.int64,
+    "Seller ID": np.int64,
+}
+ROUND, BUYER, SELLER, ENERGY, PRICE, RATE = "Round", "Buyer ID", "Seller ID", "Energy", "Price", "Money/Energy"
+INDEXED_COLUMNS = (ROUND, BUYER, SELLER)
+META_FILE = "meta.json"
+INDEX_FILE = "index.json"
+
+
+def _file_name(header: str) -> str:
+    return re.sub(r"[^0-9A-Za-z]+", "_", header).strip("_").lower()
+
+
+def _column_type(header: str) -> np.dtype:
+    return np.dtype(COLUMN_TYPES.get(header, np.float64))
+
+
+class ColumnarLedgerSink(LedgerSink):
+    """
+    Sink appending every column of the ledger to its own binary file inside the directory at path
+    """
+
+    EXTENSION = ".cols"
+
+    def _open(self) -> None:
+        if os.path.exists(self._path):
+            shutil.rmtree(self._path)
+        os.makedirs(self._path)
+
+        self._types = [_column_type(header) for header in self._headers]
+        self._files = [open(os.path.join(self._path, _file_name(header) + ".bin"), "ab") for header in self._headers]
+        self._rows_on_disk = 0
+        self._write_meta()
+
+    def _write_meta(self) -> None:
+        meta = {
+            "headers": self._headers,
+            "types": [column_type.str for column_type in self._types],
+            "files": [_file_name(header) + ".bin" for header in self._headers],
+            "rows": self._rows_on_disk,
+        }
+        with open(os.path.join(self._path, META_FILE), "w") as file:
+            json.dump(meta, file)
+
+    def _write_rows(self, rows: list[Row]) -> None:
+        columns = list(zip(*rows))
+        for file, column_type, column in zip(self._files, self._types, columns):
+            file.write(np.asarray(column, dtype=column_type).tobytes())
+            file.flush()
+        self._rows_on_disk += len(rows)
+        self._write_meta()
+
+    def _close(self) -> None:
+        for file in self._files:
+            file.close()
+        build_indexes(self._path)
+
+    def rows(self) -> Iterator[list]:
+        ledger = ColumnarLedger(self._path, build=False)
+        columns = [ledger.column(header) for header in ledger.headers]
+        for start in range(0, len(ledger), 65_536):
+            yield from zip(*(column[start:start + 65_536].tolist() for column in columns))
+
+
+def build_indexes(path: str) -> None:
+    """
+    Builds the secondary indexes and the per-round aggregates of the columnar ledger at path
+
+    For each indexed column three arrays are stored: the permutation sorting the ledger by that column, the distinct
+    keys and the offset of every key in the permutation.
+    """
+    ledger = ColumnarLedger(path, build=False)
+    for header in INDEXED_COLUMNS:
+        keys = ledger.column(header)
+        order = np.argsort(keys, kind="stable")
+        unique_keys, offsets = np.unique(keys[order], return_index=True)
+        name = _file_name(header)
+        np.save(os.path.join(path, f"{name}.order.npy"), order)
+        np.save(os.path.join(path, f"{name}.keys.npy"), unique_keys)
+        np.save(os.path.join(path, f"{name}.offsets.npy"), np.append(offsets, len(keys)))
+
+        if header == ROUND:
+            starts = offsets.astype(np.intp)
+            energy = ledger.column(ENERGY)[order]
+            money = ledger.column(PRICE)[order]
+            volume = np.add.reduceat(energy, starts) if len(starts) else np.zeros(0)
+            value = np.add.reduceat(money, starts) if len(starts) else np.zeros(0)
+            np.save(os.path.join(path, "round.volume.npy"), volume)
+            np.save(os.path.join(path, "round.value.npy"), value)
+
+    with open(os.path.join(path, INDEX_FILE), "w") as file:
+        json.dump({"rows": len(ledger)}, file)
+
+
+class AgentPnL(NamedTuple):
+    earned: float
+    spent: float
+    energy_sold: float
+    energy_bought: float
+
+    @property
+    def pnl(self) -> float:
+        return self.earned - self.spent
+
+
+class ColumnarLedger:
+    """
+    Read-only view of a columnar ledger directory. Columns are memory mapped, nothing is loaded up front.
+
+    Parameters:
+    path: directory written by a ColumnarLedgerSink
+    build: when True the indexes are (re)built if they are missing or older than the data
+    """
+
+    def __init__(self, path: str, build: bool = True) -> None:
+        self._path = path
+        with open(os.path.join(path, META_FILE)) as file:
+            meta = json.load(file)
+        self._headers: list[str] = meta["headers"]
+        self._rows: int = meta["rows"]
+        self._columns = {
+            header: (os.path.join(path, file_name), np.dtype(column_type))
+            for header, file_name, column_type in zip(self._headers, meta["files"], meta["types"])
+        }
+        self._cache: dict[str, np.ndarray] = {}
+
+        if build and not self._indexed():
+            build_indexes(path)
+
+    def __len__(self) -> int:
+        return self._rows
+
+    @property
+    def headers(self) -> list[str]:
+        return self._headers
+
+    def _indexed(self) -> bool:
+        try:
+            with open(os.path.join(self._path, INDEX_FILE)) as file:
+                return json.load(file)["rows"] == self._rows
+        except FileNotFoundError:
+            return False
+
+    def _load(self, name: str) -> np.ndarray:
+        if name not in self._cache:
+            self._cache[name] = np.load(os.path.join(self._path, name), mmap_mode="r")
+        return self._cache[name]
+
+    def column(self, header: str) -> np.ndarray:
+        """Returns: The whole column as a read-only memory mapped array"""
+        if header not in self._cache:
+            file_name, column_type = self._columns[header]
+            if self._rows == 0:
+                self._cache[header] = np.zeros(0, column_type)
+            else:
+                self._cache[header] = np.memmap(file_name, dtype=column_type, mode="r", shape=(self._rows,))
+        return self._cache[header]
+
+    def rows_where(self, header: str, key: int) -> np.ndarray:
+        """Returns: The positions of the entries whose indexed column equals key, in increasing order"""
+        name = _file_name(header)
+        keys = self._load(f"{name}.keys.npy")
+        position = np.searchsorted(keys, key)
+        if position == len(keys) or keys[position] != key:
+            return np.zeros(0, np.int64)
+        offsets = self._load(f"{name}.offsets.npy")
+        return self._load(f"{name}.order.npy")[offsets[position]:offsets[position + 1]]
+
+    def trades_of(self, agent_id: int) -> dict[str, np.ndarray]:
+        """Returns: Every column of the entries the agent took part in, either as buyer or as seller"""
+        rows = np.union1d(self.rows_where(BUYER, agent_id), self.rows_where(SELLER, agent_id))
+        return {header: np.asarray(self.column(header)[rows]) for header in self._headers}
+
+    def agent_pnl(self, agent_id: int) -> AgentPnL:
+        """Returns: The money earned and spent and the energy sold and bought by the agent"""
+        sold = self.rows_where(SELLER, agent_id)
+        bought = self.rows_where(BUYER, agent_id)
+        money, energy = self.column(PRICE), self.column(ENERGY)
+        return AgentPnL(
+            earned=float(money[sold].sum()),
+            spent=float(money[bought].sum()),
+            energy_sold=float(energy[sold].sum()),
+            energy_bought=float(energy[bought].sum()))
+
+    @property
+    def rounds(self) -> np.ndarray:
+        """Returns: The rounds that have entries, in increasing order"""
+        return np.asarray(self._load("round.keys.npy"))
+
+    def round_volume(self) -> np.ndarray:
+        """Returns: The energy traded in every round listed by rounds"""
+        return np.asarray(self._load("round.volume.npy"))
+
+    def round_value(self) -> np.ndarray:
+        """Returns: The money exchanged in every round listed by rounds"""
+        return np.asarray(self._load("round.value.npy"))
+
+    def round_vwap(self) -> np.ndarray:
+        """Returns: The volume weighted average price of energy in every round listed by rounds"""
+        volume = self.round_volume()
+        return np.divide(self.round_value(), volume, out=np.full(len(volume), np.nan), where=volume > 0)
+
+    def price_histogram(self, bins: Union[int, np.ndarray] = 10, market_round: int = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Parameters:
+        bins: number of bins or their edges, as for numpy.histogram
+        market_round: when given only the entries of that round are counted
+
+        Returns: The counts and the bin edges of the price per unit of energy
+        """
+        rates = self.column(RATE)
+        if market_round is not None:
+            rates = rates[self.rows_where(ROUND, market_round)]
+        return np.histogram(rates, bins=bins)
+
+
+SINKS["columnar"] = ColumnarLedgerSink
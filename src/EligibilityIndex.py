@@ -0,0 +1,93 @@
+"""
+This file contains an index of the agents of a market that are currently eligible to buy or to sell.
+"""
+
+from __future__ import annotations
+from typing import Iterable
+
+import numpy as np
+
+from Agent import Agent
+from AgentPopulation import AgentPopulation
+
+
+class EligibilityIndex:
+    """
+    Keeps the sets of eligible buyers and eligible sellers among a list of agents up to date.
+
+    The index watches the populations the agents live in and only re-evaluates the agents whose money, load, battery
+    charge or mode changed since the last refresh, so the work done per round scales with the number of agents that
+    changed. Eligibility is evaluated with the population's masks, which follow Buyer, Seller and Prosumer.eligible.
+
+    Parameters:
+    agents: the agents to index, positions in this list are used to refer to them
+    """
+
+    def __init__(self, agents: Iterable[Agent]) -> None:
+        self._agents = list(agents)
+        self._positions = {agent: position for position, agent in enumerate(self._agents)}
+        self._buyers: set[int] = set()
+        self._sellers: set[int] = set()
+
+        # For every population, an array mapping its rows to positions in the agents list (-1 for other agents)
+        self._rows_to_positions: dict[AgentPopulation, np.ndarray] = {}
+        self._changed: dict[AgentPopulation, set[int]] = {}
+        for population, rows in AgentPopulation.group(self._agents).items():
+            rows_to_positions = np.full(len(population), -1, dtype=np.int64)
+            rows_to_positions[rows] = [self._positions[agent] for agent in self._agents if agent._pool is population]
+            self._rows_to_positions[population] = rows_to_positions
+            self._changed[population] = population.watch()
+            self._changed[population].update(rows.tolist())
+
+        self.refresh()
+
+    def close(self) -> None:
+        """Stops watching the populations of the agents"""
+        for population, changed in self._changed.items():
+            population.unwatch(changed)
+        self._changed = {}
+
+    def refresh(self) -> None:
+        """Re-evaluates the agents that changed since the last refresh"""
+        for population, changed in self._changed.items():
+            if not changed:
+                continue
+
+            rows = np.fromiter(changed, dtype=np.int64, count=len(changed))
+            changed.clear()
+            rows_to_positions = self._rows_to_positions[population]
+            rows = rows[rows < len(rows_to_positions)]
+            positions = rows_to_positions[rows]
+            rows, positions = rows[positions >= 0], positions[positions >= 0]
+
+            buyers = population.eligible_buyers(rows)
+            sellers = population.eligible_sellers(rows)
+            self._buyers.difference_update(positions[~buyers].tolist())
+            self._buyers.update(positions[buyers].tolist())
+            self._sellers.difference_update(positions[~sellers].tolist())
+            self._sellers.update(positions[sellers].tolist())
+
+    def is_eligible(self, agent: Agent) -> bool:
+        """Returns: True if the agent is currently eligible to buy or to sell"""
+        self.refresh()
+        position = self._positions[agent]
+        return position in self._buyers or position in self._sellers
+
+    def eligible(self) -> list[Agent]:
+        """Returns: The eligible agents in the order they were given to the index"""
+        self.refresh()
+        return [self._agents[position] for position in sorted(self._buyers | self._sellers)]
+
+    def eligible_buyers(self) -> list[Agent]:
+        """Returns: The agents currently eligible to buy"""
+        self.refresh()
+        return [self._agents[position] for position in self._buyers]
+
+    def eligible_sellers(self) -> list[Agent]:
+        """Returns: The agents currently eligible to sell"""
+        self.refresh()
+        return [self._agents[position] for position in self._sellers]
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._buyers) + len(self._sellers)
@@ -0,0 +1,119 @@
+"""
+This file contains the settlement of what the agents trade with the utility grid at the end of every market round.
+
+Whatever load the batteries of the agents couldn't cover during a round is imported from the grid at the retail tariff
+and whatever energy they spilled is exported to it at the feed-in tariff. Both tariffs can follow a time-of-use
+schedule, every market round being one hour of it. Imports, exports and costs are computed for whole populations at
+once, kept per agent in the population arrays and added up into one GridRound per market round.
+"""
+
+from __future__ import annotations
+from typing import NamedTuple, Union
+
+import numpy as np
+
+import CONSTANTS
+
+HOURS_PER_DAY = 24
+
+
+class TimeOfUseTariff:
+    """
+    A price per unit of energy for every hour of a repeating schedule.
+
+    Parameters:
+    prices: the price of every hour of the schedule, the first round being the first hour
+    """
+
+    def __init__(self, prices: Union[list[float], np.ndarray]) -> None:
+        self.prices = np.asarray(prices, dtype=np.float64)
+        if self.prices.ndim != 1 or len(self.prices) == 0:
+            raise ValueError("A tariff needs a non-empty list of prices")
+
+    @classmethod
+    def flat(cls, price: float) -> TimeOfUseTariff:
+        """Returns: A tariff with the same price at every hour"""
+        return cls([price])
+
+    @classmethod
+    def from_periods(cls, periods: dict[int, float], hours: int = HOURS_PER_DAY) -> TimeOfUseTariff:
+        """
+        Returns: A tariff from the price of every period of the day, keyed by the hour the period starts at. The
+        period starting last runs until the first one starts the next day.
+        """
+        if not periods:
+            raise ValueError("A tariff needs at least one period")
+        starts = sorted(periods)
+        prices = np.full(hours, periods[starts[-1]], dtype=np.float64)
+        for start, end in zip(starts, starts[1:] + [hours]):
+            prices[start:end] = periods[start]
+        return cls(prices)
+
+    def price(self, market_round: int) -> float:
+        """Returns: The price during the given round"""
+        return self.prices[(market_round - 1) % len(self.prices)].item()
+
+
+class GridRound(NamedTuple):
+    market_round: int
+    imported: float             # energy bought from the grid
+    exported: float             # energy sold to the grid
+    import_cost: float
+    export_revenue: float
+
+
+class GridSettlement:
+    """
+    Settles the energy the agents import from and export to the grid, round by round.
+
+    Parameters:
+    retail: tariff imports are paid at, defaults to CONSTANTS.RETAIL_TARIFF
+    feed_in: tariff exports are paid at, defaults to CONSTANTS.FEED_IN_TARIFF
+    pay: when True the grid costs are taken out of the money of the agents, otherwise they are only accounted for
+    """
+
+    def __init__(self, retail: TimeOfUseTariff = None, feed_in: TimeOfUseTariff = None, pay: bool = False) -> None:
+        self.retail = TimeOfUseTariff.from_periods(CONSTANTS.RETAIL_TARIFF) if retail is None else retail
+        self.feed_in = TimeOfUseTariff.from_periods(CONSTANTS.FEED_IN_TARIFF) if feed_in is None else feed_in
+        self.pay = pay
+        self.rounds: list[GridRound] = []
+        self._round = np.zeros(4)
+
+    def settle(self, population, rows: np.ndarray, market_round: int, imported: np.ndarray = None) -> np.ndarray:
+        """
+        Imports the shortfall and exports the spill of the batteries of the given rows during the round. Meant to be
+        called before the round of the batteries ends, once per population, and followed by end_round.
+
+        Parameters:
+        imported: energy every row imports, defaults to the shortfall of its battery, which only consuming the load
+        fills in
+
+        Returns: The net grid cost of every row, negative for rows that earned more than they paid
+        """
+        imported = population.shortfall[rows] if imported is None else imported
+        exported = population.spill[rows]
+        costs = imported * self.retail.price(market_round) - exported * self.feed_in.price(market_round)
+
+        population.grid_imported[rows] += imported
+        population.grid_exported[rows] += exported
+        population.grid_cost[rows] += costs
+        if self.pay:
+            population.money[rows] -= costs
+            population._touch(rows)
+
+        import_cost = imported.sum() * self.retail.price(market_round)
+        export_revenue = exported.sum() * self.feed_in.price(market_round)
+        self._round += (imported.sum(), exported.sum(), import_cost, export_revenue)
+        return costs
+
+    def end_round(self, market_round: int) -> GridRound:
+        """Returns: The totals of the round settled since the last call, which are also added to rounds"""
+        totals = GridRound(market_round, *self._round.tolist())
+        self.rounds.append(totals)
+        self._round = np.zeros(4)
+        return totals
+
+    def totals(self) -> dict[str, float]:
+        """Returns: The imports, exports, costs and revenues of every round settled so far, added up"""
+        return {field: float(sum(getattr(totals, field) for totals in self.rounds))
+                for field in GridRound._fields[1:]}
@@ -0,0 +1,165 @@
+"""
+This file contains the instrumentation of the hot paths of the market.
+
+A Market only pays for instrumentation when one is attached to it, otherwise every hook is skipped by a single
+`is None` check. Once attached, the instrumentation counts match attempts, matches and rejections, times the
+settlement of transactions, the ledger writes and the end of round bookkeeping, and can run chosen rounds under
+cProfile or tracemalloc. Every round produces a RoundStats event.
+"""
+
+from __future__ import annotations
+from typing import Callable, Iterable, NamedTuple, Union
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+
+
+class RoundStats(NamedTuple):
+    market_round: int
+    match_attempts: int
+    matches: int
+    rejected_by_price: int
+    rejected_by_quantity: int
+    round_seconds: float
+    matching_seconds: float
+    settling_seconds: float
+    logging_seconds: float
+    bookkeeping_seconds: float
+    peak_memory: Union[int, None]    # peak bytes traced by tracemalloc, for rounds run under it
+
+
+class MarketInstrumentation:
+    """
+    Collects per-round counters and timings of a market.
+
+    Parameters:
+    profile_rounds: rounds to run under cProfile, their stats end up in profiles
+    memory_rounds: rounds to run under tracemalloc, their peak memory ends up in the round's RoundStats
+    listeners: callables receiving every RoundStats as soon as its round is over
+    """
+
+    def __init__(self, profile_rounds: Iterable[int] = (), memory_rounds: Iterable[int] = (),
+                 listeners: Iterable[Callable[[RoundStats], None]] = ()) -> None:
+        self.rounds: list[RoundStats] = []
+        self.profiles: dict[int, pstats.Stats] = {}
+        self._profile_rounds = set(profile_rounds)
+        self._memory_rounds = set(memory_rounds)
+        self._listeners = list(listeners)
+        self._profiler: Union[cProfile.Profile, None] = None
+        self._tracing_memory = False
+        self._reset_round(0)
+
+    def _reset_round(self, market_round: int) -> None:
+        self._round = market_round
+        self._attempts = 0
+        self._matches = 0
+        self._rejected_by_price = 0
+        self._rejected_by_quantity = 0
+        self._settling = 0.0
+        self._logging = 0.0
+        self._round_start = time.perf_counter()
+        self._bookkeeping_start = None
+
+    def add_listener(self, listener: Callable[[RoundStats], None]) -> None:
+        """Adds a callable receiving every RoundStats as soon as its round is over"""
+        self._listeners.append(listener)
+
+    def begin_round(self, market_round: int) -> None:
+        """Marks the start of a round, starting the profilers asked for this round"""
+        self._reset_round(market_round)
+        if market_round in self._memory_rounds and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing_memory = True
+        if market_round in self._profile_rounds:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._round_start = time.perf_counter()
+
+    def begin_bookkeeping(self) -> None:
+        """Marks the end of matching and the start of the end of round bookkeeping"""
+        self._bookkeeping_start = time.perf_counter()
+
+    def end_round(self) -> RoundStats:
+        """Marks the end of a round, stops the profilers and publishes the round's RoundStats"""
+        end = time.perf_counter()
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.profiles[self._round] = pstats.Stats(self._profiler, stream=io.StringIO())
+            self._profiler = None
+
+        peak_memory = None
+        if self._tracing_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self._tracing_memory = False
+
+        bookkeeping_start = end if self._bookkeeping_start is None else self._bookkeeping_start
+        round_seconds = end - self._round_start
+        stats = RoundStats(
+            market_round=self._round,
+            match_attempts=self._attempts,
+            matches=self._matches,
+            rejected_by_price=self._rejected_by_price,
+            rejected_by_quantity=self._rejected_by_quantity,
+            round_seconds=round_seconds,
+            matching_seconds=bookkeeping_start - self._round_start - self._settling - self._logging,
+            settling_seconds=self._settling,
+            logging_seconds=self._logging,
+            bookkeeping_seconds=end - bookkeeping_start,
+            peak_memory=peak_memory)
+
+        self.rounds.append(stats)
+        for listener in self._listeners:
+            listener(stats)
+        return stats
+
+    def record_attempt(self, link_details: Union[NamedTuple, None]) -> None:
+        """Counts a pair of agents checked for a match, given the link details the check returned"""
+        self._attempts += 1
+        if link_details is None:
+            self._rejected_by_price += 1
+        elif link_details.energy <= 0:
+            self._rejected_by_quantity += 1
+
+    def record_attempts(self, attempts: int, rejected_by_price: int, rejected_by_quantity: int) -> None:
+        """Counts match attempts made in bulk, e.g. by an order book"""
+        self._attempts += attempts
+        self._rejected_by_price += rejected_by_price
+        self._rejected_by_quantity += rejected_by_quantity
+
+    def record_commerce(self, settling_seconds: float, logging_seconds: float, trades: int = 1) -> None:
+        """Counts transactions with the time spent settling them and writing them to the ledger"""
+        self._matches += trades
+        self._settling += settling_seconds
+        self._logging += logging_seconds
+
+    def totals(self) -> dict[str, float]:
+        """Returns: The sum of every counter and timing over all the rounds so far"""
+        totals = dict.fromkeys(RoundStats._fields[1:-1], 0)
+        for stats in self.rounds:
+            for field in totals:
+                totals[field] += getattr(stats, field)
+        return totals
+
+    def summary(self) -> str:
+        """Returns: A table with one line per round and a line of totals"""
+        header = f"{'round':>6} {'attempts':>10} {'matches':>8} {'rej.price':>10} {'rej.qty':>8} " \
+                 f"{'round s':>9} {'match s':>9} {'settle s':>9} {'log s':>9} {'books s':>9}"
+        lines = [header, "-" * len(header)]
+        rows = [(str(stats.market_round), stats) for stats in self.rounds]
+        rows.append(("total", RoundStats(0, **self.totals(), peak_memory=None)))
+        for label, stats in rows:
+            lines.append(
+                f"{label:>6} {stats.match_attempts:>10} {stats.matches:>8} {stats.rejected_by_price:>10} "
+                f"{stats.rejected_by_quantity:>8} {stats.round_seconds:>9.4f} {stats.matching_seconds:>9.4f} "
+                f"{stats.settling_seconds:>9.4f} {stats.logging_seconds:>9.4f} {stats.bookkeeping_seconds:>9.4f}")
+        return "\n".join(lines)
+
+    def profile_report(self, market_round: int, sort: str = "cumulative", limit: int = 20) -> str:
+        """Returns: The cProfile report of a profiled round"""
+        stats = self.profiles[market_round]
+        stats.stream = io.StringIO()
+        stats.sort_stats(sort).print_stats(limit)
+        return stats.stream.getvalue()
@@ -2,29 +2,124 @@
 This file contains code to maintain a ledger.
 """
 
-from typing import Union
-from excel_readwrite import write_data_to_excel
+from typing import Callable, Union
+import warnings
+import numpy as np
+
+import CONSTANTS
+from ColumnarLedger import AgentPnL, ColumnarLedger, ColumnarLedgerSink
+from LedgerSink import LedgerSink
+from excel_readwrite import write_rows_to_excel
 
 class Ledger:
     """
     Class ledger representing ledger
+
+    Entries are handed to a LedgerSink that batches them, the excel file at path is only written once when the
+    ledger is closed.
     """
 
-    def __init__(self, path:str, headers: Union[list[str], tuple[str]]) -> None:
+    def __init__(self, path:str, headers: Union[list[str], tuple[str]], sink: LedgerSink = None) -> None:
         self._path = path
-        self._enteries = 0
-        write_data_to_excel(self._path, headers)
+        self._headers = list(headers)
+        self._sink = LedgerSink.create(CONSTANTS.LEDGER_SINK, path, headers) if sink is None else sink
+        self._enteries = self._sink.rows_written
+        self._listeners: list[Callable[[list], None]] = []
 
-    def add_entry(self, entry: Union[dict[str, list], list, tuple]) -> None:
+    def add_listener(self, listener: Callable[[list], None]) -> None:
+        """Adds a callable receiving the list of entries every time entries are added, e.g. to record a trace"""
+        self._listeners.append(listener)
+
+    def add_entry(self, entry: Union[dict[str, object], list, tuple]) -> None:
         """
-        Functions appends to the currently in use excel file
+        Functions appends an entry to the ledger
 
         Paramters:
-        entry: Data to add
+        entry: Data to add, either the values of all the columns in order or a dict mapping headers to values
         """
-        write_data_to_excel(self._path, entry)
+        if isinstance(entry, dict):
+            entry = [entry[header] for header in self._headers]
+        self._sink.write(entry)
         self._enteries += 1
+        for listener in self._listeners:
+            listener([entry])
+
+    def add_entries(self, entries: list[Union[list, tuple]]) -> None:
+        """
+        Functions appends several entries to the ledger at once
+
+        Paramters:
+        entries: list of entries, each one having the values of all the columns in order
+        """
+        self._sink.write_many(entries)
+        self._enteries += len(entries)
+        for listener in self._listeners:
+            listener(entries)
+
+    def flush(self) -> None:
+        """Writes out the entries buffered by the sink"""
+        self._sink.flush()
+
+    def sync(self) -> None:
+        """Writes out the entries buffered by the sink and waits until they are on disk"""
+        self._sink.sync()
+
+    def close(self, export_excel: bool = None) -> None:
+        """
+        Flushes and closes the sink
+
+        Parameters:
+        export_excel: when True all entries are written to the excel file at path in one go, defaults to
+        CONSTANTS.LEDGER_EXPORT_EXCEL, in which case the export is skipped with a warning when ExcelFileReader isn't
+        installed
+        """
+        self._sink.close()
+        if export_excel is False or not (export_excel or CONSTANTS.LEDGER_EXPORT_EXCEL):
+            return
+        try:
+            write_rows_to_excel(self._path, [self._headers, *self._sink.rows()])
+        except ImportError as error:
+            if export_excel:
+                raise
+            warnings.warn(f"The ledger wasn't exported to {self._path}, ExcelFileReader can't be imported: {error}")
+
+    @property
+    def sink(self) -> LedgerSink:
+        return self._sink
 
     @property
     def enteries(self) -> int:
-        return self._enteries
\ No newline at end of file
+        return self._enteries
+
+    @property
+    def columns(self) -> ColumnarLedger:
+        """
+        Returns: A memory mapped view of the entries written so far, with its indexes up to date.
+        Only available when the ledger is written by a ColumnarLedgerSink.
+        """
+        if not isinstance(self._sink, ColumnarLedgerSink):
+            raise TypeError("Ledger queries need a ledger written by a ColumnarLedgerSink")
+        self._sink.sync()
+        return ColumnarLedger(self._sink.path)
+
+    def trades_of(self, agent_id: int) -> dict[str, np.ndarray]:
+        """Returns: Every column of the entries the agent took part in"""
+        return self.columns.trades_of(agent_id)
+
+    def agent_pnl(self, agent_id: int) -> AgentPnL:
+        """Returns: The money earned and spent and the energy sold and bought by the agent"""
+        return self.columns.agent_pnl(agent_id)
+
+    def round_volume(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns: The rounds that have entries and the energy traded in each of them"""
+        columns = self.columns
+        return columns.rounds, columns.round_volume()
+
+    def round_vwap(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns: The rounds that have entries and the volume weighted average price of energy in each of them"""
+        columns = self.columns
+        return columns.rounds, columns.round_vwap()
+
+    def price_histogram(self, bins: Union[int, np.ndarray] = 10, market_round: int = None) -> tuple[np.ndarray, np.ndarray]:
+        """Returns: The counts and the bin edges of the price per unit of energy, optionally for a single round"""
+        return self.columns.price_histogram(bins, market_round)
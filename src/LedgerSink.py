@@ -0,0 +1,300 @@
+"""
+This file contains the sinks a ledger writes its entries to.
+
+Sinks keep entries in memory and write them out in batches, once enough rows are buffered or enough time has passed
+since the last flush. Batches can optionally be written by a background thread so that the market never waits on
+file I/O.
+
+Classes:
+    LedgerSink: Base class implementing the buffering and the background writer.
+    CSVLedgerSink: Writes entries to a csv file.
+    JSONLinesLedgerSink: Writes entries as one json object per line.
+    SQLiteLedgerSink: Writes entries to a table of a sqlite database.
+    NullLedgerSink: Only counts entries, for measuring the market without the ledger.
+"""
+
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from typing import Iterator, Union
+import csv
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import CONSTANTS
+
+Row = Union[list, tuple]
+
+
+class LedgerSink(ABC):
+    """
+    Base class of all ledger sinks.
+
+    Parameters:
+    path: file the entries are written to
+    headers: names of the columns of an entry
+    flush_rows: number of buffered rows that triggers a flush
+    flush_seconds: time since the last flush after which the next entry triggers a flush
+    background: when True batches are written by a background thread
+    resume_rows: when given the file at path is kept up to that many rows and written on from there, instead of being
+    created anew, e.g. to resume a run from a checkpoint
+    """
+
+    EXTENSION = ""
+
+    def __init__(self, path: str, headers: Row, flush_rows: int = None, flush_seconds: float = None,
+                 background: bool = None, resume_rows: int = None) -> None:
+        self._path = path
+        self._headers = list(headers)
+        self._flush_rows = CONSTANTS.LEDGER_FLUSH_ROWS if flush_rows is None else flush_rows
+        self._flush_seconds = CONSTANTS.LEDGER_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self._buffer: list[Row] = []
+        self._last_flush = time.monotonic()
+        self._rows_written = 0
+        self._closed = False
+
+        if resume_rows is None:
+            self._open()
+        else:
+            self._reopen(resume_rows)
+
+        self._queue: Union[queue.Queue, None] = None
+        self._writer: Union[threading.Thread, None] = None
+        self._writer_error: Union[BaseException, None] = None
+        if CONSTANTS.LEDGER_BACKGROUND_FLUSH if background is None else background:
+            self._queue = queue.Queue()
+            self._writer = threading.Thread(target=self._write_in_background, name="ledger-writer", daemon=True)
+            self._writer.start()
+
+    @staticmethod
+    def create(kind: str, path: str, headers: Row, **kwargs) -> LedgerSink:
+        """
+        Creates a sink of the given kind
+
+        Parameters:
+        kind: one of the keys of SINKS
+        path: file the entries are written to, its extension is replaced by the one of the sink
+        headers: names of the columns of an entry
+        """
+        if kind not in SINKS:
+            raise ValueError(f"No ledger sink with name {kind}")
+        sink_class = SINKS[kind]
+        return sink_class(os.path.splitext(path)[0] + sink_class.EXTENSION, headers, **kwargs)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def headers(self) -> list[str]:
+        return self._headers
+
+    @property
+    def rows_written(self) -> int:
+        """Returns: The number of rows handed over to be written, including those still buffered"""
+        return self._rows_written + len(self._buffer)
+
+    def write(self, row: Row) -> None:
+        """Buffers one row, flushing the buffer if it is full or hasn't been flushed in a while"""
+        self._buffer.append(row)
+        if len(self._buffer) >= self._flush_rows or time.monotonic() - self._last_flush >= self._flush_seconds:
+            self.flush()
+
+    def write_many(self, rows: list[Row]) -> None:
+        """Buffers several rows at once"""
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self._flush_rows or time.monotonic() - self._last_flush >= self._flush_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes out the buffered rows, or hands them to the background writer"""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+
+        rows, self._buffer = self._buffer, []
+        self._rows_written += len(rows)
+        if self._queue is not None:
+            self._raise_writer_error()
+            self._queue.put(rows)
+        else:
+            self._write_rows(rows)
+
+    def sync(self) -> None:
+        """Flushes the buffer and waits until the background writer has written everything"""
+        self.flush()
+        if self._queue is not None:
+            self._queue.join()
+            self._raise_writer_error()
+
+    def close(self) -> None:
+        """Flushes what is left, waits for the background writer and closes the file"""
+        if self._closed:
+            return
+        self.flush()
+        if self._queue is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._raise_writer_error()
+        self._close()
+        self._closed = True
+
+    def _write_in_background(self) -> None:
+        while (rows := self._queue.get()) is not None:
+            try:
+                self._write_rows(rows)
+            except BaseException as error:
+                self._writer_error = error
+            finally:
+                self._queue.task_done()
+
+    def _raise_writer_error(self) -> None:
+        if self._writer_error is not None:
+            raise RuntimeError(f"Writing the ledger to {self._path} failed") from self._writer_error
+
+    def _reopen(self, rows: int) -> None:
+        """Creates the file again with only the first rows it had"""
+        kept = list(itertools.islice(self.rows(), rows)) if rows else []
+        if len(kept) < rows:
+            raise ValueError(f"{self._path} has {len(kept)} rows, can't resume it from row {rows}")
+        self._open()
+        if kept:
+            self._write_rows(kept)
+        self._rows_written = len(kept)
+
+    @abstractmethod
+    def _open(self) -> None:
+        """Creates the file and writes the headers"""
+
+    @abstractmethod
+    def _write_rows(self, rows: list[Row]) -> None:
+        """Writes a batch of rows to the file"""
+
+    @abstractmethod
+    def _close(self) -> None:
+        """Closes the file"""
+
+    @abstractmethod
+    def rows(self) -> Iterator[list]:
+        """Returns: An iterator over the rows written so far, to be used once the sink is flushed"""
+
+
+class CSVLedgerSink(LedgerSink):
+
+    EXTENSION = ".csv"
+
+    def _open(self) -> None:
+        self._file = open(self._path, "w", newline="")
+        self._csv = csv.writer(self._file)
+        self._csv.writerow(self._headers)
+
+    def _write_rows(self, rows: list[Row]) -> None:
+        self._csv.writerows(rows)
+        self._file.flush()
+
+    def _close(self) -> None:
+        self._file.close()
+
+    def rows(self) -> Iterator[list]:
+        with open(self._path, newline="") as file:
+            reader = csv.reader(file)
+            next(reader, None)
+            for row in reader:
+                yield [_parse_number(value) for value in row]
+
+
+class JSONLinesLedgerSink(LedgerSink):
+
+    EXTENSION = ".jsonl"
+
+    def _open(self) -> None:
+        self._file = open(self._path, "w")
+
+    def _write_rows(self, rows: list[Row]) -> None:
+        self._file.writelines(json.dumps(dict(zip(self._headers, row))) + "\n" for row in rows)
+        self._file.flush()
+
+    def _close(self) -> None:
+        self._file.close()
+
+    def rows(self) -> Iterator[list]:
+        with open(self._path) as file:
+            for line in file:
+                entry = json.loads(line)
+                yield [entry[header] for header in self._headers]
+
+
+class SQLiteLedgerSink(LedgerSink):
+
+    EXTENSION = ".sqlite"
+    TABLE = "ledger"
+
+    def _open(self) -> None:
+        if os.path.exists(self._path):
+            os.remove(self._path)
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        columns = ", ".join(f'"{header}"' for header in self._headers)
+        self._connection.execute(f'CREATE TABLE {self.TABLE} ({columns})')
+        self._insert = f'INSERT INTO {self.TABLE} VALUES ({", ".join("?" * len(self._headers))})'
+
+    def _write_rows(self, rows: list[Row]) -> None:
+        with self._connection:
+            self._connection.executemany(self._insert, rows)
+
+    def _close(self) -> None:
+        self._connection.close()
+
+    def rows(self) -> Iterator[list]:
+        connection = sqlite3.connect(self._path)
+        try:
+            for row in connection.execute(f'SELECT * FROM {self.TABLE} ORDER BY rowid'):
+                yield list(row)
+        finally:
+            connection.close()
+
+
+class NullLedgerSink(LedgerSink):
+
+    EXTENSION = ""
+
+    def _open(self) -> None:
+        pass
+
+    def _reopen(self, rows: int) -> None:
+        self._rows_written = rows
+
+    def write(self, row: Row) -> None:
+        self._rows_written += 1
+
+    def write_many(self, rows: list[Row]) -> None:
+        self._rows_written += len(rows)
+
+    def _write_rows(self, rows: list[Row]) -> None:
+        pass
+
+    def _close(self) -> None:
+        pass
+
+    def rows(self) -> Iterator[list]:
+        return iter(())
+
+
+def _parse_number(value: str) -> Union[int, float, str]:
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+SINKS: dict[str, type[LedgerSink]] = {
+    "csv": CSVLedgerSink,
+    "jsonl": JSONLinesLedgerSink,
+    "sqlite": SQLiteLedgerSink,
+    "null": NullLedgerSink,
+}
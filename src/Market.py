@@ -4,29 +4,82 @@ This file contains code to simulate the market for energy interchange.
 
 from __future__ import annotations
 from typing import NamedTuple, Union, Iterable
+import asyncio
+import time
+
+import numpy as np
 
 import CONSTANTS
 from Ledger import Ledger
+from LedgerSink import LedgerSink
 
 from Agent import Agent
+from AgentPopulation import AgentPopulation
+from AsyncBidding import RoundContext, Strategy, passive_strategy, run_round
+from EligibilityIndex import EligibilityIndex
+from GridSettlement import GridSettlement
+from CallAuction import CallAuction, RoundOrders
+from Checkpoint import Checkpoint, Checkpointer
+from Instrumentation import MarketInstrumentation
+from Metrics import MarketMetrics
+from OrderBook import OrderBook
+from Profiles import ProfileStream
+from Screening import Scan, Screening
+from Simulation import Simulation
+from Topology import Topology
+from Trace import TraceRecorder
+from WelfareAllocation import WelfareAllocation
 
 class Market:
-    _instance = None
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
 
-    def __init__(self, max_price: int, min_price: int) -> None:
+    MARKET_MODES = {
+        "ideal_fair": "ideal_fair_market",
+        "real_world": "real_world_market",
+        "order_book": "order_book_market",
+        "call_auction": "call_auction_market",
+        "time_series": "time_series_market",
+        "feeder": "feeder_market",
+        "async": "async_market",
+        "welfare": "welfare_market",
+    }
+
+    def __new__(cls, *args, **kwargs):
+        simulation = Simulation.current()
+        if simulation.market is None:
+            simulation.market = super().__new__(cls)
+            simulation.market.simulation = simulation
+        return simulation.market
+
+    def __init__(self, max_price: int, min_price: int, sink: LedgerSink = None,
+                 instrumentation: MarketInstrumentation = None, checkpointer: Checkpointer = None,
+                 profiles: ProfileStream = None, topology: Topology = None,
+                 grid_settlement: GridSettlement = None, metrics: MarketMetrics = None,
+                 trace: TraceRecorder = None) -> None:
         self._energy_price = 0
-        self._ledger = Ledger(CONSTANTS.LEDGER_FILE_PATH, [
-            "Round", "Buyer ID", "Seller ID", "Energy", "Price", "Money/Energy", "agent1 reserve", "agent2 reserve"])
+        self.max_rounds = CONSTANTS.MAX_MARKET_ROUNDS
+        self.instrumentation = instrumentation
+        self.checkpointer = checkpointer
+        self.profiles = profiles
+        self.topology = topology
+        self.grid_settlement = grid_settlement
+        self.metrics = metrics
+        self.trace = trace
+        self.strategies: dict[Agent, Strategy] = {}
+        self.default_strategy: Strategy = passive_strategy
+        self.round_deadline = CONSTANTS.ROUND_DEADLINE_SECONDS
+        self.max_concurrency = CONSTANTS.MAX_CONCURRENT_STRATEGIES
+        self._mode = None
+        self._ledger = Ledger(CONSTANTS.LEDGER_FILE_PATH, CONSTANTS.LEDGER_HEADERS, sink)
         self.set_energy_prices(max_price, min_price)
 
+    def close(self) -> None:
+        """Flushes and closes the ledger, exporting it to excel, and stops the workers of the topology"""
+        self._ledger.close()
+        if self.topology is not None:
+            self.topology.close()
+
     def set_energy_prices(self, max_price: int, min_price: int) -> None:
-        CONSTANTS.MAX_ENERGY_PRICE = max_price
-        CONSTANTS.MIN_ENERGY_PRICE = min_price
+        self.simulation.set_energy_prices(max_price, min_price)
 
     @staticmethod
     def filter_eligible(agents:list[Agent]) -> Iterable[Agent]:
@@ -37,9 +90,24 @@ class Market:
 
     def do_they_match(self, agent1: Agent, agent2: Agent) -> Union[tuple[int, int], None]:
         """
-        
+        Returns: None if the agents can't trade, otherwise the amount of energy and the price they would trade at
         """
-        return Agent.check_match_for_business(agent1, agent2)
+        link_details = Agent.check_match_for_business(agent1, agent2)
+        if self.instrumentation is not None:
+            self.instrumentation.record_attempt(link_details)
+        if link_details is not None and link_details.energy > 0:
+            return link_details
+
+    def first_match(self, screening: Screening, position: int) -> Union[Scan, None]:
+        """
+        Returns: None if the agent at the position can't trade with any agent after it, otherwise the Scan of the
+        first one it can trade with, giving the amount of energy and the price they would trade at
+        """
+        scan = screening.first_match(position)
+        if self.instrumentation is not None:
+            self.instrumentation.record_attempts(scan.attempts, scan.rejected_by_price, scan.rejected_by_quantity)
+        if scan.match >= 0:
+            return scan
 
     def do_commerce(self, agent1: Agent, agent2: Agent, energy: int, price: int, market_round:int = 1) -> None:
         """
@@ -52,105 +120,476 @@ class Market:
         price: price at which energy is being sold
         market_round: currently which market round we are on
         """
-        (agent1, agent2) = Agent.do_business(agent1, agent2, energy, price)
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            start = time.perf_counter()
+
+        (buyer, seller) = Agent.do_business(agent1, agent2, energy, price)
+        if instrumentation is not None:
+            settled = time.perf_counter()
         
         self._ledger.add_entry(
-            [market_round,  agent2.id, agent1.id, energy, price, price/energy,  agent2.reserve, agent1.reserve])
-
-    def ideal_fair_market(self, buyers: list[Agent], sellers: list[Agent]) -> None:
+            [market_round,  buyer.id, seller.id, energy, price, price/energy,  buyer.reserve, seller.reserve])
+        if instrumentation is not None:
+            instrumentation.record_commerce(settled - start, time.perf_counter() - settled)
+        if self.metrics is not None:
+            self.metrics.record_trade(energy, price)
+
+    def _begin_round(self, market_round: int) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.begin_round(market_round)
+        if self.metrics is not None:
+            self.metrics.begin_round(market_round)
+        if self.trace is not None:
+            self.trace.begin_round(market_round)
+
+    def _begin_bookkeeping(self) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.begin_bookkeeping()
+
+    def _end_round(self) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.end_round()
+        if self.metrics is not None:
+            self.metrics.end_round()
+        if self.trace is not None:
+            self.trace.end_round()
+
+    def _save_checkpoint(self, market_round: int, buyers: list[Agent], sellers: list[Agent]) -> None:
+        """Saves a checkpoint to resume from market_round, if one is due after the round before it"""
+        if self.checkpointer is not None and self.checkpointer.due(market_round - 1):
+            self._ledger.sync()
+            self.checkpointer.save(market_round, buyers, sellers, self._ledger.enteries, self._mode)
+
+    def ideal_fair_market(self, buyers: list[Agent], sellers: list[Agent], start_round: int = 1) -> None:
         """
         This function simulates a ideal market. Both the contenders are restricted to 1 transaction per round.
 
         Parameters:
         buyers: takes a list of buyers or any other Agent extended class that has the ability to buy
         sellers: takes a list of sellers or nay other Agent extended class that has the ability to sell
+        start_round: the round to start from, above 1 when resuming from a checkpoint
         """
 
-        for agent2 in sellers:
-            agent2.generate_energy()
+        if start_round == 1:
+            for agent2 in sellers:
+                agent2.generate_energy()
 
-        market_round = 1
+        market_round = start_round
         all_agents = buyers + sellers
 
-        while market_round < CONSTANTS.MAX_MARKET_ROUNDS:
-            all_agents_cpy, buyer_idx = list(Market.filter_eligible(all_agents)), 0
-            # count = 0
-            while buyer_idx < len(all_agents_cpy):
-                if not all_agents_cpy[buyer_idx].eligible:
+        eligibility = EligibilityIndex(all_agents)
+
+        while market_round < self.max_rounds:
+            self._begin_round(market_round)
+            screening, buyer_idx = Screening(eligibility.eligible()), 0
+            while buyer_idx < len(screening):
+                if not eligibility.is_eligible(screening.agents[buyer_idx]):
                     buyer_idx += 1
                     continue
-                # print(count, buyer_idx)
-                # count += 1
-
-                seller_idx = buyer_idx + 1
-                while seller_idx < len(all_agents_cpy):
-                    if (link_details := self.do_they_match(all_agents_cpy[buyer_idx], all_agents_cpy[seller_idx])) is not None:
-                        self.do_commerce(all_agents_cpy[buyer_idx], all_agents_cpy[seller_idx], link_details.energy, link_details.price)
-
-                        break
 
-                    seller_idx += 1
+                if (scan := self.first_match(screening, buyer_idx)) is not None:
+                    self.do_commerce(screening.agents[buyer_idx], screening.agents[scan.match], scan.energy, scan.price, market_round)
                 else:
                     buyer_idx += 1
 
+            self._begin_bookkeeping()
             market_round += 1
             Agent.reset_states(buyers)
             Agent.reset_states(sellers)
-            print(market_round)
+            self.update_energy(all_agents, market_round - 1, update=False)
+            self._end_round()
+            self._save_checkpoint(market_round, buyers, sellers)
 
-    def real_world_market(self, buyers: list[Agent], sellers: list[Agent]) -> None:
+        eligibility.close()
+
+    def real_world_market(self, buyers: list[Agent], sellers: list[Agent], start_round: int = 1) -> None:
         """
         This function simulates a real world market. Both the contenders are not restricted to 1 transaction per round.
 
         Parameters:
         buyers: takes a list of buyers or any other Agent extended class that has the ability to buy
         sellers: takes a list of sellers or nay other Agent extended class that has the ability to sell
+        start_round: the round to start from, above 1 when resuming from a checkpoint
         """
-        for agent2 in sellers:
-            agent2.generate_energy()
+        if start_round == 1:
+            for agent2 in sellers:
+                agent2.generate_energy()
 
-        market_round = 1
+        market_round = start_round
         all_agents = buyers + sellers
 
-        while market_round < CONSTANTS.MAX_MARKET_ROUNDS:
-            all_agents_cpy, buyer_idx = list(Market.filter_eligible(all_agents)), 0
-            # count = 0
-            while buyer_idx < len(all_agents_cpy):
-                if not all_agents_cpy[buyer_idx].eligible:
+        eligibility = EligibilityIndex(all_agents)
+
+        while market_round < self.max_rounds:
+            self._begin_round(market_round)
+            screening, buyer_idx = Screening(eligibility.eligible()), 0
+            while buyer_idx < len(screening):
+                if not eligibility.is_eligible(screening.agents[buyer_idx]):
                     buyer_idx += 1
                     continue
-                # print(count, buyer_idx)
-                # count += 1
-
-                seller_idx = buyer_idx + 1
-                while seller_idx < len(all_agents_cpy):
-                    if (link_details := self.do_they_match(all_agents_cpy[buyer_idx], all_agents_cpy[seller_idx])) is not None:
-                        self.do_commerce(all_agents_cpy[buyer_idx], all_agents_cpy[seller_idx], link_details.energy, link_details.price, market_round)
-
-                        (lower_idx, higher_idx) = (seller_idx, buyer_idx) if buyer_idx > seller_idx else (buyer_idx, seller_idx)
 
-                        for idx in (higher_idx, lower_idx):
-                            participant = all_agents_cpy.pop(idx)
-                            if participant.eligible:
-                                # Buyer/Seller is shifted to the end of line if it is still eligible 
-                                all_agents_cpy.append(participant)
+                if (scan := self.first_match(screening, buyer_idx)) is not None:
+                    seller_idx = scan.match
+                    self.do_commerce(screening.agents[buyer_idx], screening.agents[seller_idx], scan.energy, scan.price, market_round)
 
-                        break
+                    (lower_idx, higher_idx) = (seller_idx, buyer_idx) if buyer_idx > seller_idx else (buyer_idx, seller_idx)
 
-                    seller_idx += 1
+                    for idx in (higher_idx, lower_idx):
+                        participant = screening.pop(idx)
+                        if eligibility.is_eligible(participant):
+                            # Buyer/Seller is shifted to the end of line if it is still eligible 
+                            screening.append(participant)
                 else:
                     buyer_idx += 1
 
+            self._begin_bookkeeping()
+            market_round += 1
+            Agent.reset_states(buyers)
+            Agent.reset_states(sellers)
+            self.update_energy(all_agents, market_round - 1)
+
+            self._end_round()
+            self._save_checkpoint(market_round, buyers, sellers)
+
+        eligibility.close()
+
+    def update_energy(self, agents: list[Agent], market_round: int, update: bool = True,
+                      consumed: bool = False) -> None:
+        """
+        Ends a round for the energy of the agents. Every agent generates whatever it can produce and consumes its
+        load, what their batteries couldn't cover or hold is settled with the grid when grid_settlement is set, and the
+        round of the batteries ends, draining their spill to the grid. When agents didn't consume during the round, the
+        load that buyers can't cover is imported instead of what their batteries fell short of.
+
+        Parameters:
+        agents: the agents of the market
+        market_round: the round that ends
+        update: when False the agents neither generate nor consume, e.g. when the mode doesn't update energy
+        consumed: when True the agents already consumed their load during the round, e.g. in the time_series mode
+        """
+        for population, rows in AgentPopulation.group(agents).items():
+            if update:
+                population.generate_energy(rows)
+                population.consume_energy(rows)
+            # Without consuming, batteries don't fall short, so the load buyers can't cover is what goes unmet
+            unmet = population.shortfall[rows] if update or consumed else population.unmet_load(rows)
+            if self.metrics is not None:
+                self.metrics.record_population(population, rows, unmet)
+            if self.grid_settlement is not None:
+                self.grid_settlement.settle(population, rows, market_round, unmet)
+            population.batteries.end_round(rows)
+
+        if self.grid_settlement is not None:
+            self.grid_settlement.end_round(market_round)
+
+    def order_book_market(self, buyers: list[Agent], sellers: list[Agent], restricted: bool = False,
+                          start_round: int = 1) -> None:
+        """
+        This function simulates a market where counterparties are found through a price sorted order book instead of
+        checking every pair of agents.
+
+        Parameters:
+        buyers: takes a list of buyers or any other Agent extended class that has the ability to buy
+        sellers: takes a list of sellers or any other Agent extended class that has the ability to sell
+        restricted: when True agents leave the book after their first transaction of the round and no energy is
+        generated or consumed between rounds, like in ideal_fair_market. Otherwise agents go back into the book
+        while they are still eligible, like in real_world_market.
+        start_round: the round to start from, above 1 when resuming from a checkpoint
+        """
+        if start_round == 1:
+            for agent2 in sellers:
+                agent2.generate_energy()
+
+        market_round = start_round
+        all_agents = buyers + sellers
+
+        eligibility = EligibilityIndex(all_agents)
+
+        while market_round < self.max_rounds:
+            self._begin_round(market_round)
+            order_book = OrderBook()
+            order_book.submit_all(eligibility.eligible())
+
+            while (match := order_book.best_match()) is not None:
+                buyer, seller, link_details = match
+                self.do_commerce(buyer, seller, link_details.energy, link_details.price, market_round)
+
+                if not restricted:
+                    order_book.submit(buyer)
+                    order_book.submit(seller)
+
+            if self.instrumentation is not None:
+                self.instrumentation.record_attempts(
+                    order_book.attempts, order_book.rejected_by_price, order_book.rejected_by_quantity)
+
+            self._begin_bookkeeping()
+            market_round += 1
+            Agent.reset_states(buyers)
+            Agent.reset_states(sellers)
+            self.update_energy(all_agents, market_round - 1, update=not restricted)
+
+            self._end_round()
+            self._save_checkpoint(market_round, buyers, sellers)
+
+        eligibility.close()
+
+    def _clear_call_auction(self, agents: list[Agent], market_round: int) -> None:
+        """Clears one round of a uniform price call auction among the given agents and records the trades"""
+        auction = CallAuction()
+        auction.submit_all(agents)
+        self._settle_auction(auction, auction.clear(), market_round)
+
+    def _settle_auction(self, auction: RoundOrders, trades: list, market_round: int) -> None:
+        """Settles a cleared call auction or welfare allocation and records its trades, each at its price per unit"""
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            start = time.perf_counter()
+        auction.settle()
+        if instrumentation is not None:
+            settled = time.perf_counter()
+
+        if trades:
+            self._ledger.add_entries([
+                [market_round, trade.buyer_pool.id[trade.buyer_row].item(), trade.seller_pool.id[trade.seller_row].item(),
+                 trade.energy, trade.energy * price, price, trade.buyer_pool.charge[trade.buyer_row].item(),
+                 trade.seller_pool.charge[trade.seller_row].item()]
+                for trade, price in zip(trades, auction.prices.tolist())])
+
+        if instrumentation is not None:
+            orders = auction.bids + auction.asks
+            instrumentation.record_attempts(orders, orders - auction.traded, 0)
+            instrumentation.record_commerce(settled - start, time.perf_counter() - settled, len(trades))
+        if self.metrics is not None and trades:
+            self.metrics.record_trades(np.array([trade.energy for trade in trades]), auction.prices)
+
+    def call_auction_market(self, buyers: list[Agent], sellers: list[Agent], start_round: int = 1) -> None:
+        """
+        This function simulates a market cleared once per round by a uniform price call auction. Every eligible agent
+        places one order, everyone who trades does so at the single price that trades the most energy, and the round
+        is then settled for all agents at once.
+
+        Parameters:
+        buyers: takes a list of buyers or any other Agent extended class that has the ability to buy
+        sellers: takes a list of sellers or any other Agent extended class that has the ability to sell
+        start_round: the round to start from, above 1 when resuming from a checkpoint
+        """
+        if start_round == 1:
+            for agent2 in sellers:
+                agent2.generate_energy()
+
+        market_round = start_round
+        all_agents = buyers + sellers
+
+        while market_round < self.max_rounds:
+            self._begin_round(market_round)
+            self._clear_call_auction(all_agents, market_round)
+
+            self._begin_bookkeeping()
+            market_round += 1
+            Agent.reset_states(buyers)
+            Agent.reset_states(sellers)
+            self.update_energy(all_agents, market_round - 1)
+
+            self._end_round()
+            self._save_checkpoint(market_round, buyers, sellers)
+
+    def welfare_market(self, buyers: list[Agent], sellers: list[Agent], start_round: int = 1) -> None:
+        """
+        This function simulates an ideal market allocated once per round for the most surplus. Every eligible agent
+        places one order, the orders are matched as a whole so that the trades add up to the most surplus, whatever
+        the order of the agents, and every buyer pays the selling price of the sellers it buys from.
+
+        Parameters:
+        buyers: takes a list of buyers or any other Agent extended class that has the ability to buy
+        sellers: takes a list of sellers or any other Agent extended class that has the ability to sell
+        start_round: the round to start from, above 1 when resuming from a checkpoint
+        """
+        if start_round == 1:
+            for agent2 in sellers:
+                agent2.generate_energy()
+
+        market_round = start_round
+        all_agents = buyers + sellers
+
+        while market_round < self.max_rounds:
+            self._begin_round(market_round)
+            allocation = WelfareAllocation()
+            allocation.submit_all(all_agents)
+            self._settle_auction(allocation, allocation.allocate(), market_round)
+
+            self._begin_bookkeeping()
+            market_round += 1
+            Agent.reset_states(buyers)
+            Agent.reset_states(sellers)
+            self.update_energy(all_agents, market_round - 1, update=False)
+
+            self._end_round()
+            self._save_checkpoint(market_round, buyers, sellers)
+
+    def feeder_market(self, buyers: list[Agent], sellers: list[Agent], start_round: int = 1) -> None:
+        """
+        This function simulates a market on a grid split into feeders. Every round each feeder is cleared on its own
+        by a call auction, then what is left is cleared across feeders within the capacity of their lines.
+
+        Parameters:
+        buyers: takes a list of buyers or any other Agent extended class that has the ability to buy
+        sellers: takes a list of sellers or any other Agent extended class that has the ability to sell
+        start_round: the round to start from, above 1 when resuming from a checkpoint
+        """
+        if self.topology is None:
+            raise ValueError("The feeder market needs a topology, set Market.topology to a Topology")
+
+        if start_round == 1:
+            for agent2 in sellers:
+                agent2.generate_energy()
+
+        market_round = start_round
+        all_agents = buyers + sellers
+
+        while market_round < self.max_rounds:
+            self._begin_round(market_round)
+            auctions = self.topology.local_auctions(all_agents)
+            for auction, trades in zip(auctions, self.topology.clear_locally(auctions)):
+                self._settle_auction(auction, trades, market_round)
+            self._settle_auction(*self.topology.balance(auctions), market_round)
+
+            self._begin_bookkeeping()
+            market_round += 1
+            Agent.reset_states(buyers)
+            Agent.reset_states(sellers)
+            self.update_energy(all_agents, market_round - 1)
+
+            self._end_round()
+            self._save_checkpoint(market_round, buyers, sellers)
+
+    def time_series_market(self, buyers: list[Agent], sellers: list[Agent], start_round: int = 1) -> None:
+        """
+        This function simulates a market driven by load and generation profiles, where every round is one timestep
+        of the profiles. At the start of a round every agent takes its load and generation of the timestep and
+        generates its energy, the round is cleared by a call auction and the load is consumed at the end of it.
+        The run ends after max_rounds - 1 rounds or when the profiles run out.
+
+        Parameters:
+        buyers: takes a list of buyers or any other Agent extended class that has the ability to buy
+        sellers: takes a list of sellers or any other Agent extended class that has the ability to sell
+        start_round: the round to start from, above 1 when resuming from a checkpoint
+        """
+        if self.profiles is None:
+            raise ValueError("The time_series market needs profiles, set Market.profiles to a ProfileStream")
+
+        market_round = start_round
+        all_agents = buyers + sellers
+        groups = AgentPopulation.group(all_agents)
+        last_round = min(self.max_rounds, self.profiles.timesteps + 1)
+
+        while market_round < last_round:
+            self._begin_round(market_round)
+            self.profiles.apply(market_round - 1)
+            for population, rows in groups.items():
+                population.generate_energy(rows)
+
+            self._clear_call_auction(all_agents, market_round)
+
+            self._begin_bookkeeping()
             market_round += 1
             Agent.reset_states(buyers)
             Agent.reset_states(sellers)
-            
-            for agent in all_agents:
-                try:
-                    agent.generate_energy()
-                finally:
-                    agent.consume_energy()
-            
-            print(market_round)
+            for population, rows in groups.items():
+                population.consume_energy(rows)
+            self.update_energy(all_agents, market_round - 1, update=False, consumed=True)
 
+            self._end_round()
+            self._save_checkpoint(market_round, buyers, sellers)
+
+    def async_market(self, buyers: list[Agent], sellers: list[Agent], start_round: int = 1) -> None:
+        """
+        This function simulates a market where every agent is driven by a strategy coroutine placing and cancelling
+        its orders in a shared order book. Strategies run concurrently, at most max_concurrency at a time, until
+        round_deadline seconds have passed, and orders are matched as soon as they arrive. The strategy of an agent
+        is looked up in strategies and defaults to default_strategy.
+
+        Parameters:
+        buyers: takes a list of buyers or any other Agent extended class that has the ability to buy
+        sellers: takes a list of sellers or any other Agent extended class that has the ability to sell
+        start_round: the round to start from, above 1 when resuming from a checkpoint
+        """
+        asyncio.run(self._async_market(buyers, sellers, start_round))
+
+    async def _async_market(self, buyers: list[Agent], sellers: list[Agent], start_round: int) -> None:
+        if start_round == 1:
+            for agent2 in sellers:
+                agent2.generate_energy()
+
+        market_round = start_round
+        all_agents = buyers + sellers
+
+        eligibility = EligibilityIndex(all_agents)
+
+        def strategy_for(agent: Agent) -> Strategy:
+            return self.strategies.get(agent, self.default_strategy)
+
+        def on_match(buyer: Agent, seller: Agent, link_details: NamedTuple) -> None:
+            self.do_commerce(buyer, seller, link_details.energy, link_details.price, market_round)
+
+        while market_round < self.max_rounds:
+            self._begin_round(market_round)
+            order_book = OrderBook()
+            context = RoundContext(order_book, market_round, time.monotonic() + self.round_deadline, on_match)
+            await run_round(eligibility.eligible(), strategy_for, context, self.max_concurrency)
+
+            if self.instrumentation is not None:
+                self.instrumentation.record_attempts(
+                    order_book.attempts, order_book.rejected_by_price, order_book.rejected_by_quantity)
+
+            self._begin_bookkeeping()
+            market_round += 1
+            Agent.reset_states(buyers)
+            Agent.reset_states(sellers)
+            self.update_energy(all_agents, market_round - 1)
+
+            self._end_round()
+            self._save_checkpoint(market_round, buyers, sellers)
+
+        eligibility.close()
+
+    def run(self, buyers: list[Agent], sellers: list[Agent], mode: str = None, start_round: int = 1) -> None:
+        """
+        Runs the market in the given mode, within the simulation the market belongs to.
+
+        The call_auction, time_series, welfare and feeder modes charge energy * price for a trade, price being per unit of energy.
+        The bilateral modes charge the seller's selling price once per trade whatever the energy, as Agent.do_business
+        always did. Every ledger entry holds the money paid in its Price column and the money per unit in its
+        Money/Energy column, so money totals are only comparable between modes that charge the same way.
+
+        Parameters:
+        buyers: takes a list of buyers or any other Agent extended class that has the ability to buy
+        sellers: takes a list of sellers or any other Agent extended class that has the ability to sell
+        mode: one of the keys of MARKET_MODES, defaults to CONSTANTS.MARKET_MODE
+        start_round: the round to start from, above 1 when resuming from a checkpoint
+        """
+        mode = CONSTANTS.MARKET_MODE if mode is None else mode
+        if mode not in Market.MARKET_MODES:
+            raise ValueError(f"No market mode with name {mode}")
+        self._mode = mode
+        with self.simulation.activate():
+            if self.trace is not None:
+                self.trace.start(buyers, sellers, mode, start_round, self.max_rounds, self._ledger)
+            try:
+                getattr(self, Market.MARKET_MODES[mode])(buyers, sellers, start_round=start_round)
+            finally:
+                if self.trace is not None:
+                    self.trace.stop()
+
+    def resume(self, checkpoint: Checkpoint, mode: str = None) -> None:
+        """
+        Runs the rest of a checkpointed simulation. The market should write to checkpoint.ledger_sink() so that the
+        ledger goes on from the entries written before the checkpoint.
+
+        Parameters:
+        checkpoint: the checkpoint returned by Checkpointer.load
+        mode: the market mode, defaults to the one of the checkpointed run
+        """
+        mode = checkpoint.mode if mode is None else mode
+        self.run(checkpoint.buyers, checkpoint.sellers, mode, checkpoint.market_round)
 
@@ -0,0 +1,305 @@
+"""
+This file contains streaming metrics of a running market, kept up to date as trades settle.
+
+Every aggregate is updated in constant time per trade and takes constant memory whatever the length of the run: totals
+and extremes are running values and price quantiles come from a logarithmic sketch, whose number of buckets only
+depends on the range of prices and the accuracy asked for. At the end of every round the metrics are published as a
+RoundMetrics event to the listeners and rendered in the Prometheus text format, which a MetricsServer serves over HTTP
+so that dashboards can follow a long run without reading the ledger.
+"""
+
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable, NamedTuple, Union
+import math
+import threading
+
+import numpy as np
+
+from Grid import Grid
+
+
+class QuantileSketch:
+    """
+    Streaming quantiles of positive values with a bounded relative error, in the manner of DDSketch.
+
+    Values are counted in buckets whose bounds grow geometrically, so a quantile is known to within relative_accuracy
+    of its true value and the number of buckets grows with the logarithm of the range of values only.
+
+    Parameters:
+    relative_accuracy: the largest relative error of a quantile
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets: dict[int, float] = {}
+        self.count = 0.0
+
+    def add(self, value: float, count: float = 1) -> None:
+        """Counts a value count times"""
+        if value <= 0:
+            return
+        bucket = math.ceil(math.log(value) / self._log_gamma)
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+        self.count += count
+
+    def add_many(self, values: np.ndarray, counts: np.ndarray = None) -> None:
+        """Counts every value, counts[i] times when counts are given"""
+        values = np.asarray(values, dtype=np.float64)
+        counts = np.ones(len(values)) if counts is None else np.asarray(counts, dtype=np.float64)
+        positive = values > 0
+        buckets = np.ceil(np.log(values[positive]) / self._log_gamma).astype(np.int64)
+        unique, inverse = np.unique(buckets, return_inverse=True)
+        for bucket, count in zip(unique.tolist(), np.bincount(inverse, counts[positive]).tolist()):
+            self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+        self.count += counts[positive].sum().item()
+
+    def quantile(self, q: float) -> float:
+        """Returns: The q-quantile of the values counted so far, NaN when there are none"""
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = 0.0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen > rank:
+                return 2 * self._gamma ** bucket / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._buckets) / (self._gamma + 1)
+
+
+class RoundMetrics(NamedTuple):
+    market_round: int
+    trades: int
+    volume: float                   # energy traded during the round
+    money: float                    # money paid during the round
+    vwap: float                     # volume weighted average price per unit of the round
+    min_price: float
+    max_price: float
+    price_quantiles: dict[float, float]     # price per unit quantiles over the whole run
+    total_trades: int
+    total_volume: float
+    total_money: float
+    unserved_buyers: int            # agents whose load wasn't fully covered at the end of the round
+    grid_drain: float               # energy drained to the grid over the whole run
+    mean_wealth: float
+    wealth_std: float
+    wealth_gini: float
+
+
+class MarketMetrics:
+    """
+    Running aggregates of the trades and of the agents of a market.
+
+    Parameters:
+    quantiles: the quantiles of the price per unit to report
+    relative_accuracy: the largest relative error of the reported quantiles
+    listeners: callables receiving every RoundMetrics as soon as its round is over
+    """
+
+    def __init__(self, quantiles: Iterable[float] = (0.05, 0.5, 0.95), relative_accuracy: float = 0.01,
+                 listeners: Iterable[Callable[[RoundMetrics], None]] = ()) -> None:
+        self.quantiles = tuple(quantiles)
+        self.prices = QuantileSketch(relative_accuracy)
+        self.last: Union[RoundMetrics, None] = None
+        self._listeners = list(listeners)
+        self._exposition = ""
+        self._total_trades = 0
+        self._total_volume = 0.0
+        self._total_money = 0.0
+        self._min_price = math.inf
+        self._max_price = -math.inf
+        self._price_sum = 0.0
+        self._reset_round(0)
+
+    def _reset_round(self, market_round: int) -> None:
+        self._round = market_round
+        self._trades = 0
+        self._volume = 0.0
+        self._money = 0.0
+        self._round_min = math.inf
+        self._round_max = -math.inf
+        self._unserved = 0
+        self._wealth: list[np.ndarray] = []
+
+    def add_listener(self, listener: Callable[[RoundMetrics], None]) -> None:
+        """Adds a callable receiving every RoundMetrics as soon as its round is over"""
+        self._listeners.append(listener)
+
+    def begin_round(self, market_round: int) -> None:
+        self._reset_round(market_round)
+
+    def record_trade(self, energy: float, money: float) -> None:
+        """Adds a trade of the given energy for the given money"""
+        if energy <= 0:
+            return
+        price = money / energy
+        self._trades += 1
+        self._volume += energy
+        self._money += money
+        self._round_min = min(self._round_min, price)
+        self._round_max = max(self._round_max, price)
+        self.prices.add(price)
+        self._price_sum += price
+
+    def record_trades(self, energy: np.ndarray, price: Union[float, np.ndarray]) -> None:
+        """
+        Adds trades of the given energies, at a price per unit each or all at the same price, e.g. those of a call
+        auction
+        """
+        energy = np.asarray(energy, dtype=np.float64)
+        price = np.broadcast_to(np.asarray(price, dtype=np.float64), energy.shape)
+        traded = energy > 0
+        energy, price = energy[traded], price[traded]
+        if not len(energy):
+            return
+        self._trades += len(energy)
+        self._volume += energy.sum().item()
+        self._money += (energy * price).sum().item()
+        self._round_min = min(self._round_min, price.min().item())
+        self._round_max = max(self._round_max, price.max().item())
+        self.prices.add_many(price)
+        self._price_sum += price.sum().item()
+
+    def record_population(self, population, rows: np.ndarray, unmet: np.ndarray = None) -> None:
+        """
+        Takes the state of the given rows of a population at the end of the round, before their batteries' round ends
+
+        Parameters:
+        unmet: load every row couldn't cover, defaults to what its battery fell short of when consuming it, see
+        AgentPopulation.unmet_load for modes that don't consume
+        """
+        unmet = population.shortfall[rows] if unmet is None else unmet
+        self._unserved += int(np.count_nonzero(unmet > 0))
+        self._wealth.append(population.money[rows])
+
+    def end_round(self) -> RoundMetrics:
+        """Publishes the metrics of the round"""
+        self._total_trades += self._trades
+        self._total_volume += self._volume
+        self._total_money += self._money
+        self._min_price = min(self._min_price, self._round_min)
+        self._max_price = max(self._max_price, self._round_max)
+
+        wealth = np.concatenate(self._wealth) if self._wealth else np.zeros(0)
+        metrics = RoundMetrics(
+            market_round=self._round,
+            trades=self._trades,
+            volume=self._volume,
+            money=self._money,
+            vwap=self._money / self._volume if self._volume > 0 else math.nan,
+            min_price=self._round_min if self._trades else math.nan,
+            max_price=self._round_max if self._trades else math.nan,
+            price_quantiles={q: self.prices.quantile(q) for q in self.quantiles},
+            total_trades=self._total_trades,
+            total_volume=self._total_volume,
+            total_money=self._total_money,
+            unserved_buyers=self._unserved,
+            grid_drain=float(Grid().get_drained_energy()),
+            mean_wealth=wealth.mean().item() if len(wealth) else math.nan,
+            wealth_std=wealth.std().item() if len(wealth) else math.nan,
+            wealth_gini=gini(wealth))
+
+        self.last = metrics
+        self._exposition = self.render(metrics)
+        self._wealth = []
+        for listener in self._listeners:
+            listener(metrics)
+        return metrics
+
+    def render(self, metrics: RoundMetrics = None) -> str:
+        """Returns: The metrics of a round, the last one by default, in the Prometheus text exposition format"""
+        metrics = self.last if metrics is None else metrics
+        if metrics is None:
+            return ""
+        families = [
+            ("p2p_market_round", "gauge", "Last market round completed", metrics.market_round),
+            ("p2p_trades_total", "counter", "Trades settled", metrics.total_trades),
+            ("p2p_energy_traded_total", "counter", "Energy traded", metrics.total_volume),
+            ("p2p_money_traded_total", "counter", "Money paid for energy", metrics.total_money),
+            ("p2p_round_trades", "gauge", "Trades settled in the last round", metrics.trades),
+            ("p2p_round_energy_traded", "gauge", "Energy traded in the last round", metrics.volume),
+            ("p2p_round_vwap", "gauge", "Volume weighted average price of the last round", metrics.vwap),
+            ("p2p_vwap", "gauge", "Volume weighted average price of the run",
+             metrics.total_money / metrics.total_volume if metrics.total_volume > 0 else math.nan),
+            ("p2p_price_min", "gauge", "Lowest price per unit of the run",
+             self._min_price if metrics.total_trades else math.nan),
+            ("p2p_price_max", "gauge", "Highest price per unit of the run",
+             self._max_price if metrics.total_trades else math.nan),
+            ("p2p_unserved_buyers", "gauge", "Agents whose load wasn't covered in the last round",
+             metrics.unserved_buyers),
+            ("p2p_grid_drained_energy_total", "counter", "Energy drained to the grid", metrics.grid_drain),
+            ("p2p_wealth_mean", "gauge", "Mean money of the agents", metrics.mean_wealth),
+            ("p2p_wealth_std", "gauge", "Standard deviation of the money of the agents", metrics.wealth_std),
+            ("p2p_wealth_gini", "gauge", "Gini coefficient of the money of the agents", metrics.wealth_gini),
+        ]
+        lines = []
+        for name, kind, description, value in families:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}", f"{name} {_format(value)}"]
+        lines += ["# HELP p2p_price Price per unit of the trades of the run", "# TYPE p2p_price summary"]
+        lines += [f'p2p_price{{quantile="{q:g}"}} {_format(value)}' for q, value in metrics.price_quantiles.items()]
+        lines += [f"p2p_price_sum {_format(self._price_sum)}", f"p2p_price_count {metrics.total_trades}"]
+        return "\n".join(lines) + "\n"
+
+    @property
+    def exposition(self) -> str:
+        """Returns: The Prometheus text of the last round, rendered when the round ended"""
+        return self._exposition
+
+
+def gini(values: np.ndarray) -> float:
+    """Returns: The Gini coefficient of non-negative values, NaN for an empty or all zero array"""
+    values = np.sort(np.maximum(np.asarray(values, dtype=np.float64), 0))
+    total = values.sum()
+    if not len(values) or total <= 0:
+        return math.nan
+    ranks = np.arange(1, len(values) + 1)
+    return (2 * (ranks * values).sum() / (len(values) * total) - (len(values) + 1) / len(values)).item()
+
+
+def _format(value: float) -> str:
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsServer:
+    """
+    Serves the metrics of a market in the Prometheus text format at http://host:port/metrics, from a daemon thread.
+
+    Parameters:
+    metrics: the metrics to serve
+    host: address to listen on, the local machine only by default
+    port: port to listen on, 0 for any free port
+    """
+
+    def __init__(self, metrics: MarketMetrics, host: str = "127.0.0.1", port: int = 9108) -> None:
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.exposition.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def close(self) -> None:
+        """Stops serving"""
+        self._server.shutdown()
+        self._server.server_close()
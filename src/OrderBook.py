@@ -0,0 +1,139 @@
+"""
+This file contains a price sorted order book used to match buyers and sellers without scanning every pair.
+"""
+
+from __future__ import annotations
+from itertools import count
+from typing import NamedTuple, Union
+import heapq
+
+from Agent import Agent
+
+
+class Order(NamedTuple):
+    key: float
+    sequence: int
+    agent: Agent
+
+
+class OrderBook:
+    """
+    Class representing the bid and ask books of one market round.
+
+    Bids are kept highest buying price first and asks lowest selling price first. Whether the two orders at the
+    top of the books cross is decided by the agents themselves, i.e. on the prices adjusted by their state's
+    modulation factor and their tolerance. Every look at the top of the books either produces a match or
+    discards an order that can no longer trade with anything left in the book, so a round costs O(n log n).
+    """
+
+    def __init__(self) -> None:
+        self._bids: list[Order] = []
+        self._asks: list[Order] = []
+        self._live: dict[Agent, int] = {}     # sequence number of the order every agent has in the book
+        self._sequence = count()
+        self.attempts = 0
+        self.rejected_by_price = 0
+        self.rejected_by_quantity = 0
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    @property
+    def bids(self) -> int:
+        """Returns: The number of orders on the bid side, including cancelled ones not yet dropped"""
+        return len(self._bids)
+
+    @property
+    def asks(self) -> int:
+        """Returns: The number of orders on the ask side, including cancelled ones not yet dropped"""
+        return len(self._asks)
+
+    def submit(self, agent: Agent) -> bool:
+        """
+        Places an order for the agent on the side of the book it currently trades on, replacing the order it already
+        had in the book
+
+        Parameters:
+        agent: the agent placing the order
+
+        Returns: True if an order was placed, False if the agent is not eligible to trade
+        """
+        if not agent.eligible:
+            return False
+
+        energy_to_sell = getattr(agent, 'energy_to_sell', None)
+        if energy_to_sell is not None and energy_to_sell > 0 and agent.selling_price is not None:
+            order = Order(agent.selling_price, next(self._sequence), agent)
+            heapq.heappush(self._asks, order)
+        elif agent.demand > 0 and getattr(agent, 'buying_price', None) is not None:
+            order = Order(-agent.buying_price, next(self._sequence), agent)
+            heapq.heappush(self._bids, order)
+        else:
+            return False
+        self._live[agent] = order.sequence
+        return True
+
+    def cancel(self, agent: Agent) -> bool:
+        """
+        Takes the order of the agent out of the book. The order is only marked as cancelled here and dropped once it
+        reaches the top of its side.
+
+        Returns: True if the agent had an order in the book
+        """
+        return self._live.pop(agent, None) is not None
+
+    def _drop_cancelled(self, side: list[Order]) -> None:
+        while side and self._live.get(side[0].agent) != side[0].sequence:
+            heapq.heappop(side)
+
+    def _pop(self, side: list[Order]) -> None:
+        order = heapq.heappop(side)
+        if self._live.get(order.agent) == order.sequence:
+            del self._live[order.agent]
+
+    def submit_all(self, agents: list[Agent]) -> None:
+        """Places an order for every eligible agent in the given list"""
+        for agent in agents:
+            self.submit(agent)
+
+    def best_match(self) -> Union[tuple[Agent, Agent, NamedTuple], None]:
+        """
+        Takes the best bid and the best ask off the books as soon as they agree on a transaction
+
+        Returns:
+        None if the books no longer cross
+        A tuple of (buyer, seller, link details) otherwise, where the link details are the ones given by
+        Agent.check_match_for_business
+        """
+        while True:
+            self._drop_cancelled(self._bids)
+            self._drop_cancelled(self._asks)
+            if not (self._bids and self._asks):
+                return None
+
+            self.attempts += 1
+            buyer = self._bids[0].agent
+            seller = self._asks[0].agent
+
+            if not buyer.approve_for_business(seller):
+                # The cheapest ask is already too expensive for this buyer
+                self.rejected_by_price += 1
+                self._pop(self._bids)
+                continue
+
+            if not seller.approve_for_business(buyer):
+                # No buyer left in the book offers a better price than this one
+                self.rejected_by_price += 1
+                self._pop(self._asks)
+                continue
+
+            link_details = Agent.check_match_for_business(buyer, seller)
+            if link_details is None or link_details.energy <= 0:
+                # The buyer can't afford a single unit even at the cheapest ask
+                self.rejected_by_quantity += 1
+                self._pop(self._bids)
+                continue
+
+            self._pop(self._bids)
+            self._pop(self._asks)
+            return buyer, seller, link_details
@@ -0,0 +1,197 @@
+"""
+This file contains a generator of synthetic populations of buyers, sellers and prosumers.
+
+Every attribute is sampled for a whole batch of agents at once from a configurable distribution and written straight
+into the arrays of an AgentPopulation. Agent objects are only created when asked for, as views over those rows, and
+populations larger than a memory budget can be streamed chunk by chunk.
+"""
+
+from __future__ import annotations
+from typing import Iterator, NamedTuple, Union
+
+import numpy as np
+
+from AgentPopulation import AgentPopulation
+from Buyer import Buyer
+from Prosumer import Prosumer
+from Seller import Seller
+
+
+class Distribution(NamedTuple):
+    """
+    A distribution to sample an attribute from.
+
+    kind is one of "constant" (value), "integers" (low, high, both included), "uniform" (low, high),
+    "normal" (mean, std), "lognormal" (mean, sigma) or "choice" (values, probabilities). Samples are clipped to
+    [low, high] when those are given.
+    """
+
+    kind: str
+    params: tuple
+    low: float = None
+    high: float = None
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """Returns: size samples of the distribution"""
+        if self.kind == "constant":
+            samples = np.full(size, self.params[0], dtype=np.float64)
+        elif self.kind == "integers":
+            samples = rng.integers(self.params[0], self.params[1], size, endpoint=True)
+        elif self.kind == "uniform":
+            samples = rng.uniform(self.params[0], self.params[1], size)
+        elif self.kind == "normal":
+            samples = rng.normal(self.params[0], self.params[1], size)
+        elif self.kind == "lognormal":
+            samples = rng.lognormal(self.params[0], self.params[1], size)
+        elif self.kind == "choice":
+            samples = rng.choice(np.asarray(self.params[0]), size, p=self.params[1])
+        else:
+            raise ValueError(f"No distribution with name {self.kind}")
+
+        if self.low is not None or self.high is not None:
+            samples = np.clip(samples, self.low, self.high)
+        return samples
+
+
+def constant(value: float) -> Distribution:
+    """Returns: A distribution always giving the same value"""
+    return Distribution("constant", (value,))
+
+
+def integers(low: int, high: int) -> Distribution:
+    """Returns: A uniform distribution over the integers from low to high, both included"""
+    return Distribution("integers", (low, high))
+
+
+class PopulationSpec(NamedTuple):
+    """
+    The distributions of the attributes of a synthetic population. The defaults follow main.create_agents.
+    """
+
+    mix: tuple[float, float, float] = (0.2, 0.2, 0.6)     # fractions of buyers, sellers and prosumers
+    buyer_money: Distribution = integers(1_000, 2_000)
+    seller_money: Distribution = integers(30, 1_000)      # money of sellers and prosumers
+    load: Distribution = integers(1, 3)
+    pv_capacity: Distribution = integers(0, 10)           # energy generated per round by sellers and prosumers
+    buying_price: Distribution = integers(2, 10)
+    selling_price: Distribution = integers(2, 10)
+    battery_size: Distribution = integers(50, 100)
+    initial_energy: Distribution = integers(0, 10)
+    charge_efficiency: Distribution = constant(1.0)
+    discharge_efficiency: Distribution = constant(1.0)
+    charge_rate: Distribution = constant(np.inf)          # most energy a battery takes in per round
+    discharge_rate: Distribution = constant(np.inf)       # most energy a battery gives out per round
+
+
+Sample = Union[Distribution, np.ndarray, float]
+
+_BATTERY = {name: name for name in ("charge_efficiency", "discharge_efficiency", "charge_rate", "discharge_rate")}
+
+# Attributes of the spec sampled for every kind of agent, with the column they go to
+_ATTRIBUTES = {
+    AgentPopulation.BUYER: {"buyer_money": "money", "buying_price": "buying_price", "load": "load",
+                            "initial_energy": "charge", "battery_size": "capacity", **_BATTERY},
+    AgentPopulation.SELLER: {"seller_money": "money", "pv_capacity": "energy_generation",
+                             "selling_price": "selling_price", "load": "load", "initial_energy": "charge",
+                             "battery_size": "capacity", **_BATTERY},
+    AgentPopulation.PROSUMER: {"seller_money": "money", "pv_capacity": "energy_generation",
+                               "selling_price": "selling_price", "buying_price": "buying_price", "load": "load",
+                               "initial_energy": "charge", "battery_size": "capacity", **_BATTERY},
+}
+
+_CLASSES = {AgentPopulation.BUYER: Buyer, AgentPopulation.SELLER: Seller, AgentPopulation.PROSUMER: Prosumer}
+
+
+class PopulationGenerator:
+    """
+    Samples synthetic populations in batches.
+
+    Parameters:
+    spec: the distributions of the attributes, defaults to PopulationSpec()
+    rng: the generator every sample is drawn from, a fresh one when not given
+    """
+
+    def __init__(self, spec: PopulationSpec = None, rng: np.random.Generator = None) -> None:
+        self.spec = PopulationSpec() if spec is None else spec
+        self.rng = np.random.default_rng() if rng is None else rng
+
+    def counts(self, size: int) -> tuple[int, int, int]:
+        """Returns: The number of buyers, sellers and prosumers in a population of the given size"""
+        buyers, sellers = int(size * self.spec.mix[0]), int(size * self.spec.mix[1])
+        return buyers, sellers, size - buyers - sellers
+
+    def add_rows(self, population: AgentPopulation, kind: int, count: int, first_id: int = 0,
+                 **overrides: Sample) -> np.ndarray:
+        """
+        Adds rows for agents of one kind to a population, sampling every attribute the kind has
+
+        Parameters:
+        population: the population to add the rows to
+        kind: BUYER, SELLER or PROSUMER
+        count: the number of agents
+        first_id: id of the first agent, the others following in order
+        overrides: values or distributions replacing those of the spec, by spec attribute or column name
+
+        Returns: The indices of the new rows
+        """
+        columns = {"id": np.arange(first_id, first_id + count)}
+        for attribute, column in _ATTRIBUTES[kind].items():
+            value = overrides.get(attribute, overrides.get(column, getattr(self.spec, attribute)))
+            columns[column] = value.sample(self.rng, count) if isinstance(value, Distribution) else value
+        return population.add_rows(count, kind, **columns)
+
+    def add_agents(self, population: AgentPopulation, kind: int, count: int, first_id: int = 0,
+                   **overrides: Sample) -> list:
+        """
+        Same as add_rows, but also creates the agent objects viewing the new rows
+
+        Returns: The new agents
+        """
+        rows = self.add_rows(population, kind, count, first_id, **overrides)
+        return _CLASSES[kind].from_rows(population, rows)
+
+    def generate(self, size: int, population: AgentPopulation = None, first_id: int = 0) -> AgentPopulation:
+        """
+        Samples a population without creating any agent object, buyers first, then sellers, then prosumers
+
+        Parameters:
+        size: total number of agents
+        population: population to add the agents to, a new one sized for them when not given
+        first_id: id of the first agent
+        """
+        population = AgentPopulation(allocated=size, rng=self.rng) if population is None else population
+        for kind, count in zip((AgentPopulation.BUYER, AgentPopulation.SELLER, AgentPopulation.PROSUMER),
+                               self.counts(size)):
+            self.add_rows(population, kind, count, first_id)
+            first_id += count
+        return population
+
+    def create_agents(self, size: int, population: AgentPopulation = None,
+                      first_id: int = 0) -> tuple[list[Buyer], list[Union[Seller, Prosumer]]]:
+        """
+        Samples a population and creates the agent objects viewing it
+
+        Returns: The buyers and the sellers, prosumers being part of the sellers
+        """
+        population = AgentPopulation(allocated=size, rng=self.rng) if population is None else population
+        agents = []
+        for kind, count in zip((AgentPopulation.BUYER, AgentPopulation.SELLER, AgentPopulation.PROSUMER),
+                               self.counts(size)):
+            agents.append(self.add_agents(population, kind, count, first_id))
+            first_id += count
+        return agents[0], agents[1] + agents[2]
+
+    def stream(self, size: int, memory_budget: int = 256 * 1024**2) -> Iterator[AgentPopulation]:
+        """
+        Samples a population too large to hold at once as a series of smaller populations
+
+        Parameters:
+        size: total number of agents
+        memory_budget: the most bytes the arrays of one chunk may take
+
+        Returns: An iterator over populations of at most memory_budget bytes each, agent ids following on from one
+        chunk to the next
+        """
+        chunk_size = max(memory_budget // AgentPopulation.row_bytes(), 1)
+        for first_id in range(0, size, chunk_size):
+            yield self.generate(min(chunk_size, size - first_id), first_id=first_id)
@@ -0,0 +1,154 @@
+"""
+This file contains hourly load and PV generation profiles driving a time-stepped simulation.
+
+Profiles are 2-D arrays with one value per agent and per timestep, kept on disk as .npy files and memory-mapped.
+They are stored timestep-major, i.e. with shape (timesteps, agents), so that the profile of every agent at one
+timestep is a contiguous block of the file. A ProfileStream reads them a window of timesteps at a time, so a year of
+profiles for many agents never has to fit in memory.
+"""
+
+from __future__ import annotations
+from typing import Union
+import os
+
+import numpy as np
+
+from AgentPopulation import AgentPopulation
+
+HOURS_PER_DAY = 24
+HOURS_PER_YEAR = 8760
+
+
+class ProfileStore:
+    """
+    The load and generation profiles of a set of agents, in the directory at path.
+
+    Parameters:
+    path: directory holding load.npy and generation.npy
+    writable: when True the profiles are mapped for writing
+    """
+
+    FILES = {"load": "load.npy", "generation": "generation.npy"}
+
+    def __init__(self, path: str, writable: bool = False) -> None:
+        self.path = path
+        mode = "r+" if writable else "r"
+        self.load = np.load(os.path.join(path, self.FILES["load"]), mmap_mode=mode)
+        self.generation = np.load(os.path.join(path, self.FILES["generation"]), mmap_mode=mode)
+        if self.load.shape != self.generation.shape:
+            raise ValueError(f"Load and generation profiles in {path} have different shapes")
+
+    @classmethod
+    def create(cls, path: str, agents: int, timesteps: int = HOURS_PER_YEAR, dtype: type = np.float32) -> ProfileStore:
+        """Returns: A writable store of zeroed profiles for the given number of agents and timesteps"""
+        os.makedirs(path, exist_ok=True)
+        for file in cls.FILES.values():
+            np.lib.format.open_memmap(os.path.join(path, file), mode="w+", dtype=dtype, shape=(timesteps, agents)).flush()
+        return cls(path, writable=True)
+
+    @property
+    def timesteps(self) -> int:
+        return self.load.shape[0]
+
+    @property
+    def agents(self) -> int:
+        return self.load.shape[1]
+
+    def write(self, start: int, load: np.ndarray, generation: np.ndarray) -> None:
+        """Writes the profiles of every agent for the timesteps from start on, given with shape (timesteps, agents)"""
+        self.load[start:start + len(load)] = load
+        self.generation[start:start + len(generation)] = generation
+
+    def flush(self) -> None:
+        self.load.flush()
+        self.generation.flush()
+
+
+def create_synthetic_profiles(path: str, base_load: np.ndarray, pv_capacity: np.ndarray,
+                              timesteps: int = HOURS_PER_YEAR, rng: np.random.Generator = None,
+                              chunk: int = 31 * HOURS_PER_DAY) -> ProfileStore:
+    """
+    Writes hourly profiles shaped like household load and rooftop PV output, chunk by chunk
+
+    Load follows a daily curve with morning and evening peaks around base_load. Generation follows the sun between
+    6 and 18 o'clock, higher in summer, scaled by pv_capacity and by a random cloudiness per agent and day.
+
+    Parameters:
+    path: directory of the ProfileStore
+    base_load: average load of every agent
+    pv_capacity: peak generation of every agent
+    timesteps: number of hours
+    rng: generator of the random noise
+    chunk: number of hours generated at once
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    base_load = np.asarray(base_load, dtype=np.float64)
+    pv_capacity = np.asarray(pv_capacity, dtype=np.float64)
+    store = ProfileStore.create(path, len(base_load), timesteps)
+
+    for start in range(0, timesteps, chunk):
+        hours = np.arange(start, min(start + chunk, timesteps))
+        hour_of_day = hours % HOURS_PER_DAY
+        day = hours // HOURS_PER_DAY
+
+        daily = 0.6 + 0.5 * np.exp(-((hour_of_day - 8) / 2.0) ** 2) + 0.9 * np.exp(-((hour_of_day - 19) / 2.5) ** 2)
+        noise = rng.lognormal(0.0, 0.2, size=(len(hours), len(base_load)))
+        load = daily[:, None] * base_load[None, :] * noise
+
+        sun = np.clip(np.sin(np.pi * (hour_of_day - 6) / 12), 0, None)
+        season = 0.65 + 0.35 * np.cos(2 * np.pi * (day - 172) / 365)
+        first_day, days = day[0], day[-1] - day[0] + 1
+        cloudiness = rng.uniform(0.3, 1.0, size=(days, len(base_load)))[day - first_day]
+        generation = (sun * season)[:, None] * pv_capacity[None, :] * cloudiness
+
+        store.write(start, load, generation)
+
+    store.flush()
+    return store
+
+
+class ProfileStream:
+    """
+    Feeds the profiles of a store to the agents they belong to, one timestep at a time.
+
+    Parameters:
+    store: the profiles, column i of which belongs to agents[i]
+    agents: the agents the profiles drive
+    window: number of timesteps read from disk at once
+    """
+
+    def __init__(self, store: ProfileStore, agents: list, window: int = 7 * HOURS_PER_DAY) -> None:
+        if len(agents) != store.agents:
+            raise ValueError(f"{store.agents} profiles can't drive {len(agents)} agents")
+        self.store = store
+        self.window = window
+        self._start: Union[int, None] = None
+        self._load: Union[np.ndarray, None] = None
+        self._generation: Union[np.ndarray, None] = None
+
+        positions = {agent: position for position, agent in enumerate(agents)}
+        self._groups = [(population, rows, np.array([positions[agent] for agent in agents if agent._pool is population]))
+                        for population, rows in AgentPopulation.group(agents).items()]
+
+    @property
+    def timesteps(self) -> int:
+        return self.store.timesteps
+
+    def _read(self, timestep: int) -> None:
+        if self._start is not None and self._start <= timestep < self._start + len(self._load):
+            return
+        if not 0 <= timestep < self.timesteps:
+            raise IndexError(f"No timestep {timestep} in profiles of {self.timesteps} timesteps")
+        self._start = timestep
+        self._load = np.asarray(self.store.load[timestep:timestep + self.window], dtype=np.float64)
+        self._generation = np.asarray(self.store.generation[timestep:timestep + self.window], dtype=np.float64)
+
+    def apply(self, timestep: int) -> None:
+        """Sets the load and the energy generation of every agent to its profile at the given timestep"""
+        self._read(timestep)
+        load = self._load[timestep - self._start]
+        generation = self._generation[timestep - self._start]
+        for population, rows, positions in self._groups:
+            population.load[rows] = load[positions]
+            population.energy_generation[rows] = generation[positions]
+            population._touch(rows)
@@ -2,9 +2,9 @@
 This file defines an example of a class that implements a mixed functionality of buying and selling
 """
 
-import random
 from Agent import Agent
-import CONSTANTS
+from AgentPopulation import AgentPopulation, Column, ModeColumn
+from Simulation import Registry, Simulation
 
 from typing import Union
 
@@ -14,10 +14,19 @@ class Prosumer(Agent):
     This is a seperate class because dimaond inheritance wasn't possible.
     """
 
-    _all_prosumers = []
+    KIND = AgentPopulation.PROSUMER
+    MODE = AgentPopulation.BUYING
+    _all_prosumers = Registry("prosumers")
 
-    def __init__(self, _id:int, init_money:int, energy_generation:int, selling_price:int, load:int, initial_energy:int, max_capacity:int, buying_price:int):
-        super().__init__(_id, init_money=init_money, load=load, current_energy=initial_energy, max_capacity=max_capacity)
+    _energy_generation = Column("energy_generation")
+    _selling_price = Column("selling_price")
+    _energy_sold = Column("energy_sold")
+    _buying_price = Column("buying_price")
+    _energy_bought = Column("energy_bought")
+    _mode = ModeColumn("mode")
+
+    def __init__(self, _id:int, init_money:int, energy_generation:int, selling_price:int, load:int, initial_energy:int, max_capacity:int, buying_price:int, population:AgentPopulation=None):
+        super().__init__(_id, init_money=init_money, load=load, current_energy=initial_energy, max_capacity=max_capacity, population=population)
         Prosumer._all_prosumers.append(self)
         self._setup(energy_generation, selling_price, buying_price)
 
@@ -31,6 +40,12 @@ class Prosumer(Agent):
         self._buying_price = buying_price
         self._energy_bought = 0
         self._mode: bool = False # False for buying, True for selling, None for neither
+        self._set_mode()
+
+    @classmethod
+    def _register(cls, agents:list) -> None:
+        super()._register(agents)
+        Prosumer._all_prosumers.extend(agents)
 
     @classmethod
     def population(cls) -> int:
@@ -41,7 +56,7 @@ class Prosumer(Agent):
     def energy_to_buy(self) -> int:
         """Returns: the amount of energy the prosumer needs to buy"""
         if self._mode is False:
-            return max(self._load - self._battery.current_capacity, 0)
+            return max(self._battery.demand(self._load), 0)
 
     @property
     def energy_to_sell(self) -> float:
@@ -50,43 +65,51 @@ class Prosumer(Agent):
         Returns: How much energy the seller can sell
         """
         if self._mode is True:
-            return max(self._battery.current_capacity - self._load, 0)
+            return max(self._battery.deliverable - self._load, 0)
 
-    def buy_energy(self, bought_energy:int, price:int) -> None:
+    def buy_energy(self, bought_energy:int, price:int) -> float:
         """
         buys the given amount of energy for the specified price
 
         Parameters:
             bought_energy: the amount of energy to be bought
             price: price of the energy
+
+        Returns: The energy the battery couldn't take in and spilled
         """
         self._energy_bought += bought_energy 
-        self._battery.add_charge(bought_energy)
+        spilled = self._battery.add_charge(bought_energy)
         self.spend(price)
+        self._energy_changed()
+        return spilled
 
-    def sell_energy(self, energy_sold:int, price:int) -> None:
+    def sell_energy(self, energy_sold:int, price:int) -> float:
         """
         Sell a given amount of energy at a given price.
 
         Parameters:
             energy_sold: How much energy to sell
             price: At what price energy to sell
+
+        Returns: The energy the battery couldn't deliver
         """
         self._energy_sold += energy_sold
-        self._battery.current_capacity -= energy_sold
+        short = self._battery.remove_charge(energy_sold)
         self.earn(price)
+        self._energy_changed()
+        return short
 
     def in_buying_range(self, price: float) -> bool:
         """
         Returns: True if the price is in the buyers's price range, False otherwise
         """
-        return price*self._state.modulation_factor <= ((1+self.tolerance) * self._buying_price)
+        return price*self._modulation_factor <= ((1+self.tolerance) * self._buying_price)
     
     def in_selling_range(self, price: float) -> bool:
         """
         Returns: True if the price is in the seller's price range, False otherwise
         """
-        return ((self._state.modulation_factor-self.tolerance) * self._selling_price) <= price
+        return ((self._modulation_factor-self.tolerance) * self._selling_price) <= price
 
     def in_price_range(self, price: float) -> bool:
         """
@@ -100,15 +123,17 @@ class Prosumer(Agent):
 
     def modulate_buying_price(self) -> None:
         """Modulates the buying price of the buyer""" 
-        self._buying_price *= random.uniform(0.9, 1.1)
-        self._buying_price = max(self._buying_price, CONSTANTS.MIN_ENERGY_PRICE)
-        self._buying_price = min(self._buying_price, CONSTANTS.MAX_ENERGY_PRICE)
+        self._buying_price *= self._uniform("buying_price", 0.9, 1.1)
+        simulation = Simulation.current()
+        self._buying_price = max(self._buying_price, simulation.min_price)
+        self._buying_price = min(self._buying_price, simulation.max_price)
 
     def modulate_selling_price(self) -> None:
         """Modulates the selling price by a random amount with some control"""
-        self._selling_price *= random.uniform(0.9, 1.1)
-        self._selling_price = max(self._selling_price, CONSTANTS.MIN_ENERGY_PRICE)
-        self._selling_price = min(self._selling_price, CONSTANTS.MAX_ENERGY_PRICE)
+        self._selling_price *= self._uniform("selling_price", 0.9, 1.1)
+        simulation = Simulation.current()
+        self._selling_price = max(self._selling_price, simulation.min_price)
+        self._selling_price = min(self._selling_price, simulation.max_price)
 
     @property
     def buying_price(self) -> Union[float, None]:
@@ -127,18 +152,23 @@ class Prosumer(Agent):
         """Returns: True if there is at least one buyer in the simulation, False otherwise"""
         return any(prosumer.eligible for prosumer in cls._all_prosumers) 
 
+    def _energy_changed(self) -> None:
+        """Keeps the mode in line with the energy stored"""
+        self._set_mode()
+
     def _set_mode(self) -> bool:
         """ Sets the mode of the prosumer."""
-        net_energy = self._load - self._battery.current_capacity
+        net_energy = self._load - self._battery.deliverable
         self._mode = (net_energy < 0)
         return self._mode
 
     @property
     def eligible(self) -> bool:
         """
-        Check eligibilty of the prosumer object to participate in the market
+        Check eligibilty of the prosumer object to participate in the market. The mode is kept up to date whenever
+        the energy stored changes, so reading this doesn't change the prosumer.
         """
-        mode = self._set_mode()
+        mode = self._mode
         if mode is True:
             return self._eligible_for_selling()
         if mode is False:
@@ -193,6 +223,7 @@ class Prosumer(Agent):
     def generate_energy(self) -> None:
         """Produces energy that it can produce"""
         self._battery.add_charge(self._energy_generation)
+        self._energy_changed()
 
     def do_business_with_details(self, price:float, energy:float) -> None:
         """Does business with the given price and energy"""
@@ -0,0 +1,106 @@
+"""
+This file contains the random streams every stochastic behaviour of the agents draws from.
+
+Draws are counter based: the k-th draw of an agent from a stream is a hash of the key of the stream, the id of the agent
+and k, the keys being derived from the SeedSequence of the simulation. Every agent keeps count of its own draws in every
+stream, so what an agent draws never depends on how many draws other agents made before it, nor on its draws from the
+other streams. The same run gives the same draws whether agents are processed one by one, in bulk or in parallel, and
+the draws of a whole round are a few NumPy operations on the ids and counters of the agents.
+"""
+
+from __future__ import annotations
+from typing import Union
+
+import numpy as np
+
+from Simulation import Simulation
+
+STREAMS = ("buying_price", "selling_price", "tolerance", "state")
+
+_MASK = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+_MIX1 = 0xBF58476D1CE4E5B9
+_MIX2 = 0x94D049BB133111EB
+_TO_UNIT = 2.0 ** -53
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """SplitMix64 finalizer of an array of uint64"""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(_MIX1)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(_MIX2)
+    return x ^ (x >> np.uint64(31))
+
+
+def _mix_int(x: int) -> int:
+    """SplitMix64 finalizer of a Python int, giving the same results as _mix"""
+    x = ((x ^ (x >> 30)) * _MIX1) & _MASK
+    x = ((x ^ (x >> 27)) * _MIX2) & _MASK
+    return x ^ (x >> 31)
+
+
+class RandomStreams:
+    """
+    The keys of the random streams of one simulation.
+
+    Parameters:
+    seed: a SeedSequence, or the entropy of one, random when not given
+    """
+
+    def __init__(self, seed: Union[np.random.SeedSequence, int, None] = None) -> None:
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        keys = self.seed_sequence.generate_state(len(STREAMS), np.uint64)
+        self._keys = {stream: int(key) for stream, key in zip(STREAMS, keys)}
+
+    @classmethod
+    def default(cls) -> RandomStreams:
+        """Returns: The streams of the current simulation, seeded with its seed"""
+        simulation = Simulation.current()
+        if simulation.streams is None:
+            simulation.streams = cls(simulation.seed)
+        return simulation.streams
+
+    @classmethod
+    def seed(cls, seed: Union[np.random.SeedSequence, int, None]) -> RandomStreams:
+        """Starts new streams for the current simulation from the given seed and returns them"""
+        simulation = Simulation.current()
+        simulation.streams = cls(seed)
+        return simulation.streams
+
+    def state(self) -> dict:
+        """Returns: What the streams are rebuilt from with restore, made of JSON serializable values"""
+        return {"entropy": self.seed_sequence.entropy, "spawn_key": list(self.seed_sequence.spawn_key)}
+
+    @classmethod
+    def restore(cls, state: dict) -> RandomStreams:
+        """Makes the streams saved by state the ones of the current simulation and returns them"""
+        return cls.seed(np.random.SeedSequence(state["entropy"], spawn_key=tuple(state["spawn_key"])))
+
+    def random(self, stream: str, ids: np.ndarray, counters: np.ndarray) -> np.ndarray:
+        """
+        Returns: The draw of every agent at its counter in the given stream, uniform in [0, 1)
+
+        Parameters:
+        stream: one of STREAMS
+        ids: ids of the agents
+        counters: number of draws every agent made from the stream before this one
+        """
+        ids = np.asarray(ids).astype(np.uint64)
+        counters = np.asarray(counters).astype(np.uint64)
+        with np.errstate(over="ignore"):
+            agent_keys = _mix(np.uint64(self._keys[stream]) ^ (ids * np.uint64(_GOLDEN)))
+            bits = _mix(agent_keys + counters * np.uint64(_GOLDEN))
+        return (bits >> np.uint64(11)).astype(np.float64) * _TO_UNIT
+
+    def random_one(self, stream: str, agent_id: int, counter: int) -> float:
+        """Returns: The draw of one agent at its counter in the given stream, the same as random gives"""
+        agent_key = _mix_int(self._keys[stream] ^ ((agent_id * _GOLDEN) & _MASK))
+        bits = _mix_int((agent_key + counter * _GOLDEN) & _MASK)
+        return (bits >> 11) * _TO_UNIT
+
+    def uniform(self, stream: str, ids: np.ndarray, counters: np.ndarray, low: float, high: float) -> np.ndarray:
+        """Returns: The draw of every agent at its counter in the given stream, uniform in [low, high)"""
+        return low + (high - low) * self.random(stream, ids, counters)
+
+    def uniform_one(self, stream: str, agent_id: int, counter: int, low: float, high: float) -> float:
+        """Returns: The draw of one agent at its counter in the given stream, uniform in [low, high)"""
+        return low + (high - low) * self.random_one(stream, agent_id, counter)
@@ -0,0 +1,153 @@
+"""
+This file contains a Monte Carlo runner that simulates many random realizations of the market in parallel.
+
+Runs are fanned out over a process pool. Every worker process maps the cached consumer data once, every run gets its
+own seed derived from a single numpy SeedSequence so results are reproducible whatever the number of workers, and only
+a small summary of every run is sent back to the parent process.
+"""
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, NamedTuple, Union
+import os
+
+import numpy as np
+
+import CONSTANTS
+from Agent import Agent
+from AgentPopulation import AgentPopulation
+from Grid import Grid
+from LedgerSink import LedgerSink, Row
+from Market import Market
+from Simulation import Simulation
+from input_data import load_data
+from main import create_agents
+
+_consumer_data: Union[dict[str, np.ndarray], None] = None
+
+
+class RunSummary(NamedTuple):
+    seed: int
+    trades: int
+    traded_energy: float
+    traded_money: float
+    grid_drain: float
+    clearing_prices: np.ndarray     # min, 5th percentile, median, 95th percentile, max of the price per unit
+    agent_ids: np.ndarray
+    earnings: np.ndarray            # money earned by every agent of agent_ids
+
+
+class ScenarioResults(NamedTuple):
+    runs: list[RunSummary]
+
+    def metric(self, name: str) -> np.ndarray:
+        """Returns: The value of a scalar field of RunSummary for every run"""
+        return np.array([getattr(run, name) for run in self.runs], dtype=np.float64)
+
+    def distribution(self, name: str, percentiles: tuple[float, ...] = (5, 25, 50, 75, 95)) -> dict[str, float]:
+        """Returns: Mean, standard deviation and percentiles of a scalar field of RunSummary across runs"""
+        values = self.metric(name)
+        summary = {"mean": float(values.mean()), "std": float(values.std())}
+        summary.update({f"p{p:g}": float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))})
+        return summary
+
+    def earnings(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns: The agent ids with the mean and standard deviation of their earnings across runs"""
+        agent_ids = self.runs[0].agent_ids
+        earnings = np.stack([run.earnings for run in self.runs])
+        return agent_ids, earnings.mean(axis=0), earnings.std(axis=0)
+
+
+class SummarySink(LedgerSink):
+    """
+    Ledger sink keeping only the energy and price of every entry, so a run can be summarized without a ledger file
+    """
+
+    def __init__(self, headers: Row) -> None:
+        self._energy_column = list(headers).index("Energy")
+        self._price_column = list(headers).index("Price")
+        super().__init__(os.devnull, headers, flush_rows=65_536, flush_seconds=float("inf"), background=False)
+
+    def _open(self) -> None:
+        self.energy: list[float] = []
+        self.money: list[float] = []
+
+    def _write_rows(self, rows: list[Row]) -> None:
+        self.energy.extend(row[self._energy_column] for row in rows)
+        self.money.extend(row[self._price_column] for row in rows)
+
+    def _close(self) -> None:
+        pass
+
+    def rows(self) -> Iterator[list]:
+        return iter(())
+
+
+def _load_consumer_data(path: str) -> None:
+    """Worker initializer, maps the cached consumer data once per process"""
+    global _consumer_data
+    _consumer_data = load_data(path)
+
+
+def run_once(seed_sequence: np.random.SeedSequence, mode: str = None) -> RunSummary:
+    """
+    Simulates one realization of the market with the consumer data loaded in this process
+
+    Parameters:
+    seed_sequence: seeds every random draw of the run
+    mode: market mode to run, defaults to CONSTANTS.MARKET_MODE
+    """
+    seed = int(seed_sequence.generate_state(1)[0])
+    with Simulation(seed=seed):
+        population = AgentPopulation(rng=np.random.default_rng(seed_sequence))
+
+        buyers, prosumers = create_agents(_consumer_data, population)
+        sink = SummarySink(CONSTANTS.LEDGER_HEADERS)
+        market = Market(CONSTANTS.MAX_ENERGY_PRICE, CONSTANTS.MIN_ENERGY_PRICE, sink)
+        market.run(buyers, prosumers, mode)
+        sink.close()
+        return summarize(seed, sink, buyers + prosumers)
+
+
+def summarize(seed: int, sink: SummarySink, agents: list[Agent]) -> RunSummary:
+    """Returns: The summary of a finished run whose ledger went to the given sink"""
+    energy, money = np.array(sink.energy), np.array(sink.money)
+    prices = money / energy if len(energy) else np.full(1, np.nan)
+    return RunSummary(
+        seed=seed,
+        trades=len(energy),
+        traded_energy=float(energy.sum()),
+        traded_money=float(money.sum()),
+        grid_drain=float(Grid().get_drained_energy()),
+        clearing_prices=np.percentile(prices, (0, 5, 50, 95, 100)),
+        agent_ids=np.array([agent.id for agent in agents]),
+        earnings=np.array([agent.monery_earned for agent in agents]))
+
+
+def run_scenarios(runs: int, seed: int = None, workers: int = None, mode: str = None,
+                  data_path: str = None) -> ScenarioResults:
+    """
+    Simulates many realizations of the market in parallel
+
+    Parameters:
+    runs: number of realizations
+    seed: entropy of the SeedSequence every run's seed is spawned from, random when not given
+    workers: number of worker processes, defaults to the number of CPUs
+    mode: market mode to run, defaults to CONSTANTS.MARKET_MODE
+    data_path: consumer data to read, defaults to CONSTANTS.DATA_FILE_PATH
+    """
+    seed_sequences = np.random.SeedSequence(seed).spawn(runs)
+    data_path = CONSTANTS.DATA_FILE_PATH if data_path is None else data_path
+    # Parses the data into the cache once, so that the workers only have to map it
+    load_data(data_path)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_consumer_data, initargs=(data_path,)) as pool:
+        summaries = list(pool.map(run_once, seed_sequences, [mode] * runs))
+
+    return ScenarioResults(summaries)
+
+
+if __name__ == "__main__":
+    results = run_scenarios(runs=100, seed=0)
+    for name in ("traded_energy", "traded_money", "grid_drain"):
+        print(name, results.distribution(name))
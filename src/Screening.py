@@ -0,0 +1,189 @@
+"""
+This file contains the screening of pairs of agents for business, in bulk and tile by tile.
+
+For every pair of agents of a list, screening finds whether both agents approve each other for business, following
+Agent.check_match_for_business: one of them is in buying mode, the other in selling mode, the selling price is within
+the price range of the buyer and the buying price within the one of the seller, who only sells to agents with some
+demand when it's a prosumer. It also finds the energy the pair can trade, min(demand, energy_to_sell, money // price),
+the buyer's demand, the energy the seller can spare and what the buyer can afford at the selling price. The attributes
+of the agents are read from their populations and compared with NumPy broadcasting, a tile of at most tile_size pairs at
+a time, so the memory used stays bounded whatever the number of agents while pairs are no longer checked one by one in
+Python.
+"""
+
+from __future__ import annotations
+from typing import Iterator, NamedTuple
+
+import numpy as np
+
+import CONSTANTS
+from AgentPopulation import AgentPopulation
+
+
+class Side(NamedTuple):
+    buying: np.ndarray          # in buying mode
+    selling: np.ndarray         # in selling mode
+    prosumer: np.ndarray
+    buying_price: np.ndarray
+    selling_price: np.ndarray
+    modulation: np.ndarray      # modulation factor of the state
+    tolerance: np.ndarray
+    demand: np.ndarray
+    energy_to_sell: np.ndarray
+    money: np.ndarray
+
+
+class Screen(NamedTuple):
+    compatible: np.ndarray      # both agents approve each other for business
+    energy: np.ndarray          # energy the pair can trade, 0 where they aren't compatible
+    price: np.ndarray           # selling price of the seller of the pair
+    first_buys: np.ndarray      # the agent of the first side is the buyer of the pair
+
+
+def side(population: AgentPopulation, rows: np.ndarray) -> Side:
+    """Returns: The attributes of the given rows of a population that screening reads"""
+    mode = population.mode[rows]
+    return Side(
+        mode == AgentPopulation.BUYING, mode == AgentPopulation.SELLING,
+        population.kind[rows] == AgentPopulation.PROSUMER, population.buying_price[rows],
+        population.selling_price[rows], population.modulation_factors(rows), population.tolerance[rows],
+        population.demand(rows), population.energy_to_sell(rows), population.money[rows])
+
+
+def screen(first: Side, second: Side) -> Screen:
+    """
+    Screens every agent of the first side against every agent of the second side
+
+    Returns: The Screen of the pairs, indexed by the position of the agent on the first side then on the second one
+    """
+    first = Side(*(column[:, None] for column in first))
+    second = Side(*(column[None, :] for column in second))
+    first_buys = first.buying & second.selling
+    second_buys = first.selling & second.buying
+
+    def approve(buyer: Side, seller: Side) -> np.ndarray:
+        # Buyer.in_price_range and Seller.in_price_range, written the same way so that rounding agrees. Prosumers
+        # only sell to agents with some demand.
+        return ((seller.selling_price * buyer.modulation <= (1 + buyer.tolerance) * buyer.buying_price)
+                & ((seller.modulation - seller.tolerance) * seller.selling_price <= buyer.buying_price)
+                & (~seller.prosumer | (buyer.demand > 0)))
+
+    def energy(buyer: Side, seller: Side) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            affordable = buyer.money // seller.selling_price
+        return np.minimum(np.minimum(buyer.demand, seller.energy_to_sell), affordable)
+
+    compatible = (first_buys & approve(first, second)) | (second_buys & approve(second, first))
+    traded = np.where(first_buys, energy(first, second), energy(second, first))
+    price = np.where(first_buys, second.selling_price, first.selling_price)
+    return Screen(compatible, np.where(compatible, traded, 0.0), price, np.broadcast_to(first_buys, compatible.shape))
+
+
+class Scan(NamedTuple):
+    match: int                  # position of the first agent that can trade, -1 when there is none
+    energy: float
+    price: float
+    attempts: int               # pairs screened up to and including the match
+    rejected_by_price: int
+    rejected_by_quantity: int
+
+
+class Screening:
+    """
+    Screens the agents of a list against each other, tile by tile.
+
+    The list can change while it's screened through pop and append, like the queue of the real world market, and
+    attributes are always read from the populations when a tile is screened, so a screen is never stale.
+
+    Parameters:
+    agents: the agents to screen, positions in this list are used to refer to them
+    tile_size: the largest number of pairs screened at once, defaults to CONSTANTS.SCREENING_TILE_SIZE
+    """
+
+    def __init__(self, agents: list, tile_size: int = None) -> None:
+        self.agents = list(agents)
+        self.tile_size = CONSTANTS.SCREENING_TILE_SIZE if tile_size is None else tile_size
+        self._populations: list[AgentPopulation] = []
+        numbers: dict[AgentPopulation, int] = {}
+        for agent in self.agents:
+            if agent._pool not in numbers:
+                numbers[agent._pool] = len(self._populations)
+                self._populations.append(agent._pool)
+        self._pools = np.array([numbers[agent._pool] for agent in self.agents], dtype=np.int64)
+        self._rows = np.array([agent._index for agent in self.agents], dtype=np.int64)
+        self._numbers = numbers
+
+    def __len__(self) -> int:
+        return len(self.agents)
+
+    def pop(self, position: int):
+        """Removes the agent at a position of the list and returns it"""
+        self._pools = np.delete(self._pools, position)
+        self._rows = np.delete(self._rows, position)
+        return self.agents.pop(position)
+
+    def append(self, agent) -> None:
+        """Adds an agent at the end of the list"""
+        if agent._pool not in self._numbers:
+            self._numbers[agent._pool] = len(self._populations)
+            self._populations.append(agent._pool)
+        self._pools = np.append(self._pools, self._numbers[agent._pool])
+        self._rows = np.append(self._rows, agent._index)
+        self.agents.append(agent)
+
+    def side(self, positions: slice) -> Side:
+        """Returns: The attributes of the agents at the given positions, read from their populations now"""
+        rows = self._rows[positions]
+        if len(self._populations) == 1:
+            return side(self._populations[0], rows)
+
+        pools = self._pools[positions]
+        columns = None
+        for number, population in enumerate(self._populations):
+            members = pools == number
+            if not members.any():
+                continue
+            part = side(population, rows[members])
+            if columns is None:
+                columns = [np.zeros(len(rows), dtype=column.dtype) for column in part]
+            for column, values in zip(columns, part):
+                column[members] = values
+        return Side(*columns)
+
+    def tile(self, rows: slice, columns: slice) -> Screen:
+        """Returns: The Screen of the agents at the given row positions against the ones at the column positions"""
+        return screen(self.side(rows), self.side(columns))
+
+    def tiles(self) -> Iterator[tuple[int, int, Screen]]:
+        """
+        Screens every agent against every agent, in square tiles of at most tile_size pairs
+
+        Returns: An iterator of the first row position, the first column position and the Screen of every tile
+        """
+        edge = max(int(self.tile_size ** 0.5), 1)
+        for row in range(0, len(self), edge):
+            for column in range(0, len(self), edge):
+                yield row, column, self.tile(slice(row, row + edge), slice(column, column + edge))
+
+    def first_match(self, position: int, start: int = None) -> Scan:
+        """
+        Screens the agent at a position against the agents after start, by default the ones after it, in list order
+        and a tile at a time, up to the first one it can trade with
+
+        Returns: The Scan of the agent, with the counts of pairs screened and rejected on the way
+        """
+        start = position + 1 if start is None else start
+        attempts = rejected_by_price = rejected_by_quantity = 0
+        agent = self.side(slice(position, position + 1))
+        for first in range(start, len(self), max(self.tile_size, 1)):
+            tile = screen(agent, self.side(slice(first, first + self.tile_size)))
+            compatible, energy = tile.compatible[0], tile.energy[0]
+            matches = np.flatnonzero(compatible & (energy > 0))
+            end = matches[0].item() + 1 if len(matches) else len(compatible)
+            attempts += end
+            rejected_by_price += int(np.count_nonzero(~compatible[:end]))
+            rejected_by_quantity += int(np.count_nonzero(compatible[:end] & (energy[:end] <= 0)))
+            if len(matches):
+                return Scan(first + matches[0].item(), energy[matches[0]].item(), tile.price[0, matches[0]].item(),
+                            attempts, rejected_by_price, rejected_by_quantity)
+        return Scan(-1, 0.0, 0.0, attempts, rejected_by_price, rejected_by_quantity)
@@ -1,14 +1,21 @@
 from __future__ import annotations
 from Agent import Agent
-import random
-import CONSTANTS
+from AgentPopulation import AgentPopulation, Column
+import numpy as np
+from Simulation import Registry, Simulation
 
 class Seller(Agent):
 
-    _all_sellers:Seller = []
+    KIND = AgentPopulation.SELLER
+    MODE = AgentPopulation.SELLING
+    _all_sellers: list[Seller] = Registry("sellers")
 
-    def __init__(self, _id:int, init_money:int, energy_generation:int, selling_price:int, load:int, initial_energy:int, max_capacity:int) -> None:
-        super().__init__(_id, init_money=init_money, load=load, current_energy=initial_energy, max_capacity=max_capacity)
+    _energy_generation = Column("energy_generation")
+    _selling_price = Column("selling_price")
+    _energy_sold = Column("energy_sold")
+
+    def __init__(self, _id:int, init_money:int, energy_generation:int, selling_price:int, load:int, initial_energy:int, max_capacity:int, population:AgentPopulation=None) -> None:
+        super().__init__(_id, init_money=init_money, load=load, current_energy=initial_energy, max_capacity=max_capacity, population=population)
         Seller._all_sellers.append(self)
         self._setup(energy_generation, selling_price)
 
@@ -26,17 +33,20 @@ class Seller(Agent):
         """Produces energy that it can produce"""
         self._battery.add_charge(self._energy_generation)
 
-    def sell_energy(self, energy_sold:int, price:int) -> None:
+    def sell_energy(self, energy_sold:int, price:int) -> float:
         """
         Sell a given amount of energy at a given price.
 
         Parameters:
             energy_sold: How much energy to sell
             price: At what price energy to sell
+
+        Returns: The energy the battery couldn't deliver
         """
         self._energy_sold += energy_sold
-        self._battery.current_capacity -= energy_sold
+        short = self._battery.remove_charge(energy_sold)
         self.earn(price)
+        return short
 
     @property
     def selling_price(self) -> float:
@@ -49,13 +59,13 @@ class Seller(Agent):
         Figures out the excessive energy with the seller that it can choose to sell
         Returns: How much energy the seller can sell
         """
-        return self._battery.current_capacity - self._load
+        return self._battery.deliverable - self._load
 
     def in_price_range(self, price: float) -> bool:
         """
         Returns: True if the price is in the seller's price range, False otherwise
         """
-        return ((self._state.modulation_factor-self.tolerance) * self._selling_price) <= price 
+        return ((self._modulation_factor-self.tolerance) * self._selling_price) <= price 
 
     @classmethod
     def any_seller_has_energy(cls) -> bool:
@@ -63,20 +73,30 @@ class Seller(Agent):
         return any(seller.eligible for seller in cls._all_sellers)
 
     def __str__(self) -> str:
-        return f'Seller {self.__dict__}'
+        return f'Seller {self._pool.row(self._index)}'
+
+    @classmethod
+    def _register(cls, agents:list) -> None:
+        super()._register(agents)
+        Seller._all_sellers.extend(agents)
 
     @classmethod
-    def create_sellers(cls, num_sellers:int, init_money, energy_generation:int, asking_price:int, load:int, initial_energy:int) -> list[Seller]:
-        """Creates a list of sellers with a given number of sellers"""
-        for x in range(num_sellers):
-            Seller(x, init_money, energy_generation, asking_price, load, initial_energy, max_capacity=5)
+    def create_sellers(cls, num_sellers:int, init_money, energy_generation:int, asking_price:int, load:int, initial_energy:int, max_capacity:int=5, population:AgentPopulation=None) -> list[Seller]:
+        """Creates the given number of identical sellers in one batch"""
+        population = AgentPopulation.default() if population is None else population
+        rows = population.add_rows(
+            num_sellers, AgentPopulation.SELLER, id=np.arange(num_sellers), money=init_money,
+            energy_generation=energy_generation, selling_price=asking_price, load=load, charge=initial_energy,
+            capacity=max_capacity)
+        cls.from_rows(population, rows)
         return cls._all_sellers
 
     def modulate_selling_price(self) -> None:
         """Modulates the selling price by a random amount with some control"""
-        self._selling_price *= random.uniform(0.9, 1.1)
-        self._selling_price = max(self._selling_price, CONSTANTS.MIN_ENERGY_PRICE)
-        self._selling_price = min(self._selling_price, CONSTANTS.MAX_ENERGY_PRICE)
+        self._selling_price *= self._uniform("selling_price", 0.9, 1.1)
+        simulation = Simulation.current()
+        self._selling_price = max(self._selling_price, simulation.min_price)
+        self._selling_price = min(self._selling_price, simulation.max_price)
     
     @property
     def eligible(self) -> bool:
@@ -93,7 +113,7 @@ class Seller(Agent):
         agent: the agent to examine
         strict: when set to true, cause the function to raise an error when type of agent is not suitable for transaction
         """
-        if hasattr(agent, 'demand') and hasattr(agent, 'buying_price'):
+        if hasattr(agent, 'demand') and hasattr(agent, 'buying_price') and agent.buying_price is not None:
             return self.in_price_range(agent.buying_price)
         elif strict:
             raise AttributeError("Agent doesn't have a demand or a buyer_price attribute and is trying to aprove for business with a seller")
@@ -0,0 +1,123 @@
+"""
+This file contains the context of one simulation, owning everything that used to be shared by the whole process.
+
+A Simulation holds the registries of the agents created while it is current, its grid, its market and the ledger of
+that market, its state objects, the population agents are stored in by default, its price limits and its random
+number generators. Grid(), Market(...), AgentPopulation.default(), RandomStreams.default() and the registries of the
+agent classes all resolve to the current simulation, which is kept in a context variable: every thread and every
+asyncio task sees its own, so independent simulations can be built, run and torn down one after the other or side by
+side in one process without sharing any state. Code that never enters a Simulation runs in the default one of the
+process, as it always did.
+"""
+
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Iterator, Union
+import random
+
+import numpy as np
+
+import CONSTANTS
+
+_current: ContextVar[Simulation] = ContextVar("simulation")
+_default: Union[Simulation, None] = None
+
+
+class Simulation:
+    """
+    Everything one simulation owns. Enter it with a with statement to make it the current simulation, leaving it
+    makes the previous one current again and, unless keep is set, releases what it holds.
+
+    Parameters:
+    max_price: highest price per unit of energy, defaults to CONSTANTS.MAX_ENERGY_PRICE
+    min_price: lowest price per unit of energy, defaults to CONSTANTS.MIN_ENERGY_PRICE
+    seed: seeds the random streams of the agents and the random module generator of the simulation, random when
+    not given
+    keep: when True leaving the with statement keeps the agents, grid and market, e.g. to read them afterwards
+    """
+
+    def __init__(self, max_price: float = None, min_price: float = None,
+                 seed: Union[np.random.SeedSequence, int, None] = None, keep: bool = False) -> None:
+        self.max_price = CONSTANTS.MAX_ENERGY_PRICE if max_price is None else max_price
+        self.min_price = CONSTANTS.MIN_ENERGY_PRICE if min_price is None else min_price
+        self.seed = seed
+        self.keep = keep
+        self.random = random.Random(seed if not isinstance(seed, np.random.SeedSequence)
+                                    else int(seed.generate_state(1)[0]))
+        self._tokens: list[Token] = []
+        self._release()
+
+    def _release(self) -> None:
+        self.agents: list = []
+        self.buyers: list = []
+        self.sellers: list = []
+        self.prosumers: list = []
+        self.grid = None            # set by Grid() the first time it's called in this simulation
+        self.market = None          # set by Market(...) the first time it's called in this simulation
+        self.population = None      # set by AgentPopulation.default()
+        self.streams = None         # set by RandomStreams.default() or RandomStreams.seed()
+        self.states: dict[type, object] = {}
+
+    @staticmethod
+    def current() -> Simulation:
+        """Returns: The simulation entered last in this context, the default simulation of the process if none is"""
+        simulation = _current.get(None)
+        return default() if simulation is None else simulation
+
+    @property
+    def ledger(self):
+        """Returns: The ledger of the market of the simulation, None before a market is created"""
+        return None if self.market is None else self.market._ledger
+
+    def set_energy_prices(self, max_price: float, min_price: float) -> None:
+        self.max_price = max_price
+        self.min_price = min_price
+
+    @contextmanager
+    def activate(self) -> Iterator[Simulation]:
+        """Makes the simulation current within a with statement, without releasing anything when it ends"""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def close(self) -> None:
+        """
+        Forgets the agents, grid, market, population and random streams of the simulation, so that nothing of a
+        finished run is kept alive. The ledger isn't closed, Market.close does that.
+        """
+        self._release()
+
+    def __enter__(self) -> Simulation:
+        self._tokens.append(_current.set(self))
+        return self
+
+    def __exit__(self, *exc) -> None:
+        _current.reset(self._tokens.pop())
+        if not self.keep and not self._tokens:
+            self.close()
+
+
+class Registry:
+    """
+    Descriptor exposing one registry of the current simulation as a class attribute, e.g. Buyer._all_buyers
+
+    Parameters:
+    name: name of the registry, one of agents, buyers, sellers and prosumers
+    """
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+
+    def __get__(self, view, owner=None) -> list:
+        return getattr(Simulation.current(), self._name)
+
+
+def default() -> Simulation:
+    """Returns: The simulation of the process, current whenever no other simulation was entered"""
+    global _default
+    if _default is None:
+        _default = Simulation()
+    return _default
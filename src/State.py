@@ -8,7 +8,9 @@ Classes:
     other classes that might define states inheriting from state and having singleton as a metaclass
 """
 from abc import ABCMeta
-import random
+import bisect
+
+from Simulation import Simulation
 
 class Singleton(type):
     """
@@ -33,11 +35,11 @@ class State(metaclass=ABCMeta):
 
     _multiplier = 1.0
 
-    _instance = None
     def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
+        states = Simulation.current().states
+        if cls not in states:
+            states[cls] = super().__new__(cls)
+        return states[cls]
 
     @property
     def name(self) -> str:
@@ -85,19 +87,62 @@ class Conservative(State):
     """
     modulation_factor = 1.1
 
+STATES: tuple[type[State], ...] = (Normal, Desperate, Conservative)
+
+STATE_CODES: dict[type[State], int] = {state: code for code, state in enumerate(STATES)}
+STATE_NAMES: tuple[str, ...] = tuple(state.__name__ for state in STATES)
+MODULATION_FACTORS: tuple[float, ...] = tuple(state().modulation_factor for state in STATES)
+_STATES_BY_NAME: dict[str, type[State]] = dict(zip(STATE_NAMES, STATES))
+
+def state_code(state: State) -> int:
+    """
+    Returns:
+        The index of the state's class in STATES, used to store states compactly.
+    """
+    return STATE_CODES[type(state)]
+
 def get_state_by_name(name: str) -> State:
     """
     Returns:
         The state with the given name.
     """
     try:
-        return eval(name)()
-    except NameError:
-        raise ValueError(f"No state with name {name}") from NameError
+        return _STATES_BY_NAME[name]()
+    except KeyError:
+        raise ValueError(f"No state with name {name}") from None
 
-def get_state_randomly() -> State: 
+def get_state_randomly() -> State:
     """
     Returns:
         A random state.
     """
-    return random.choice(list(State.__subclasses__()))()
\ No newline at end of file
+    return Simulation.current().random.choice(STATES)()
+
+def cumulative_transitions(transitions: tuple[tuple[float, ...], ...]) -> tuple[tuple[float, ...], ...]:
+    """
+    Parameters:
+        transitions: Markov transition matrix between STATES, row i holding the probabilities of moving from
+            STATES[i] to every state.
+
+    Returns:
+        The cumulative probabilities of every row of the matrix.
+    """
+    if len(transitions) != len(STATES) or any(len(row) != len(STATES) for row in transitions):
+        raise ValueError(f"State transitions must be a {len(STATES)}x{len(STATES)} matrix")
+    cumulative = []
+    for row in transitions:
+        if any(probability < 0 for probability in row) or abs(sum(row) - 1) > 1e-9:
+            raise ValueError(f"State transition probabilities {row} must be non-negative and sum to 1")
+        total, sums = 0.0, []
+        for probability in row:
+            total += probability
+            sums.append(total)
+        cumulative.append(tuple(sums))
+    return tuple(cumulative)
+
+def next_state_code(code: int, draw: float, cumulative: tuple[tuple[float, ...], ...]) -> int:
+    """
+    Returns:
+        The code of the state an agent in the state of the given code moves to, for a draw uniform in [0, 1).
+    """
+    return min(bisect.bisect_right(cumulative[code], draw), len(STATES) - 1)
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+This file contains a parameter sweep running the market over a grid of configurations, with a cache of results.
+
+Every point of a sweep is a fully resolved configuration: price limits, number of rounds, starting tolerance,
+population mix and size, market mode and seed. Its result is stored in an on-disk cache under the hash of the point,
+of the consumer data the populations are drawn from and of the source code of the simulation, so that a point is only
+ever run again when one of them changes. Points missing from the cache are run in parallel worker processes. When the
+cache grows past its size limit the results used least recently are evicted.
+"""
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, NamedTuple, Union
+import glob
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+
+import numpy as np
+
+import CONSTANTS
+from Market import Market
+from PopulationGenerator import Distribution, PopulationGenerator, PopulationSpec
+from ScenarioRunner import RunSummary, SummarySink, summarize
+from Simulation import Simulation
+from input_data import cache_key, load_data
+
+# Modes that need nothing but a population, the others also need profiles or a topology
+SWEEP_MODES = ("ideal_fair", "real_world", "order_book", "call_auction", "async", "welfare")
+
+_pv_capacity: Union[np.ndarray, None] = None
+
+
+class SweepPoint(NamedTuple):
+    max_price: float = CONSTANTS.MAX_ENERGY_PRICE
+    min_price: float = CONSTANTS.MIN_ENERGY_PRICE
+    max_rounds: int = CONSTANTS.MAX_MARKET_ROUNDS
+    tolerance: float = 0.1                              # tolerance every agent starts with
+    mix: tuple[float, float, float] = (0.2, 0.2, 0.6)   # fractions of buyers, sellers and prosumers
+    size: int = 1_000
+    mode: str = CONSTANTS.MARKET_MODE
+    seed: int = 0
+
+
+def sweep_grid(**values: Iterable) -> list[SweepPoint]:
+    """
+    Returns: One point for every combination of the given values, keyed by SweepPoint field, the other fields
+    keeping their defaults. sweep_grid(max_price=(8, 10), seed=range(3)) gives 6 points.
+    """
+    unknown = set(values) - set(SweepPoint._fields)
+    if unknown:
+        raise ValueError(f"No sweep parameters named {', '.join(sorted(unknown))}")
+    names = list(values)
+    return [SweepPoint(**dict(zip(names, combination)))
+            for combination in itertools.product(*(list(values[name]) for name in names))]
+
+
+def _source_hash() -> str:
+    """Returns: The hash of the source code of the simulation, so that results are never reused across changes"""
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+        with open(path, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def point_key(point: SweepPoint, data_key: str = None, source_hash: str = None) -> str:
+    """
+    Returns: The content address of the result of a point, the hash of the point, of the consumer data and of the
+    source code of the simulation
+    """
+    resolved = {
+        "point": point._asdict(),
+        "state_transitions": CONSTANTS.STATE_TRANSITIONS,
+        "data": data_key,
+        "source": _source_hash() if source_hash is None else source_hash,
+    }
+    return hashlib.sha256(json.dumps(resolved, sort_keys=True).encode()).hexdigest()[:32]
+
+
+class ResultCache:
+    """
+    Results of sweep points stored as .npz files named after their key, in a directory of bounded size.
+
+    Parameters:
+    path: directory of the cache, defaults to CONSTANTS.SWEEP_CACHE_DIR
+    max_bytes: size the cache is evicted down to, least recently used results first, defaults to
+    CONSTANTS.SWEEP_CACHE_BYTES
+    """
+
+    def __init__(self, path: str = None, max_bytes: int = None) -> None:
+        self.path = CONSTANTS.SWEEP_CACHE_DIR if path is None else path
+        self.max_bytes = CONSTANTS.SWEEP_CACHE_BYTES if max_bytes is None else max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.npz")
+
+    def get(self, key: str) -> Union[RunSummary, None]:
+        """Returns: The cached result of the key, None when it isn't cached"""
+        file = self._file(key)
+        try:
+            with np.load(file) as archive:
+                fields = {name: archive[name] for name in RunSummary._fields}
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return None
+        os.utime(file)
+        return RunSummary(**{name: value.item() if value.ndim == 0 else value for name, value in fields.items()})
+
+    def put(self, key: str, summary: RunSummary) -> None:
+        """Stores a result, written to a temporary file first so readers never see half of it, then evicts"""
+        descriptor, temporary = tempfile.mkstemp(dir=self.path, suffix=".tmp.npz")
+        with os.fdopen(descriptor, "wb") as file:
+            np.savez(file, **summary._asdict())
+        os.replace(temporary, self._file(key))
+        self.evict()
+
+    def size(self) -> int:
+        """Returns: The number of bytes the cached results take"""
+        return sum(os.path.getsize(file) for file in glob.glob(os.path.join(self.path, "*.npz")))
+
+    def evict(self) -> list[str]:
+        """
+        Deletes the results used least recently until the cache fits in max_bytes
+
+        Returns: The keys of the deleted results
+        """
+        files = []
+        for file in glob.glob(os.path.join(self.path, "*.npz")):
+            if file.endswith(".tmp.npz"):
+                continue
+            stat = os.stat(file)
+            files.append((stat.st_mtime_ns, stat.st_size, file))
+        total = sum(size for _, size, _ in files)
+
+        evicted = []
+        for _, size, file in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(file)
+            total -= size
+            evicted.append(os.path.basename(file)[:-4])
+        return evicted
+
+
+def _load_pv_capacity(data_path: Union[str, None]) -> None:
+    """Worker initializer, maps the PV capacities of the cached consumer data once per process"""
+    global _pv_capacity
+    _pv_capacity = None if data_path is None else np.asarray(load_data(data_path)["PV Capacity"], dtype=np.float64)
+
+
+def run_point(point: SweepPoint) -> RunSummary:
+    """
+    Runs the market at one point of a sweep. The generation of sellers and prosumers is drawn from the PV capacities
+    of the consumer data loaded in this process, if any.
+    """
+    if point.mode not in SWEEP_MODES:
+        raise ValueError(f"Sweeps can't run the {point.mode} mode, only {', '.join(SWEEP_MODES)}")
+    with Simulation(point.max_price, point.min_price, point.seed):
+        spec = PopulationSpec(mix=point.mix)
+        if _pv_capacity is not None:
+            spec = spec._replace(pv_capacity=Distribution("choice", (_pv_capacity, None)))
+        buyers, sellers = PopulationGenerator(spec, np.random.default_rng(point.seed)).create_agents(point.size)
+        population = buyers[0]._pool if buyers else sellers[0]._pool
+        population.tolerance[:] = point.tolerance
+
+        sink = SummarySink(CONSTANTS.LEDGER_HEADERS)
+        market = Market(point.max_price, point.min_price, sink)
+        market.max_rounds = point.max_rounds
+        market.run(buyers, sellers, point.mode)
+        sink.close()
+        return summarize(point.seed, sink, buyers + sellers)
+
+
+def run_sweep(points: list[SweepPoint], cache: ResultCache = None, workers: int = None,
+              data_path: str = None) -> list[RunSummary]:
+    """
+    Runs the market at every point missing from the cache, in parallel, and caches their results
+
+    Parameters:
+    points: the points of the sweep, e.g. from sweep_grid
+    cache: cache of results, defaults to ResultCache()
+    workers: number of worker processes, defaults to the number of CPUs
+    data_path: consumer data the PV capacities are drawn from, the PopulationSpec default when not given
+
+    Returns: The result of every point, in the order of points
+    """
+    cache = ResultCache() if cache is None else cache
+    data_key = None
+    if data_path is not None:
+        # Parses the data into the cache once, so that the workers only have to map it
+        load_data(data_path)
+        data_key = cache_key(data_path)
+    source_hash = _source_hash()
+
+    keys = [point_key(point, data_key, source_hash) for point in points]
+    results = [cache.get(key) for key in keys]
+    missing = {}
+    for position, (key, result) in enumerate(zip(keys, results)):
+        if result is None:
+            missing.setdefault(key, []).append(position)
+
+    if missing:
+        pending = [points[positions[0]] for positions in missing.values()]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_load_pv_capacity, initargs=(data_path,)) as pool:
+            for (key, positions), summary in zip(missing.items(), pool.map(run_point, pending)):
+                cache.put(key, summary)
+                for position in positions:
+                    results[position] = summary
+    return results
@@ -0,0 +1,122 @@
+"""
+This file contains the feeder topology of the grid the agents are connected to.
+
+Every agent sits on one feeder, the feeder number being stored in the feeder column of its population. Trades between
+agents of the same feeder stay on the feeder and are not limited. Trades between feeders go through the line that
+connects each feeder to the rest of the grid, which can carry at most the feeder's line capacity per round in each
+direction.
+
+A round first clears every feeder on its own with a call auction, in parallel worker processes when asked to, then
+clears what is left of all the orders in one balancing auction whose flows are curtailed to the line capacities.
+"""
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Union
+
+import numpy as np
+
+from AgentPopulation import AgentPopulation
+from CallAuction import CallAuction, Clearing, clear
+
+
+def _clear_orders(orders: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]) -> Union[Clearing, None]:
+    return clear(*orders)
+
+
+def limit_flows(clearing: Clearing, bid_feeders: np.ndarray, ask_feeders: np.ndarray,
+                capacities: np.ndarray) -> Union[Clearing, None]:
+    """
+    Curtails the fills of a clearing across feeders so that no feeder imports or exports more than its line capacity
+
+    The fills of a feeder over its capacity are scaled down pro-rata, then the side left with more energy is scaled
+    down to match the other one, which only lowers the flows further.
+
+    Returns: The curtailed clearing, None when nothing can flow
+    """
+    feeders = len(capacities)
+    imports = np.bincount(bid_feeders, clearing.bid_fills, minlength=feeders)
+    exports = np.bincount(ask_feeders, clearing.ask_fills, minlength=feeders)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        import_factors = np.where(imports > capacities, capacities / imports, 1.0)
+        export_factors = np.where(exports > capacities, capacities / exports, 1.0)
+    bid_fills = clearing.bid_fills * import_factors[bid_feeders]
+    ask_fills = clearing.ask_fills * export_factors[ask_feeders]
+
+    volume = min(bid_fills.sum(), ask_fills.sum())
+    if volume <= 0:
+        return None
+    bid_fills *= volume / bid_fills.sum()
+    ask_fills *= volume / ask_fills.sum()
+    return Clearing(clearing.price, float(volume), bid_fills, ask_fills)
+
+
+class Topology:
+    """
+    Class holding the line capacities of the feeders and clearing rounds feeder by feeder.
+
+    Parameters:
+    capacities: the line capacity of every feeder, numbered from 0, np.inf for an unlimited line
+    workers: number of worker processes clearing feeders in parallel, 1 to clear them in this process
+    """
+
+    def __init__(self, capacities: Iterable[float], workers: int = 1) -> None:
+        self.capacities = np.asarray(capacities, dtype=np.float64)
+        self.workers = workers
+        self._pool: Union[ProcessPoolExecutor, None] = None
+
+    @property
+    def feeders(self) -> int:
+        return len(self.capacities)
+
+    def close(self) -> None:
+        """Stops the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    @staticmethod
+    def assign(agents: list, feeders: Iterable[int]) -> None:
+        """Puts every agent on the feeder given for it"""
+        feeders = np.asarray(list(feeders), dtype=np.int32)
+        for population, rows in AgentPopulation.group(agents).items():
+            positions = [position for position, agent in enumerate(agents) if agent._pool is population]
+            population.feeder[rows] = feeders[positions]
+
+    def assign_randomly(self, agents: list, rng: np.random.Generator = None) -> None:
+        """Puts every agent on a feeder drawn uniformly at random"""
+        rng = np.random.default_rng() if rng is None else rng
+        self.assign(agents, rng.integers(0, self.feeders, len(agents)))
+
+    def local_auctions(self, agents: list) -> list[CallAuction]:
+        """Returns: One call auction per feeder holding the orders of the agents on it"""
+        auction = CallAuction()
+        auction.submit_all(agents)
+        return auction.by_feeder(self.feeders)
+
+    def clear_locally(self, auctions: list[CallAuction]) -> list[list]:
+        """
+        Clears every feeder's auction, in the worker processes when there are more than one
+
+        Returns: The trades of every auction
+        """
+        orders = [auction.orders() for auction in auctions]
+        if self.workers > 1:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            clearings = list(self._pool.map(_clear_orders, orders, chunksize=max(len(orders) // self.workers, 1)))
+        else:
+            clearings = [_clear_orders(feeder_orders) for feeder_orders in orders]
+        return [auction.apply(clearing) for auction, clearing in zip(auctions, clearings)]
+
+    def balance(self, auctions: list[CallAuction]) -> tuple[CallAuction, list]:
+        """
+        Clears what is left of the orders of the local auctions across feeders, within the line capacities
+
+        Returns: The balancing auction and its trades
+        """
+        balancing = CallAuction.merge([auction.residual() for auction in auctions])
+        clearing = clear(*balancing.orders())
+        if clearing is not None:
+            clearing = limit_flows(clearing, *balancing.feeders(), self.capacities)
+        return balancing, balancing.apply(clearing)
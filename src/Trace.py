@@ -0,0 +1,269 @@
+"""
+This file contains deterministic traces of market runs, recorded to a compact binary log and replayed from it.
+
+A trace holds the initial state of the populations and the order of the buyers and sellers given to the market, every
+random draw the agents make during every round (state resets, price and tolerance modulation), keyed by stream, agent
+id and draw counter, and the trades written to the ledger in every round. Replaying a trace drives a market from the
+same initial state with the recorded draws in place of the random streams, so its trades can be diffed against the
+recorded ones: an engine that matches every trade of a trace is equivalent to the one that recorded it on that trace,
+and both can be benchmarked on it.
+
+The log is a gzip compressed sequence of NumPy arrays: a header, the columns of every population, the placement of the
+buyers and of the sellers, then one record per round holding its draws and its trades.
+"""
+
+from __future__ import annotations
+from typing import Iterator, NamedTuple, Union
+import gzip
+import json
+
+import numpy as np
+
+import CONSTANTS
+from Agent import Agent
+from AgentPopulation import AgentPopulation
+from Checkpoint import Checkpointer, _placement
+from Grid import Grid
+from LedgerSink import Row
+from RandomStreams import STREAMS, RandomStreams
+from Simulation import Simulation
+
+TRACE_VERSION = 1
+
+# Bits of the key of a draw given to the draw counter and to the agent id, the rest going to the stream
+_COUNTER_BITS = 26
+_ID_BITS = 32
+
+
+class TraceDiverged(ValueError):
+    """Raised when a replay asks for a draw its trace doesn't hold, having diverged from the recorded run"""
+
+
+class RoundTrace(NamedTuple):
+    market_round: int
+    streams: np.ndarray         # STREAMS index of every draw
+    ids: np.ndarray             # id of the agent of every draw
+    counters: np.ndarray        # number of draws the agent made in the stream before this one
+    values: np.ndarray          # every draw, uniform in [0, 1)
+    trades: np.ndarray          # ledger entries of the round, one row per trade
+
+
+class Trace(NamedTuple):
+    mode: str
+    start_round: int
+    max_rounds: int
+    max_price: float
+    min_price: float
+    grid_drain: float
+    populations: list[AgentPopulation]
+    buyers: np.ndarray          # population and row of every buyer, see Checkpoint._placement
+    sellers: np.ndarray
+    rounds: list[RoundTrace]
+
+    def agents(self) -> tuple[list[Agent], list[Agent]]:
+        """Returns: New buyers and sellers viewing the populations of the trace, registered in the current simulation"""
+        return (Checkpointer._agents(self.buyers, self.populations),
+                Checkpointer._agents(self.sellers, self.populations))
+
+    def draws(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns: The streams, ids, counters and values of the draws of every round"""
+        return tuple(np.concatenate([getattr(record, field) for record in self.rounds])
+                     for field in ("streams", "ids", "counters", "values"))
+
+    def trades(self) -> np.ndarray:
+        """Returns: The trades of every round, in order"""
+        return np.concatenate([record.trades for record in self.rounds]).reshape(-1, len(CONSTANTS.LEDGER_HEADERS))
+
+
+def _keys(streams: np.ndarray, ids: np.ndarray, counters: np.ndarray) -> np.ndarray:
+    ids, counters = np.asarray(ids, dtype=np.uint64), np.asarray(counters, dtype=np.uint64)
+    if (ids >> np.uint64(_ID_BITS)).any() or (counters >> np.uint64(_COUNTER_BITS)).any():
+        raise ValueError(f"Traces only hold agent ids below 2**{_ID_BITS} and {2**_COUNTER_BITS} draws per agent")
+    return ((np.asarray(streams, dtype=np.uint64) << np.uint64(_ID_BITS + _COUNTER_BITS))
+            | (ids << np.uint64(_COUNTER_BITS)) | counters)
+
+
+class RecordingStreams(RandomStreams):
+    """
+    Random streams keeping every draw made from them until taken
+
+    Parameters:
+    streams: the streams the draws are made from
+    """
+
+    def __init__(self, streams: RandomStreams) -> None:
+        super().__init__(streams.seed_sequence)
+        self._draws: list[tuple[int, np.ndarray, np.ndarray, np.ndarray]] = []
+        self._singles: list[tuple[int, int, int, float]] = []
+
+    def random(self, stream: str, ids: np.ndarray, counters: np.ndarray) -> np.ndarray:
+        values = super().random(stream, ids, counters)
+        self._draws.append((STREAMS.index(stream), np.asarray(ids), np.asarray(counters), values))
+        return values
+
+    def random_one(self, stream: str, agent_id: int, counter: int) -> float:
+        value = super().random_one(stream, agent_id, counter)
+        self._singles.append((STREAMS.index(stream), agent_id, counter, value))
+        return value
+
+    def take(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns: The streams, ids, counters and values of the draws made since the last take, forgetting them"""
+        draws = [(np.full(len(ids), stream, dtype=np.uint8), ids, counters, values)
+                 for stream, ids, counters, values in self._draws]
+        if self._singles:
+            streams, ids, counters, values = zip(*self._singles)
+            draws.append((np.array(streams, dtype=np.uint8), np.array(ids), np.array(counters), np.array(values)))
+        self._draws, self._singles = [], []
+        if not draws:
+            return (np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                    np.zeros(0))
+        return (np.concatenate([streams for streams, _, _, _ in draws]),
+                np.concatenate([ids for _, ids, _, _ in draws]).astype(np.int64),
+                np.concatenate([counters for _, _, counters, _ in draws]).astype(np.int64),
+                np.concatenate([values for _, _, _, values in draws]).astype(np.float64))
+
+
+class ReplayStreams(RandomStreams):
+    """
+    Random streams giving back the draws of a trace instead of computing them, raising TraceDiverged for a draw the
+    trace doesn't hold
+
+    Parameters:
+    streams: STREAMS index of every draw
+    ids: id of the agent of every draw
+    counters: draw counter of every draw
+    values: every draw
+    """
+
+    def __init__(self, streams: np.ndarray, ids: np.ndarray, counters: np.ndarray, values: np.ndarray) -> None:
+        super().__init__(0)
+        keys = _keys(streams, ids, counters)
+        order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[order]
+        self._values = np.asarray(values, dtype=np.float64)[order]
+
+    def random(self, stream: str, ids: np.ndarray, counters: np.ndarray) -> np.ndarray:
+        ids, counters = np.atleast_1d(ids), np.atleast_1d(counters)
+        keys = _keys(np.full(len(ids), STREAMS.index(stream)), ids, counters)
+        if len(self._sorted_keys):
+            found = np.minimum(np.searchsorted(self._sorted_keys, keys), len(self._sorted_keys) - 1)
+            missing = self._sorted_keys[found] != keys
+        else:
+            found, missing = np.zeros(len(keys), dtype=np.int64), np.ones(len(keys), dtype=bool)
+        if missing.any():
+            first = np.flatnonzero(missing)[0]
+            raise TraceDiverged(f"The trace has no draw {counters[first]} of agent {ids[first]} in the {stream} stream")
+        return self._values[found]
+
+    def random_one(self, stream: str, agent_id: int, counter: int) -> float:
+        return self.random(stream, np.array([agent_id]), np.array([counter])).item()
+
+
+def _write(file, array: np.ndarray) -> None:
+    np.lib.format.write_array(file, np.ascontiguousarray(array), allow_pickle=False)
+
+
+def _read(file) -> np.ndarray:
+    return np.lib.format.read_array(file, allow_pickle=False)
+
+
+class TraceRecorder:
+    """
+    Records a market run to a trace file. Give it to the market, which starts it at the beginning of a run, hands it
+    every round and stops it at the end.
+
+    Parameters:
+    path: file the trace is written to
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = None
+        self._streams: Union[RecordingStreams, None] = None
+        self._trades: list[Row] = []
+        self._round = 0
+
+    def start(self, buyers: list[Agent], sellers: list[Agent], mode: str, start_round: int, max_rounds: int,
+              ledger) -> None:
+        """
+        Writes the header and the initial state of the agents, then records the draws of the current simulation and
+        the entries of the given ledger
+        """
+        simulation = Simulation.current()
+        populations = list(AgentPopulation.group(buyers + sellers))
+        header = {
+            "version": TRACE_VERSION,
+            "mode": mode,
+            "start_round": start_round,
+            "max_rounds": max_rounds,
+            "max_price": simulation.max_price,
+            "min_price": simulation.min_price,
+            "grid_drain": Grid().get_drained_energy(),
+            "sizes": [len(population) for population in populations],
+            "columns": list(AgentPopulation._COLUMNS),
+        }
+        self._file = gzip.open(self.path, "wb")
+        _write(self._file, np.frombuffer(json.dumps(header).encode(), dtype=np.uint8))
+        for population in populations:
+            for name in AgentPopulation._COLUMNS:
+                _write(self._file, getattr(population, name))
+        _write(self._file, _placement(buyers, populations))
+        _write(self._file, _placement(sellers, populations))
+
+        self._streams = simulation.streams = RecordingStreams(RandomStreams.default())
+        self._streams.take()
+        ledger.add_listener(self._trades.extend)
+
+    def begin_round(self, market_round: int) -> None:
+        self._round = market_round
+
+    def end_round(self) -> None:
+        """Writes the draws and the trades of the round"""
+        if self._file is None:
+            return
+        for array in (np.array([self._round], dtype=np.int64), *self._streams.take(),
+                      np.array(self._trades, dtype=np.float64).reshape(-1, len(CONSTANTS.LEDGER_HEADERS))):
+            _write(self._file, array)
+        self._trades.clear()
+
+    def stop(self) -> None:
+        """Closes the trace file, the draws that follow are no longer recorded"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            simulation = Simulation.current()
+            if simulation.streams is self._streams:
+                simulation.streams = RandomStreams(self._streams.seed_sequence)
+
+
+def read_trace(path: str) -> Trace:
+    """Returns: The trace recorded to a file, its populations being new ones"""
+    with gzip.open(path, "rb") as file:
+        header = json.loads(_read(file).tobytes().decode())
+        if header["version"] != TRACE_VERSION:
+            raise ValueError(f"Can't read version {header['version']} traces, only version {TRACE_VERSION}")
+
+        populations = []
+        for size in header["sizes"]:
+            population = AgentPopulation(allocated=size)
+            population.allocate(size)
+            for name in header["columns"]:
+                column = _read(file)
+                if name in AgentPopulation._COLUMNS:
+                    population._data[name][:size] = column
+            populations.append(population)
+        buyers, sellers = _read(file).reshape(-1, 2), _read(file).reshape(-1, 2)
+
+        rounds = []
+        for market_round in _records(file):
+            streams, ids, counters, values, trades = (_read(file) for _ in range(5))
+            rounds.append(RoundTrace(market_round, streams, ids, counters, values, trades))
+
+    return Trace(header["mode"], header["start_round"], header["max_rounds"], header["max_price"],
+                 header["min_price"], header["grid_drain"], populations, buyers, sellers, rounds)
+
+
+def _records(file) -> Iterator[int]:
+    """Returns: The round of every record left in the file, read as the records are"""
+    while file.peek(1):
+        yield _read(file).item()
@@ -0,0 +1,391 @@
+"""
+This file contains an allocation of a whole market round that maximises the surplus of the trades.
+
+Every eligible buyer can buy its demand, capped to what it can afford at its own limit, from any seller whose selling
+price it accepts and who accepts its buying price, the checks of Agent.check_match_for_business, and pays the selling
+price per unit. The surplus of a unit traded is the highest price per unit the buyer accepts less the lowest one the
+seller accepts, and the round is allocated so that the trades add up to the most surplus, a transport problem.
+
+Pairs of agents are never enumerated. Sellers are put in the cells of a grid of bands of prices, by their selling price
+and their limit, and buyers are grouped into classes by their limit and their buying price, all rounded to a band on
+the safe side so that every buyer of a class can trade with every seller of a cell the class can trade with. The cells
+a class can trade with make up a quadrant of the grid, so the graph of the classes and cells that can trade is never
+built either, only read from the grid.
+
+As the surplus of a unit is the value of the buyer less the cost of the seller, moving energy along an augmenting path
+of the graph costs what the free cell it ends at costs, whatever cells it goes through. Classes are served in order of
+value, each one along the augmenting path ending at the cheapest free cell it can reach, for as long as that leaves some
+surplus. Serving the classes of most value first, no later class is ever worth serving at the expense of an earlier
+one, so every class only adds to the allocation of the classes before it, and the allocation is the one with the most
+surplus between classes. The energy of every class and cell is then handed to their members, best limits first, and
+split into bilateral trades.
+"""
+
+from __future__ import annotations
+from typing import NamedTuple, Union
+
+import numpy as np
+
+import CONSTANTS
+from AgentPopulation import AgentPopulation
+from CallAuction import RoundOrders, Trade
+
+_TOLERANCE = 1e-9
+
+
+class SellerGrid(NamedTuple):
+    cells: np.ndarray           # cell of every ask, row major
+    rows: int                   # bands of selling prices, the first one being the lowest selling price of the asks
+    columns: int                # bands of limits, the first one being the lowest limit of the asks
+    first_row: int              # band of the first row
+    first_column: int           # band of the first column
+    capacities: np.ndarray      # energy offered by every cell
+    costs: np.ndarray           # limit of every column, the upper bound of its band
+
+
+class BuyerClasses(NamedTuple):
+    classes: np.ndarray         # class of every bid
+    rows: np.ndarray            # last row of the grid every class can trade with
+    columns: np.ndarray         # last column of the grid every class can trade with
+    values: np.ndarray          # limit of every class, the lower bound of its band
+    quantities: np.ndarray      # energy every class wants
+
+
+class Allocation(NamedTuple):
+    bids: np.ndarray            # bid index of every trade
+    asks: np.ndarray            # ask index of every trade
+    energy: np.ndarray          # energy of every trade
+    bid_fills: np.ndarray       # energy bought by every bid, in the order the bids were submitted
+    ask_fills: np.ndarray       # energy sold by every ask, in the order the asks were submitted
+    surplus: float              # surplus of all the trades, at the limits of the agents
+
+
+def seller_grid(selling_prices: np.ndarray, ask_limits: np.ndarray, ask_quantities: np.ndarray,
+                band: float) -> SellerGrid:
+    """Returns: The grid of the given asks, their selling prices and limits being rounded up to a band"""
+    selling = np.ceil(selling_prices / band).astype(np.int64)
+    limits = np.ceil(ask_limits / band).astype(np.int64)
+    first_row, first_column = selling.min().item(), limits.min().item()
+    rows, columns = selling.max().item() - first_row + 1, limits.max().item() - first_column + 1
+    cells = (selling - first_row) * columns + (limits - first_column)
+    capacities = np.bincount(cells, ask_quantities, rows * columns)
+    costs = np.arange(first_column, first_column + columns) * band
+    return SellerGrid(cells, rows, columns, first_row, first_column, capacities, costs)
+
+
+def buyer_classes(grid: SellerGrid, bid_limits: np.ndarray, buying_prices: np.ndarray, bid_quantities: np.ndarray,
+                  band: float) -> BuyerClasses:
+    """
+    Returns: The classes of the given bids, their limits and buying prices being rounded down to a band. Bids that
+    can't trade with any cell of the grid are left in no class, class -1.
+    """
+    limits = np.floor(bid_limits / band).astype(np.int64)
+    rows = limits - grid.first_row
+    columns = np.minimum(np.floor(buying_prices / band).astype(np.int64) - grid.first_column, grid.columns - 1)
+    reachable = (rows >= 0) & (columns >= 0)
+
+    classes = np.full(len(bid_limits), -1, dtype=np.int64)
+    if not reachable.any():
+        empty = np.zeros(0, dtype=np.int64)
+        return BuyerClasses(classes, empty, empty, np.zeros(0), np.zeros(0))
+    keys, classes[reachable] = np.unique(np.stack((limits[reachable], columns[reachable]), axis=1), axis=0,
+                                         return_inverse=True)
+    return BuyerClasses(classes, np.minimum(keys[:, 0] - grid.first_row, grid.rows - 1), keys[:, 1], keys[:, 0] * band,
+                        np.bincount(classes[reachable], bid_quantities[reachable], len(keys)))
+
+
+class _Transport:
+    """
+    The transport problem between buyer classes and the cells of a seller grid, solved one class at a time by
+    augmenting paths
+
+    Parameters:
+    grid: the seller grid
+    classes: the buyer classes
+    """
+
+    def __init__(self, grid: SellerGrid, classes: BuyerClasses) -> None:
+        self.grid = grid
+        self.classes = classes
+        self.spare = grid.capacities.copy()
+        spare = self.spare.reshape(grid.rows, grid.columns) > _TOLERANCE
+        # Cheapest free column of every row, columns when the row is full
+        self.cheapest = np.where(spare.any(axis=1), spare.argmax(axis=1), grid.columns)
+
+        self._flows: dict[tuple[int, int], int] = {}
+        self.flow_classes = np.zeros(1024, dtype=np.int64)
+        self.flow_cells = np.zeros(1024, dtype=np.int64)
+        self.flow_energy = np.zeros(1024)
+        self.flow_count = 0
+
+    def _flow(self, cls: int, cell: int) -> int:
+        """Returns: The index of the energy flowing from a cell to a class, added if there is none yet"""
+        if (index := self._flows.get((cls, cell))) is None:
+            index = self._flows[(cls, cell)] = self.flow_count
+            if index == len(self.flow_energy):
+                self.flow_classes = np.concatenate((self.flow_classes, np.zeros(index, dtype=np.int64)))
+                self.flow_cells = np.concatenate((self.flow_cells, np.zeros(index, dtype=np.int64)))
+                self.flow_energy = np.concatenate((self.flow_energy, np.zeros(index)))
+            self.flow_classes[index], self.flow_cells[index] = cls, cell
+            self.flow_count += 1
+        return index
+
+    def reach(self, cls: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Finds every cell an augmenting path from a class reaches: the quadrant of the class, then the quadrants of the
+        classes that energy flows to from the cells reached, and so on
+
+        Returns: The last column reached in every row, the class every cell was reached from and the cell every
+        class was reached through
+        """
+        grid, classes = self.grid, self.classes
+        count = len(classes.values)
+        last = np.full(grid.rows, -1, dtype=np.int64)
+        reached_from = np.full(grid.rows * grid.columns, -1, dtype=np.int64)
+        reached_through = np.full(count, -1, dtype=np.int64)
+        reached_through[cls] = grid.rows * grid.columns
+        flowing = self.flow_energy[:self.flow_count] > _TOLERANCE
+        flow_classes, flow_cells = self.flow_classes[:self.flow_count][flowing], self.flow_cells[:self.flow_count][flowing]
+
+        new = np.array([cls])
+        while len(new):
+            # The widest quadrant covering every row, among the classes just reached, with the class it belongs to
+            widest = np.full(grid.rows, -1, dtype=np.int64)
+            np.maximum.at(widest, classes.rows[new], classes.columns[new] * count + new)
+            widest = np.maximum.accumulate(widest[::-1])[::-1]
+            columns = np.where(widest >= 0, widest // count, -1)
+
+            growing = np.flatnonzero(columns > last)
+            if not len(growing):
+                break
+            added = columns[growing] - last[growing]
+            starts = np.concatenate(([0], np.cumsum(added)[:-1]))
+            cells = (np.repeat(growing * grid.columns + last[growing] + 1, added)
+                     + np.arange(added.sum()) - np.repeat(starts, added))
+            reached_from[cells] = np.repeat(widest[growing] % count, added)
+            last[growing] = columns[growing]
+
+            through = (reached_from[flow_cells] >= 0) & (reached_through[flow_classes] < 0)
+            new, first = np.unique(flow_classes[through], return_index=True)
+            reached_through[new] = flow_cells[through][first]
+        return last, reached_from, reached_through
+
+    def augment(self, cls: int, energy: float) -> float:
+        """
+        Moves energy to a class along the augmenting path ending at the cheapest free cell it reaches, as long as the
+        class values it more than the cell costs
+
+        Returns: The energy moved, 0 when no free cell is worth it
+        """
+        grid = self.grid
+        last, reached_from, reached_through = self.reach(cls)
+        candidates = np.flatnonzero(self.cheapest <= last)
+        if not len(candidates):
+            return 0.0
+        row = candidates[np.argmin(self.cheapest[candidates])]
+        column = self.cheapest[row]
+        if self.classes.values[cls] - grid.costs[column] <= 0:
+            return 0.0
+
+        # Walks back from the free cell: every class on the path takes energy from the cell before it and gives
+        # up as much of the cell it was reached through
+        cell = end = row * grid.columns + column
+        steps = []
+        moved = min(energy, self.spare[end])
+        while True:
+            current = reached_from[cell]
+            given_up = reached_through[current] if current != cls else -1
+            if given_up >= 0:
+                moved = min(moved, self.flow_energy[self._flows[(current, given_up)]])
+            steps.append((current, cell, given_up))
+            if given_up < 0:
+                break
+            cell = given_up
+
+        for current, taken, given_up in steps:
+            index = self._flow(current, taken)
+            self.flow_energy[index] += moved
+            if given_up >= 0:
+                self.flow_energy[self._flows[(current, given_up)]] -= moved
+        self.spare[end] -= moved
+        if self.spare[end] <= _TOLERANCE:
+            free = np.flatnonzero(self.spare[row * grid.columns:(row + 1) * grid.columns] > _TOLERANCE)
+            self.cheapest[row] = free[0] if len(free) else grid.columns
+        return moved
+
+    def solve(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Serves every class, most valuable first
+
+        Returns: The class, the cell and the energy of every flow
+        """
+        for cls in np.argsort(-self.classes.values, kind="stable").tolist():
+            left = self.classes.quantities[cls]
+            while left > _TOLERANCE and (moved := self.augment(cls, left)) > 0:
+                left -= moved
+
+        flowing = np.flatnonzero(self.flow_energy[:self.flow_count] > _TOLERANCE)
+        return self.flow_classes[flowing], self.flow_cells[flowing], self.flow_energy[flowing]
+
+
+def _best_first(groups: np.ndarray, limits: np.ndarray, quantities: np.ndarray, totals: np.ndarray
+                ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Hands the total of every group to its members, highest limit first
+
+    Returns: The members sorted by group then limit, and the fill of every member in that order
+    """
+    order = np.lexsort((-limits, groups))
+    groups, quantities = groups[order], quantities[order]
+    cumulative = np.cumsum(quantities)
+    firsts = np.searchsorted(groups, groups, side="left")
+    before = cumulative - quantities - (cumulative[firsts] - quantities[firsts])
+    return order, np.clip(totals[groups] - before, 0, quantities)
+
+
+def pair_within(first_groups: np.ndarray, first: np.ndarray, second_groups: np.ndarray, second: np.ndarray,
+                groups: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Splits two lists of amounts sorted by group into pieces that never cross a group, by laying both lists end to end
+    group by group
+
+    Returns: The index into first, the index into second and the amount of every piece
+    """
+    totals = np.minimum(np.bincount(first_groups, first, groups), np.bincount(second_groups, second, groups))
+    offsets = np.concatenate(([0.0], np.cumsum(totals)))
+
+    def ends(group_of: np.ndarray, amounts: np.ndarray) -> np.ndarray:
+        cumulative = np.cumsum(amounts)
+        firsts = np.searchsorted(group_of, group_of, side="left")
+        local = cumulative - (cumulative[firsts] - amounts[firsts])
+        return offsets[group_of] + np.minimum(local, totals[group_of])
+
+    first_ends, second_ends = ends(first_groups, first), ends(second_groups, second)
+    bounds = np.unique(np.concatenate((offsets, first_ends, second_ends)))
+    amounts = np.diff(bounds)
+    middles = bounds[:-1] + amounts / 2
+    keep = amounts > _TOLERANCE
+    return np.searchsorted(first_ends, middles[keep]), np.searchsorted(second_ends, middles[keep]), amounts[keep]
+
+
+def allocate(bid_limits: np.ndarray, buying_prices: np.ndarray, bid_quantities: np.ndarray, ask_limits: np.ndarray,
+             selling_prices: np.ndarray, ask_quantities: np.ndarray, band: float = None) -> Union[Allocation, None]:
+    """
+    Finds the trades with the most surplus between the given bids and asks
+
+    Parameters:
+    bid_limits: highest price per unit of every bid
+    buying_prices: buying price of every bid, sellers only accept buyers offering at least their limit
+    bid_quantities: energy wanted by every bid
+    ask_limits: lowest price per unit of every ask
+    selling_prices: selling price of every ask, the price per unit paid to it
+    ask_quantities: energy offered by every ask
+    band: width of the bands of prices, defaults to CONSTANTS.WELFARE_PRICE_BAND. Pairs of agents less than a band
+    away from being unable to trade may be left out, and the surplus of a unit is known to within a band on either
+    side, so that when no pair is left out the allocation falls short of the most surplus by less than two bands per
+    unit traded.
+
+    Returns: None if no bid can trade with any ask, the Allocation otherwise
+    """
+    band = CONSTANTS.WELFARE_PRICE_BAND if band is None else band
+    bids = np.flatnonzero(bid_quantities > _TOLERANCE)
+    asks = np.flatnonzero(ask_quantities > _TOLERANCE)
+    if not len(bids) or not len(asks):
+        return None
+
+    grid = seller_grid(selling_prices[asks], ask_limits[asks], ask_quantities[asks], band)
+    classes = buyer_classes(grid, bid_limits[bids], buying_prices[bids], bid_quantities[bids], band)
+    flow_classes, flow_cells, flow_energy = _Transport(grid, classes).solve()
+    if not len(flow_energy):
+        return None
+
+    # The energy of every class goes to its bids highest limit first and the energy of every cell to its asks lowest
+    # limit first, then bids are paired with cells class by class and with asks cell by cell
+    grouped = classes.classes >= 0
+    members = np.flatnonzero(grouped)
+    bought = np.bincount(flow_classes, flow_energy, len(classes.values))
+    bid_order, bid_filled = _best_first(classes.classes[members], bid_limits[bids][members],
+                                        bid_quantities[bids][members], bought)
+    by_class = np.argsort(flow_classes, kind="stable")
+    bid_pieces, flows, bid_energy = pair_within(classes.classes[members][bid_order], bid_filled,
+                                                flow_classes[by_class], flow_energy[by_class], len(classes.values))
+    piece_bids, piece_cells = members[bid_order][bid_pieces], flow_cells[by_class][flows]
+
+    sold = np.bincount(flow_cells, flow_energy, len(grid.capacities))
+    ask_order, ask_filled = _best_first(grid.cells, -ask_limits[asks], ask_quantities[asks], sold)
+    by_cell = np.argsort(piece_cells, kind="stable")
+    first, second, energy = pair_within(piece_cells[by_cell], bid_energy[by_cell], grid.cells[ask_order], ask_filled,
+                                        len(grid.capacities))
+    trade_bids = bids[piece_bids[by_cell][first]]
+    trade_asks = asks[ask_order[second]]
+
+    bid_fills = np.bincount(trade_bids, energy, len(bid_limits))
+    ask_fills = np.bincount(trade_asks, energy, len(ask_limits))
+    surplus = (energy * (bid_limits[trade_bids] - ask_limits[trade_asks])).sum().item()
+    return Allocation(trade_bids, trade_asks, energy, bid_fills, ask_fills, surplus)
+
+
+class WelfareAllocation(RoundOrders):
+    """
+    Class collecting the bids and asks of one market round and allocating them for the most surplus.
+
+    Orders are gathered like in CallAuction, but every trade is paid at the selling price of its seller instead of at
+    a single clearing price.
+
+    Parameters:
+    band: width of the bands of prices, defaults to CONSTANTS.WELFARE_PRICE_BAND
+    """
+
+    def __init__(self, band: float = None) -> None:
+        super().__init__()
+        self.band = band
+        self.allocation: Union[Allocation, None] = None
+
+    @staticmethod
+    def _own_prices(orders: list, prices: str) -> np.ndarray:
+        """Returns: The buying or selling price of every order of one side, by the name of the column"""
+        if not orders:
+            return np.zeros(0)
+        return np.concatenate([getattr(population, prices)[rows] for population, rows, _, _ in orders])
+
+    def _fills(self, side: int) -> np.ndarray:
+        if self.allocation is None:
+            return np.zeros(self.bids if side == 0 else self.asks)
+        return self.allocation.bid_fills if side == 0 else self.allocation.ask_fills
+
+    def allocate(self) -> list[Trade]:
+        """
+        Allocates the orders for the most surplus
+
+        Returns: The bilateral trades of the allocation, empty when no bid can trade with any ask
+        """
+        _, _, bid_limits, bid_quantities = self._side(self._bids)
+        _, _, ask_limits, ask_quantities = self._side(self._asks)
+        selling_prices = self._own_prices(self._asks, "selling_price")
+        self.allocation = allocate(bid_limits, self._own_prices(self._bids, "buying_price"), bid_quantities,
+                                   ask_limits, selling_prices, ask_quantities, self.band)
+        if self.allocation is None:
+            self._prices = np.zeros(0)
+            return []
+
+        self._prices = selling_prices[self.allocation.asks]
+        return self._trades(self.allocation.bids, self.allocation.asks, self.allocation.energy)
+
+    def settle(self) -> None:
+        """Moves the energy and the money of the last allocation between the rows that traded"""
+        if self.allocation is None:
+            return
+        payments = self.allocation.energy * self._prices
+        for orders, trade_orders, settle in (
+                (self._bids, self.allocation.bids, AgentPopulation.settle_purchases),
+                (self._asks, self.allocation.asks, AgentPopulation.settle_sales)):
+            sizes = [len(rows) for _, rows, _, _ in orders]
+            energy = np.bincount(trade_orders, self.allocation.energy, sum(sizes))
+            money = np.bincount(trade_orders, payments, sum(sizes))
+            start = 0
+            for (population, rows, _, _), size in zip(orders, sizes):
+                filled, paid = energy[start:start + size], money[start:start + size]
+                start += size
+                traded = filled > 0
+                if traded.any():
+                    settle(population, rows[traded], filled[traded], paid[traded])
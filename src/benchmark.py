@@ -0,0 +1,216 @@
+"""
+This file contains a benchmark of the market modes over synthetic populations of different sizes.
+
+Every case (market mode, population size) runs in a fresh process so that peak memory and the class level agent
+registries of one case don't leak into the next one. The ledger is replaced by a NullLedgerSink so only the market
+engine is measured. Results are written as json so that runs can be compared with --compare.
+
+Usage:
+    python benchmark.py --sizes 100 1000 10000 --modes order_book real_world --rounds 10 --output bench.json
+    python benchmark.py --compare old.json new.json
+"""
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import CONSTANTS
+from Instrumentation import MarketInstrumentation
+from LedgerSink import NullLedgerSink
+from Market import Market
+from PopulationGenerator import PopulationGenerator, PopulationSpec
+from RandomStreams import RandomStreams
+from Simulation import Simulation
+from Profiles import ProfileStream, create_synthetic_profiles
+from Topology import Topology
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_SIZES = (100, 1_000, 10_000, 100_000, 1_000_000)
+QUADRATIC_MODES = ("ideal_fair", "real_world")
+FEEDER_SIZE = 500           # agents per feeder in the feeder mode
+FEEDER_CAPACITY = 100.0     # line capacity of every feeder in the feeder mode
+
+
+def create_population(size: int, seed: int, mix: tuple[float, float, float] = (0.2, 0.2, 0.6)) -> tuple[list, list]:
+    """
+    Creates a synthetic population of buyers, sellers and prosumers
+
+    Parameters:
+    size: total number of agents
+    seed: seed of every random draw, including the ones the market makes with the random generator of the simulation
+    mix: fractions of buyers, sellers and prosumers
+
+    Returns: The buyers and the sellers, prosumers being part of the sellers
+    """
+    Simulation.current().random.seed(seed)
+    RandomStreams.seed(seed)
+    generator = PopulationGenerator(PopulationSpec(mix=mix), np.random.default_rng(seed))
+    return generator.create_agents(size)
+
+
+def _peak_rss_mb() -> float:
+    if resource is None:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(mode: str, size: int, rounds: int, seed: int) -> dict:
+    """
+    Runs one market mode over one synthetic population, meant to be called in a fresh process
+
+    Returns: The measurements of the case
+    """
+    start = time.perf_counter()
+    buyers, sellers = create_population(size, seed)
+    setup_seconds = time.perf_counter() - start
+    setup_rss_mb = _peak_rss_mb()
+
+    sink = NullLedgerSink(os.devnull, CONSTANTS.LEDGER_HEADERS)
+    instrumentation = MarketInstrumentation()
+    market = Market(CONSTANTS.MAX_ENERGY_PRICE, CONSTANTS.MIN_ENERGY_PRICE, sink, instrumentation)
+    market.max_rounds = rounds + 1
+
+    with tempfile.TemporaryDirectory() as profiles_path:
+        if mode == "time_series":
+            agents = buyers + sellers
+            population = agents[0]._pool
+            rows = np.array([agent._index for agent in agents])
+            store = create_synthetic_profiles(profiles_path, population.load[rows], population.energy_generation[rows],
+                                              rounds, np.random.default_rng(seed))
+            market.profiles = ProfileStream(store, agents)
+
+        if mode == "feeder":
+            market.topology = Topology(np.full(max(size // FEEDER_SIZE, 1), FEEDER_CAPACITY))
+            market.topology.assign_randomly(buyers + sellers, np.random.default_rng(seed))
+
+        start = time.perf_counter()
+        market.run(buyers, sellers, mode)
+        wall_seconds = time.perf_counter() - start
+        market.profiles = market.topology = None
+    totals = instrumentation.totals()
+
+    return {
+        "mode": mode,
+        "size": size,
+        "rounds": rounds,
+        "seed": seed,
+        "setup_seconds": setup_seconds,
+        "wall_seconds": wall_seconds,
+        "trades": sink.rows_written,
+        "trades_per_second": sink.rows_written / wall_seconds if wall_seconds > 0 else float("nan"),
+        "match_attempts": totals["match_attempts"],
+        "rejected_by_price": totals["rejected_by_price"],
+        "rejected_by_quantity": totals["rejected_by_quantity"],
+        "matching_seconds": totals["matching_seconds"],
+        "settling_seconds": totals["settling_seconds"],
+        "bookkeeping_seconds": totals["bookkeeping_seconds"],
+        "setup_rss_mb": setup_rss_mb,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_benchmark(sizes: tuple[int, ...] = DEFAULT_SIZES, modes: tuple[str, ...] = None, rounds: int = 10,
+                  seed: int = 0, max_quadratic: int = 10_000) -> dict:
+    """
+    Runs every market mode over every population size, each case in a fresh process
+
+    Parameters:
+    sizes: population sizes
+    modes: market modes, defaults to all of Market.MARKET_MODES
+    rounds: number of market rounds of every case
+    seed: seed of the synthetic populations and of the market
+    max_quadratic: largest population the modes that check every pair of agents are run on
+
+    Returns: The metadata of the run and the measurements of every case
+    """
+    modes = tuple(Market.MARKET_MODES) if modes is None else modes
+    results = []
+    spawn = multiprocessing.get_context("spawn")
+    for size in sizes:
+        for mode in modes:
+            if mode in QUADRATIC_MODES and size > max_quadratic:
+                results.append({"mode": mode, "size": size, "rounds": rounds, "seed": seed, "skipped": True})
+                continue
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                result = pool.submit(run_case, mode, size, rounds, seed).result()
+            print(f"{mode:>12} {size:>9} agents  {result['wall_seconds']:9.3f}s  "
+                  f"{result['trades_per_second']:12.1f} trades/s  {result['peak_rss_mb']:8.1f} MB", file=sys.stderr)
+            results.append(result)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict, threshold: float = 0.1) -> list[str]:
+    """
+    Compares two benchmark results case by case
+
+    Parameters:
+    old: results of the reference run
+    new: results of the run to check
+    threshold: relative slowdown of the wall time above which a case counts as a regression
+
+    Returns: The description of every regression found
+    """
+    def cases(results: dict) -> dict:
+        return {(r["mode"], r["size"], r["rounds"]): r for r in results["results"] if not r.get("skipped")}
+
+    old_cases, new_cases = cases(old), cases(new)
+    regressions = []
+    for key in sorted(old_cases.keys() & new_cases.keys()):
+        ratio = new_cases[key]["wall_seconds"] / old_cases[key]["wall_seconds"]
+        line = f"{key[0]:>12} {key[1]:>9} agents {key[2]:>4} rounds  x{ratio:6.2f}"
+        if new_cases[key]["trades"] != old_cases[key]["trades"]:
+            line += f"  trades {old_cases[key]['trades']} -> {new_cases[key]['trades']}"
+        print(line)
+        if ratio > 1 + threshold:
+            regressions.append(line)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks the market modes over synthetic populations")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--modes", nargs="+", choices=tuple(Market.MARKET_MODES))
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-quadratic", type=int, default=10_000)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            regressions = compare(json.load(old), json.load(new), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    results = run_benchmark(tuple(args.sizes), args.modes, args.rounds, args.seed, args.max_quadratic)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
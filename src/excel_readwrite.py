@@ -1,16 +1,28 @@
 import sys
-sys.path.append("/Users/utkarsh/Desktop/Utkarsh/Languages/Python/Modules/ExcelReader")
-print('\n', sys.path, '\n')
-
-from ExcelFileReader import ExcelFileReader
-from myFunctions import execute_this
-from typing import Union
-
-writes = 0
-
-def read_data_from_excel(name: str) -> dict[str, list]:
-    with ExcelFileReader(f"{name}") as excel_reader:
-        excel_reader.change_active_worksheet("Sheet3")
+from typing import Iterable, Union
+
+import CONSTANTS
+
+
+def _open_excel(name: str):
+    """
+    Opens an excel file with ExcelFileReader, imported on first use so that modules only reading cached data don't
+    need it. It is looked up in CONSTANTS.EXCEL_READER_PATH when that is set and it isn't importable already.
+    """
+    try:
+        from ExcelFileReader import ExcelFileReader as reader
+    except ImportError:
+        if not CONSTANTS.EXCEL_READER_PATH:
+            raise
+        if CONSTANTS.EXCEL_READER_PATH not in sys.path:
+            sys.path.append(CONSTANTS.EXCEL_READER_PATH)
+        from ExcelFileReader import ExcelFileReader as reader
+    return reader(name)
+
+
+def read_data_from_excel(name: str, sheet: str = None) -> dict[str, list]:
+    with _open_excel(f"{name}") as excel_reader:
+        excel_reader.change_active_worksheet(CONSTANTS.DATA_SHEET if sheet is None else sheet)
         col_headers = excel_reader.column_headers()
         all_data = dict.fromkeys(col_headers.keys())
         for col_header in all_data:
@@ -22,25 +34,27 @@ def read_data_from_excel(name: str) -> dict[str, list]:
     return all_data
 
 
-def write_data_to_excel(name: str, data: Union[dict[str, list], list, tuple]) -> None:
-    global writes
-
-    with ExcelFileReader(f"{name}") as excel_reader:
+def write_data_to_excel(name: str, data: Union[dict[str, list], list, tuple], row: int = 1) -> None:
+    with _open_excel(f"{name}") as excel_reader:
         if isinstance(data, dict):
             col_headers = excel_reader.column_headers()
-            for index, row in enumerate(excel_reader.rows):
+            for index, sheet_row in enumerate(excel_reader.rows):
                 for header in data:
-                    row[col_headers[header]].value = data[header][index]
-        elif isinstance(data, list):
+                    sheet_row[col_headers[header]].value = data[header][index]
+        elif isinstance(data, (list, tuple)):
             for x, cell_value in enumerate(data):
-                excel_reader[x+1, writes + 1] = cell_value
+                excel_reader[x+1, row] = cell_value
         else:
-            raise TypeError("data must be a dict or a list")
+            raise TypeError("data must be a dict, a list or a tuple")
 
-        writes += 1
         excel_reader.save()
 
 
-@execute_this
-def main():
-    pass
+def write_rows_to_excel(name: str, rows: Iterable[Union[list, tuple]]) -> None:
+    """Writes all the rows starting from the first row of the sheet and saves the file once"""
+    with _open_excel(f"{name}") as excel_reader:
+        for y, row in enumerate(rows):
+            for x, cell_value in enumerate(row):
+                excel_reader[x+1, y+1] = cell_value
+
+        excel_reader.save()
@@ -0,0 +1,152 @@
+"""
+This file contains the input layer reading the consumer data the agents are created from.
+
+The data is parsed once from an excel workbook or a csv file into typed NumPy columns, which are cached as .npy files
+next to each other. Later runs, and every worker process of a scenario run, memory-map the cached columns instead of
+parsing the source again. A cache entry is named after the content hash of its source, and an index maps source paths
+to hashes by modification time and size so that an unchanged source isn't even read to be hashed.
+"""
+
+from __future__ import annotations
+from typing import Union
+import csv
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+import CONSTANTS
+from excel_readwrite import read_data_from_excel
+
+EXCEL_EXTENSIONS = (".xlsx", ".xlsm", ".xls")
+_INDEX_FILE = "index.json"
+
+
+def read_data_from_csv(name: str) -> dict[str, list]:
+    """Returns: The columns of a csv file by header, cells that are numbers read as numbers"""
+    with open(name, newline="") as file:
+        reader = csv.reader(file)
+        headers = next(reader)
+        all_data = {header: [] for header in headers}
+        for row in reader:
+            for header, value in zip(headers, row):
+                all_data[header].append(_parse_cell(value))
+    return all_data
+
+
+def _parse_cell(value: str) -> Union[int, float, str, None]:
+    if value == "":
+        return None
+    for parse in (int, float):
+        try:
+            return parse(value)
+        except ValueError:
+            pass
+    return value
+
+
+def read_source(name: str, sheet: str = None) -> dict[str, list]:
+    """Returns: The columns of an excel or csv file by header, chosen by the file extension"""
+    if os.path.splitext(name)[1].lower() in EXCEL_EXTENSIONS:
+        return read_data_from_excel(name, sheet)
+    return read_data_from_csv(name)
+
+
+def to_column(values: list) -> np.ndarray:
+    """
+    Returns: The values as a typed array, int64 if they are all integers, float64 if they are all numbers with empty
+    cells as NaN, and strings otherwise
+    """
+    numbers = [value for value in values if value is not None]
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in numbers):
+        if len(numbers) == len(values) and all(float(value).is_integer() for value in numbers):
+            return np.array(values, dtype=np.int64)
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    return np.array(["" if value is None else str(value) for value in values], dtype=np.str_)
+
+
+def _file_hash(name: str) -> str:
+    digest = hashlib.sha256()
+    with open(name, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_index(cache_dir: str) -> dict:
+    try:
+        with open(os.path.join(cache_dir, _INDEX_FILE)) as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_index(cache_dir: str, index: dict) -> None:
+    descriptor, temporary = tempfile.mkstemp(dir=cache_dir, suffix=".json")
+    with os.fdopen(descriptor, "w") as file:
+        json.dump(index, file, indent=1)
+    os.replace(temporary, os.path.join(cache_dir, _INDEX_FILE))
+
+
+def cache_key(name: str, sheet: str = None, cache_dir: str = None) -> str:
+    """
+    Returns: The name of the cache entry of a source, the hash of its content and of the sheet read from it. The
+    content is only hashed again when the modification time or the size of the source changed.
+    """
+    cache_dir = CONSTANTS.DATA_CACHE_DIR if cache_dir is None else cache_dir
+    sheet = CONSTANTS.DATA_SHEET if sheet is None else sheet
+    path, stat = os.path.abspath(name), os.stat(name)
+    index = _read_index(cache_dir)
+    entry = index.get(path)
+    if entry is None or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+        entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "hash": _file_hash(name)}
+        if os.path.isdir(cache_dir):
+            index[path] = entry
+            _write_index(cache_dir, index)
+    return hashlib.sha256(f"{entry['hash']}:{sheet}".encode()).hexdigest()[:32]
+
+
+def _store(entry_dir: str, columns: dict[str, np.ndarray], source: str) -> None:
+    """Writes the columns to a temporary directory first and renames it, so readers never see half an entry"""
+    temporary = tempfile.mkdtemp(dir=os.path.dirname(entry_dir))
+    for position, column in enumerate(columns.values()):
+        np.save(os.path.join(temporary, f"{position}.npy"), column)
+    with open(os.path.join(temporary, "meta.json"), "w") as file:
+        json.dump({"source": source, "columns": list(columns)}, file, indent=1)
+    try:
+        os.rename(temporary, entry_dir)
+    except OSError:
+        # Another process cached the same source in the meantime
+        for file_name in os.listdir(temporary):
+            os.remove(os.path.join(temporary, file_name))
+        os.rmdir(temporary)
+
+
+def load_data(name: str = None, sheet: str = None, cache_dir: str = None, mmap: bool = True) -> dict[str, np.ndarray]:
+    """
+    Reads the columns of an excel or csv source, from the cache whenever the source was read before
+
+    Parameters:
+    name: the source file, defaults to CONSTANTS.DATA_FILE_PATH
+    sheet: the worksheet of an excel source, defaults to CONSTANTS.DATA_SHEET
+    cache_dir: where parsed sources are cached, defaults to CONSTANTS.DATA_CACHE_DIR
+    mmap: when True the cached columns are memory-mapped read only instead of read in memory
+
+    Returns: The columns of the source by header, as typed arrays
+    """
+    name = CONSTANTS.DATA_FILE_PATH if name is None else name
+    cache_dir = CONSTANTS.DATA_CACHE_DIR if cache_dir is None else cache_dir
+    os.makedirs(cache_dir, exist_ok=True)
+    entry_dir = os.path.join(cache_dir, cache_key(name, sheet, cache_dir))
+
+    if not os.path.isdir(entry_dir):
+        columns = {header: to_column(values) for header, values in read_source(name, sheet).items()}
+        _store(entry_dir, columns, os.path.abspath(name))
+
+    with open(os.path.join(entry_dir, "meta.json")) as file:
+        headers = json.load(file)["columns"]
+    return {
+        header: np.load(os.path.join(entry_dir, f"{position}.npy"), mmap_mode="r" if mmap else None)
+        for position, header in enumerate(headers)}
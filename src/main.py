@@ -1,41 +1,39 @@
-import random
 # from myFunctions import execute_this
+import numpy as np
+from AgentPopulation import AgentPopulation
+from PopulationGenerator import PopulationGenerator, integers
 from Prosumer import Prosumer
 from Buyer import Buyer
 import Market
-from excel_readwrite import read_data_from_excel
+from input_data import load_data
 import CONSTANTS
 
 
+def create_agents(all_data: dict[str, np.ndarray], population: AgentPopulation = None) -> tuple[list[Buyer], list[Prosumer]]:
+    """
+    Creates a prosumer for every consumer in the data and 40 extra buyers, drawing their other attributes randomly
+
+    Returns: The buyers and the prosumers
+    """
+    population = AgentPopulation.default() if population is None else population
+    generator = PopulationGenerator(rng=population.rng)
+    records_found = len(all_data['PV Capacity'])
+    pv_capacity = np.asarray(all_data['PV Capacity'], dtype=np.float64)
+
+    prosumers = generator.add_agents(
+        population, AgentPopulation.PROSUMER, records_found, first_id=1,
+        pv_capacity=pv_capacity, initial_energy=pv_capacity)
+    buyers = generator.add_agents(
+        population, AgentPopulation.BUYER, 40, first_id=records_found+1, initial_energy=integers(5, 10))
+
+    return buyers, prosumers
+
 
 # @execute_this
 def main():
-    all_data = read_data_from_excel(CONSTANTS.DATA_FILE_PATH)
-    prosumers = []
-    buyers = []
-    records_found = len(all_data['PV Capacity'])
-    for x in range(records_found):
-        # if all_data['Energy Generation'][x] >60:
-        #     print(all_data["sr no"][x])
-        prosumers.append(Prosumer(
-            _id=x+1,
-            init_money=random.randint(30, 1_000),
-            energy_generation=all_data['PV Capacity'][x],
-            selling_price=random.randint(2, 10),
-            load=random.randint(1, 3),
-            initial_energy=all_data['PV Capacity'][x],
-            buying_price=random.randint(2, 10),
-            max_capacity=random.randint(50, 100)))
-
-
-    for x in range(records_found, records_found+40):
-        buyers.append(Buyer(
-            _id=x+1,
-            init_money=random.randint(1_000, 2_000),
-            buying_price=random.randint(2, 10),
-            load=random.randint(1, 3),
-            max_capacity=random.randint(50, 100),
-            initial_energy=random.randint(5, 10)))
-
-    market = Market.Market(10, 2)
-    market.real_world_market(buyers=buyers, sellers=prosumers)
+    all_data = load_data(CONSTANTS.DATA_FILE_PATH)
+    buyers, prosumers = create_agents(all_data)
+
+    market = Market.Market(CONSTANTS.MAX_ENERGY_PRICE, CONSTANTS.MIN_ENERGY_PRICE)
+    market.run(buyers=buyers, sellers=prosumers, mode=CONSTANTS.MARKET_MODE)
+    market.close()
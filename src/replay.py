@@ -0,0 +1,156 @@
+"""
+This file contains the recording of market runs to traces and their replay, to check that a market engine still makes
+the trades it made when a trace was recorded and to benchmark it on a fixed workload.
+
+A trace is recorded from a synthetic population. Replaying it rebuilds the population, gives the agents the recorded
+random draws and runs the market again, in the mode of the trace or in another one, then diffs the trades it makes
+against the recorded trades. The exit code is 1 when they differ.
+
+Usage:
+    python replay.py record run.trace.gz --size 1000 --mode order_book --rounds 10 --seed 0
+    python replay.py replay run.trace.gz
+    python replay.py replay run.trace.gz --mode welfare
+"""
+
+from __future__ import annotations
+from typing import Iterator, NamedTuple
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+import CONSTANTS
+from Grid import Grid
+from LedgerSink import LedgerSink, NullLedgerSink, Row
+from Market import Market
+from Simulation import Simulation
+from Trace import ReplayStreams, TraceDiverged, TraceRecorder, read_trace
+from benchmark import create_population
+
+# Modes that run without profiles or a topology, which traces don't hold
+TRACE_MODES = tuple(mode for mode in Market.MARKET_MODES if mode not in ("time_series", "feeder"))
+
+
+class ReplayResult(NamedTuple):
+    equivalent: bool            # the replay made every recorded trade and no other
+    recorded: int               # trades in the trace
+    replayed: int               # trades made by the replay
+    first_difference: int       # position of the first trade that differs, -1 when none does
+    first_round: int            # round of that trade, -1 when none does
+    seconds: float              # wall time of the replayed market run
+    error: str                  # why the replay stopped before the end of the run, empty when it didn't
+
+
+class ListSink(LedgerSink):
+    """
+    Ledger sink keeping every entry in memory, so the trades of a replay can be diffed without a ledger file
+    """
+
+    def __init__(self, headers: Row) -> None:
+        super().__init__(os.devnull, headers, flush_rows=65_536, flush_seconds=float("inf"), background=False)
+
+    def _open(self) -> None:
+        self.entries: list[Row] = []
+
+    def _write_rows(self, rows: list[Row]) -> None:
+        self.entries.extend(rows)
+
+    def _close(self) -> None:
+        pass
+
+    def rows(self) -> Iterator[list]:
+        return iter(self.entries)
+
+
+def record(path: str, size: int, mode: str = None, rounds: int = 10, seed: int = 0) -> None:
+    """
+    Runs the market over a synthetic population and records the run to a trace
+
+    Parameters:
+    path: file the trace is written to
+    size: total number of agents
+    mode: market mode to run, defaults to CONSTANTS.MARKET_MODE
+    rounds: number of market rounds
+    seed: seed of the population and of every random draw of the run
+    """
+    with Simulation(seed=seed):
+        buyers, sellers = create_population(size, seed)
+        sink = NullLedgerSink(os.devnull, CONSTANTS.LEDGER_HEADERS)
+        market = Market(CONSTANTS.MAX_ENERGY_PRICE, CONSTANTS.MIN_ENERGY_PRICE, sink, trace=TraceRecorder(path))
+        market.max_rounds = rounds + 1
+        market.run(buyers, sellers, mode)
+        sink.close()
+
+
+def replay(path: str, mode: str = None, rtol: float = 1e-9) -> ReplayResult:
+    """
+    Replays a trace and diffs the trades of the replay against the recorded ones
+
+    Parameters:
+    path: trace to replay
+    mode: market mode to replay the trace in, defaults to the mode it was recorded in
+    rtol: relative tolerance of the comparison of energies, money, prices and charges
+    """
+    trace = read_trace(path)
+    with Simulation(trace.max_price, trace.min_price):
+        Grid()(trace.grid_drain)
+        buyers, sellers = trace.agents()
+        Simulation.current().streams = ReplayStreams(*trace.draws())
+
+        sink = ListSink(CONSTANTS.LEDGER_HEADERS)
+        market = Market(trace.max_price, trace.min_price, sink)
+        market.max_rounds = trace.max_rounds
+        start = time.perf_counter()
+        error = ""
+        try:
+            market.run(buyers, sellers, trace.mode if mode is None else mode, trace.start_round)
+        except TraceDiverged as exception:
+            error = str(exception)
+        seconds = time.perf_counter() - start
+        sink.close()
+
+    recorded = trace.trades()
+    replayed = np.array(sink.entries, dtype=np.float64).reshape(-1, len(CONSTANTS.LEDGER_HEADERS))
+    common = min(len(recorded), len(replayed))
+    differs = ~np.isclose(recorded[:common], replayed[:common], rtol=rtol, atol=0).all(axis=1)
+    first = np.flatnonzero(differs)[0].item() if differs.any() else -1
+    if first < 0 and len(recorded) != len(replayed):
+        first = common
+    first_round = -1 if first < 0 else int((recorded if first < len(recorded) else replayed)[first, 0])
+    if first < 0 and error:
+        first, first_round = common, -1
+    return ReplayResult(first < 0, len(recorded), len(replayed), first, first_round, seconds, error)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Records market runs to traces and replays them")
+    commands = parser.add_subparsers(dest="command", required=True)
+    recording = commands.add_parser("record")
+    recording.add_argument("path")
+    recording.add_argument("--size", type=int, default=1_000)
+    recording.add_argument("--mode", choices=TRACE_MODES)
+    recording.add_argument("--rounds", type=int, default=10)
+    recording.add_argument("--seed", type=int, default=0)
+    replaying = commands.add_parser("replay")
+    replaying.add_argument("path")
+    replaying.add_argument("--mode", choices=TRACE_MODES)
+    replaying.add_argument("--rtol", type=float, default=1e-9)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.path, args.size, args.mode, args.rounds, args.seed)
+        return
+
+    result = replay(args.path, args.mode, args.rtol)
+    print(f"{result.replayed} trades replayed in {result.seconds:.3f} s, {result.recorded} recorded")
+    if not result.equivalent:
+        print(f"Trade {result.first_difference} of round {result.first_round} differs")
+    if result.error:
+        print(f"The replay stopped early: {result.error}")
+    sys.exit(0 if result.equivalent else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import CONSTANTS
+from AgentPopulation import AgentPopulation
+from Battery import Battery
+from LedgerSink import NullLedgerSink
+from Market import Market
+from PopulationGenerator import PopulationGenerator, PopulationSpec, constant
+from Simulation import Simulation
+
+RATE = 2.0
+EFFICIENCY = 0.9
+ROUNDS = 2
+
+
+def _population(size: int, charge: float, rate: float = RATE, efficiency: float = EFFICIENCY) -> AgentPopulation:
+    spec = PopulationSpec(charge_rate=constant(rate), discharge_rate=constant(rate),
+                          charge_efficiency=constant(efficiency), discharge_efficiency=constant(efficiency))
+    population = AgentPopulation(allocated=size)
+    PopulationGenerator(spec, np.random.default_rng(0)).add_rows(
+        population, AgentPopulation.BUYER, size, load=constant(5.0), initial_energy=constant(charge))
+    return population
+
+
+def test_deliverable_is_limited_by_the_discharge_rate():
+    population = _population(3, charge=40.0)
+    np.testing.assert_allclose(population.batteries.deliverable(), RATE * EFFICIENCY)
+    population.batteries.discharge(np.arange(3), 1.0)
+    np.testing.assert_allclose(population.batteries.deliverable(), RATE * EFFICIENCY - 1.0)
+
+
+def test_demand_is_limited_by_the_charge_rate():
+    population = _population(3, charge=0.0)
+    np.testing.assert_allclose(population.demand(), RATE / EFFICIENCY)
+    population.batteries.charge(np.arange(3), RATE / EFFICIENCY)
+    np.testing.assert_allclose(population.demand(), 0.0)
+    np.testing.assert_allclose(population.spill, 0.0)
+
+
+def test_buying_the_demand_covers_the_load_despite_losses():
+    population = _population(3, charge=0.0, rate=np.inf)
+    demand = population.demand()
+    np.testing.assert_allclose(demand, 5.0 / EFFICIENCY ** 2)
+    population.batteries.charge(np.arange(3), demand)
+    np.testing.assert_allclose(population.demand(), 0.0, atol=1e-9)
+    np.testing.assert_allclose(population.batteries.deliverable(), population.load)
+
+
+def test_battery_matches_the_fleet():
+    population = _population(4, charge=1.0)
+    population.charged[:2] = 1.5
+    population.discharged[2:] = 1.5
+    for row in range(len(population)):
+        battery = Battery.from_row(population, row)
+        assert battery.deliverable == pytest.approx(population.batteries.deliverable()[row])
+        assert battery.demand(population.load[row]) == pytest.approx(population.demand()[row])
+
+
+@pytest.mark.parametrize("mode", ["order_book", "real_world", "call_auction", "async", "welfare"])
+def test_trades_stay_within_the_battery_rates(mode):
+    with Simulation(10, 2, seed=1):
+        spec = PopulationSpec(charge_rate=constant(RATE), discharge_rate=constant(RATE),
+                              charge_efficiency=constant(EFFICIENCY), discharge_efficiency=constant(EFFICIENCY))
+        generator = PopulationGenerator(spec, np.random.default_rng(1))
+        population = AgentPopulation.default()
+        prosumers = generator.add_agents(population, AgentPopulation.PROSUMER, 2, first_id=1,
+                                         initial_energy=constant(40.0))
+        buyers = generator.add_agents(population, AgentPopulation.BUYER, 2, first_id=3)
+        market = Market(10, 2, NullLedgerSink(os.devnull, CONSTANTS.LEDGER_HEADERS))
+        market.max_rounds = ROUNDS + 1
+        market.run(buyers, prosumers, mode)
+        market._ledger.close(export_excel=False)
+
+        size = len(population)
+        assert (population.energy_sold[:size] <= ROUNDS * RATE * EFFICIENCY + 1e-9).all()
+        assert (population.energy_bought[:size] <= ROUNDS * RATE / EFFICIENCY + 1e-9).all()
+        assert population.charge[:size].min() >= 0
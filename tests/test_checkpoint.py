@@ -0,0 +1,57 @@
+import os
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import CONSTANTS
+from Checkpoint import Checkpointer
+from LedgerSink import SINKS, LedgerSink
+from Market import Market
+from PopulationGenerator import PopulationGenerator
+from Simulation import Simulation
+
+SIZE = 200
+ROUNDS = 8
+RESUME_ROUND = 4
+
+
+def _run(mode: str, kind: str, ledger: str, checkpoints: str) -> tuple[np.ndarray, list]:
+    with Simulation(10, 2, seed=7):
+        buyers, sellers = PopulationGenerator(rng=np.random.default_rng(7)).create_agents(SIZE)
+        sink = LedgerSink.create(kind, ledger, CONSTANTS.LEDGER_HEADERS)
+        market = Market(10, 2, sink, checkpointer=Checkpointer(checkpoints, every=1, full_every=3))
+        market.max_rounds = ROUNDS
+        market.run(buyers, sellers, mode)
+        sink.close()
+        return buyers[0]._pool.money.copy(), [list(row) for row in sink.rows()]
+
+
+def _resume(kind: str, ledger: str, checkpoints: str) -> tuple[np.ndarray, list]:
+    with Simulation(10, 2):
+        checkpoint = Checkpointer(checkpoints).load(RESUME_ROUND)
+        sink = checkpoint.ledger_sink(kind, ledger)
+        market = Market(10, 2, sink)
+        market.max_rounds = ROUNDS
+        market.resume(checkpoint)
+        sink.close()
+        return checkpoint.populations[0].money.copy(), [list(row) for row in sink.rows()]
+
+
+@pytest.mark.parametrize("kind", ["csv", "columnar", "sqlite"])
+@pytest.mark.parametrize("mode", ["order_book", "real_world", "call_auction", "async", "welfare"])
+def test_resuming_gives_the_trajectory_of_the_uninterrupted_run(tmp_path, mode, kind):
+    full, resumed = (str(tmp_path / name) + SINKS[kind].EXTENSION for name in ("full", "resumed"))
+    checkpoints = str(tmp_path / "checkpoints")
+    money, rows = _run(mode, kind, full, checkpoints)
+    # The resumed run writes on from the entries saved before the checkpoint, which a copy of the ledger holds
+    (shutil.copytree if os.path.isdir(full) else shutil.copy)(full, resumed)
+
+    resumed_money, resumed_rows = _resume(kind, resumed, checkpoints)
+
+    assert rows
+    assert resumed_rows == rows
+    np.testing.assert_array_equal(resumed_money, money)
@@ -0,0 +1,81 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import CONSTANTS
+from AgentPopulation import AgentPopulation
+from GridSettlement import GridSettlement
+from LedgerSink import NullLedgerSink
+from Market import Market
+from Metrics import MarketMetrics
+from PopulationGenerator import PopulationGenerator, PopulationSpec, constant
+from Profiles import ProfileStream, create_synthetic_profiles
+from Simulation import Simulation
+
+ROUNDS = 4
+
+
+@pytest.fixture
+def shortfalls(monkeypatch) -> list:
+    """Records the load the batteries couldn't cover every time a population consumes"""
+    recorded = []
+    consume_energy = AgentPopulation.consume_energy
+
+    def recording(population, rows=None):
+        short = consume_energy(population, rows)
+        recorded.append(short.copy())
+        return short
+
+    monkeypatch.setattr(AgentPopulation, "consume_energy", recording)
+    return recorded
+
+
+def _time_series(tmp_path, settlement: GridSettlement = None, metrics: MarketMetrics = None) -> None:
+    with Simulation(10, 2, seed=5):
+        generator = PopulationGenerator(PopulationSpec(mix=(1.0, 0.0, 0.0)), np.random.default_rng(5))
+        buyers, sellers = generator.create_agents(5)
+        population = buyers[0]._pool
+        population.charge[:] = 1.0
+        store = create_synthetic_profiles(str(tmp_path), population.load.copy(), population.energy_generation.copy(),
+                                          ROUNDS, np.random.default_rng(5))
+        market = Market(10, 2, NullLedgerSink(os.devnull, CONSTANTS.LEDGER_HEADERS), grid_settlement=settlement,
+                        metrics=metrics, profiles=ProfileStream(store, buyers + sellers))
+        market.max_rounds = ROUNDS + 1
+        market.run(buyers, sellers, "time_series")
+        market._ledger.close(export_excel=False)
+
+
+def test_time_series_imports_what_the_batteries_fell_short_of(tmp_path, shortfalls):
+    settlement = GridSettlement()
+    _time_series(tmp_path, settlement=settlement)
+
+    assert len(shortfalls) == ROUNDS
+    assert shortfalls[0].sum() > 0
+    np.testing.assert_allclose([grid_round.imported for grid_round in settlement.rounds],
+                               [short.sum() for short in shortfalls])
+
+
+def test_time_series_counts_the_buyers_the_batteries_fell_short_of(tmp_path, shortfalls):
+    rounds = []
+    _time_series(tmp_path, metrics=MarketMetrics(listeners=[rounds.append]))
+
+    assert [metrics.unserved_buyers for metrics in rounds] == [np.count_nonzero(short > 0) for short in shortfalls]
+
+
+@pytest.mark.parametrize("mode", ["ideal_fair", "welfare"])
+def test_modes_that_dont_consume_count_the_buyers_left_without_energy(mode):
+    rounds = []
+    with Simulation(10, 2, seed=5):
+        spec = PopulationSpec(mix=(1.0, 0.0, 0.0), initial_energy=constant(0.0))
+        buyers, sellers = PopulationGenerator(spec, np.random.default_rng(5)).create_agents(5)
+        market = Market(10, 2, NullLedgerSink(os.devnull, CONSTANTS.LEDGER_HEADERS),
+                        metrics=MarketMetrics(listeners=[rounds.append]))
+        market.max_rounds = ROUNDS + 1
+        market.run(buyers, sellers, mode)
+        market._ledger.close(export_excel=False)
+
+    assert rounds and all(metrics.unserved_buyers == len(buyers) for metrics in rounds)
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from CallAuction import CallAuction, clear
+from replay import TRACE_MODES, record, replay
+
+SIZE = 200
+ROUNDS = 4
+
+
+@pytest.mark.parametrize("mode", TRACE_MODES)
+def test_replaying_a_trace_makes_the_recorded_trades(tmp_path, mode):
+    path = str(tmp_path / "run.trace.gz")
+    record(path, SIZE, mode, ROUNDS, seed=2)
+
+    result = replay(path)
+
+    assert result.recorded > 0
+    assert result.equivalent, result
+    assert (result.replayed, result.first_difference, result.first_round, result.error) == (result.recorded, -1, -1, "")
+
+
+def test_replaying_with_a_perturbed_engine_finds_the_first_difference(tmp_path, monkeypatch):
+    path = str(tmp_path / "run.trace.gz")
+    record(path, SIZE, "call_auction", ROUNDS, seed=2)
+
+    def perturbed(auction):
+        clearing = clear(*auction.orders())
+        return auction.apply(None if clearing is None else clearing._replace(price=clearing.price * 1.01))
+
+    monkeypatch.setattr(CallAuction, "clear", perturbed)
+    result = replay(path)
+
+    assert not result.equivalent
+    assert result.first_difference >= 0
+    assert result.first_round >= 1
@@ -0,0 +1,58 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import CONSTANTS
+from Agent import Agent
+from LedgerSink import NullLedgerSink
+from Market import Market
+from PopulationGenerator import PopulationGenerator
+from Screening import Scan
+from Simulation import Simulation
+
+SIZE = 60
+
+
+def _pairwise_scan(agents: list, position: int) -> Scan:
+    """Returns: The Scan of the agent at a position, checking the agents after it one by one like Market.do_they_match"""
+    rejected_by_price = rejected_by_quantity = 0
+    for match in range(position + 1, len(agents)):
+        link_details = Agent.check_match_for_business(agents[position], agents[match])
+        if link_details is None:
+            rejected_by_price += 1
+        elif link_details.energy <= 0:
+            rejected_by_quantity += 1
+        else:
+            return Scan(match, link_details.energy, link_details.price, match - position, rejected_by_price,
+                        rejected_by_quantity)
+    return Scan(-1, 0.0, 0.0, len(agents) - position - 1, rejected_by_price, rejected_by_quantity)
+
+
+@pytest.mark.parametrize("tile_size", [None, 7])
+@pytest.mark.parametrize("mode", ["ideal_fair", "real_world"])
+def test_first_match_agrees_with_the_pairwise_scan(monkeypatch, mode, tile_size):
+    if tile_size is not None:
+        monkeypatch.setattr(CONSTANTS, "SCREENING_TILE_SIZE", tile_size)
+    scans = []
+    first_match = Market.first_match
+
+    def checked(market, screening, position):
+        scans.append((screening.first_match(position), _pairwise_scan(screening.agents, position)))
+        return first_match(market, screening, position)
+
+    monkeypatch.setattr(Market, "first_match", checked)
+    with Simulation(10, 2, seed=3):
+        buyers, sellers = PopulationGenerator(rng=np.random.default_rng(3)).create_agents(SIZE)
+        market = Market(10, 2, NullLedgerSink(os.devnull, CONSTANTS.LEDGER_HEADERS))
+        market.max_rounds = 4
+        market.run(buyers, sellers, mode)
+        market._ledger.close(export_excel=False)
+
+    assert any(scan.match >= 0 for scan, _ in scans)
+    assert any(scan.attempts > (tile_size or 0) for scan, _ in scans)
+    for scan, expected in scans:
+        assert scan == pytest.approx(expected)
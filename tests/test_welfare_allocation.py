@@ -0,0 +1,105 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from WelfareAllocation import _Transport, allocate, buyer_classes, seller_grid
+
+BAND = 0.25
+
+
+def _most_surplus(values: np.ndarray, quantities: np.ndarray, costs: np.ndarray, capacities: np.ndarray,
+                  compatible: np.ndarray) -> tuple[float, float]:
+    """
+    Solves the transport problem exactly by successive longest augmenting paths, found with Bellman-Ford on the
+    residual graph of the buyers, the sellers, a source and a sink
+
+    Returns: The most surplus and the energy traded to reach it
+    """
+    buyers, sellers = compatible.shape
+    source, sink, nodes = buyers + sellers, buyers + sellers + 1, buyers + sellers + 2
+    flows = np.zeros(compatible.shape)
+    while True:
+        edges = []
+        for buyer in range(buyers):
+            if quantities[buyer] - flows[buyer].sum() > 1e-9:
+                edges.append((source, buyer, quantities[buyer] - flows[buyer].sum(), values[buyer]))
+            for seller in np.flatnonzero(compatible[buyer]).tolist():
+                edges.append((buyer, buyers + seller, np.inf, -costs[seller]))
+                if flows[buyer, seller] > 1e-9:
+                    edges.append((buyers + seller, buyer, flows[buyer, seller], costs[seller]))
+        for seller in range(sellers):
+            if capacities[seller] - flows[:, seller].sum() > 1e-9:
+                edges.append((buyers + seller, sink, capacities[seller] - flows[:, seller].sum(), 0.0))
+
+        gains = np.full(nodes, -np.inf)
+        gains[source] = 0.0
+        through = [None] * nodes
+        for _ in range(nodes):
+            relaxed = False
+            for edge in edges:
+                start, end, _, gain = edge
+                if gains[start] + gain > gains[end] + 1e-12:
+                    gains[end], through[end], relaxed = gains[start] + gain, edge, True
+            if not relaxed:
+                break
+        if gains[sink] <= 1e-12:
+            break
+
+        path, node = [], sink
+        while node != source:
+            path.append(through[node])
+            node = through[node][0]
+        moved = min(residual for _, _, residual, _ in path)
+        for start, end, _, _ in path:
+            if start < buyers and end >= buyers and end < source:
+                flows[start, end - buyers] += moved
+            elif start >= buyers and start < source and end < buyers:
+                flows[end, start - buyers] -= moved
+    return (flows * (values[:, None] - costs[None, :])).sum().item(), flows.sum().item()
+
+
+def _orders(seed: int) -> tuple[np.ndarray, ...]:
+    """Returns: A few random bids and asks, no pair of which is less than a band away from being unable to trade"""
+    rng = np.random.default_rng(seed)
+    while True:
+        bids, asks = rng.integers(2, 6, 2)
+        buying_prices = rng.uniform(2, 10, bids)
+        bid_limits = buying_prices * rng.uniform(1.0, 1.5, bids)
+        selling_prices = rng.uniform(2, 10, asks)
+        ask_limits = selling_prices * rng.uniform(0.6, 1.0, asks)
+        if (np.abs(bid_limits[:, None] - selling_prices[None, :]) >= BAND).all() and \
+                (np.abs(buying_prices[:, None] - ask_limits[None, :]) >= BAND).all():
+            return (bid_limits, buying_prices, rng.integers(1, 4, bids).astype(float),
+                    ask_limits, selling_prices, rng.integers(1, 4, asks).astype(float))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_transport_finds_the_most_surplus_between_classes(seed):
+    bid_limits, buying_prices, bid_quantities, ask_limits, selling_prices, ask_quantities = _orders(seed)
+    grid = seller_grid(selling_prices, ask_limits, ask_quantities, BAND)
+    classes = buyer_classes(grid, bid_limits, buying_prices, bid_quantities, BAND)
+    flow_classes, flow_cells, flow_energy = _Transport(grid, classes).solve()
+
+    cells = np.arange(grid.rows * grid.columns)
+    compatible = ((cells[None, :] // grid.columns <= classes.rows[:, None])
+                  & (cells[None, :] % grid.columns <= classes.columns[:, None]))
+    expected, _ = _most_surplus(classes.values, classes.quantities, grid.costs[cells % grid.columns], grid.capacities,
+                                compatible)
+    surplus = (flow_energy * (classes.values[flow_classes] - grid.costs[flow_cells % grid.columns])).sum()
+    assert surplus == pytest.approx(expected, abs=1e-9)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_allocation_is_within_two_bands_per_unit_of_the_most_surplus(seed):
+    bid_limits, buying_prices, bid_quantities, ask_limits, selling_prices, ask_quantities = _orders(seed)
+    allocation = allocate(bid_limits, buying_prices, bid_quantities, ask_limits, selling_prices, ask_quantities, BAND)
+
+    compatible = (bid_limits[:, None] >= selling_prices[None, :]) & (buying_prices[:, None] >= ask_limits[None, :])
+    most, volume = _most_surplus(bid_limits, bid_quantities, ask_limits, ask_quantities, compatible)
+    surplus = 0.0 if allocation is None else allocation.surplus
+    assert surplus <= most + 1e-9
+    assert most - surplus <= 2 * BAND * volume + 1e-9